@@ -0,0 +1,157 @@
+/* Copyright (c) 2017-present, All rights reserved.
+ * Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+ *
+ * This file is part of Dict2vec.
+ *
+ * Dict2vec is free software: you can redistribute it and/or modify
+ * it under the terms of the GNU General Public License as published by
+ * the Free Software Foundation, either version 3 of the License, or
+ * (at your option) any later version.
+ *
+ * Dict2vec is distributed in the hope that it will be useful,
+ * but WITHOUT ANY WARRANTY; without even the implied warranty of
+ * MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ * GNU General Public License at the root of this repository for
+ * more details.
+ *
+ * You should have received a copy of the GNU General Public License
+ * along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+ */
+
+/* bench_hash: measure the speed of the vocabulary hash table of dict2vec.c.
+ * All the words of a corpus are added with add_word(), then each of them is
+ * searched with search_vocab(). The same lookups are done with the previous
+ * table (multiplicative hash modulo HASHSIZE, strcmp on each probed slot) to
+ * compare both on the same machine. Used by benchmark.py, or directly:
+ *
+ *     make bench_hash && ./bench_hash corpus [repeat]
+ */
+
+#define DICT2VEC_LIBRARY
+#include "dict2vec.c"
+
+#define HASHSIZE 30000000 /* size of the previous hash table */
+
+int *old_hash;
+
+/* old_find: position of s in old_hash with the previous hash function */
+unsigned int old_find(char *s)
+{
+	unsigned int h;
+	char *c;
+
+	for (h = 0, c = s; *c != '\0'; ++c)
+		h = h * 257 + *c;
+	h %= HASHSIZE;
+
+	while (old_hash[h] != -1 && strcmp(s, vocab[old_hash[h]].word))
+		h = (h + 1) % HASHSIZE;
+	return h;
+}
+
+/* read_tokens: read fn in memory and split it on whitespace. Return the
+ * number of tokens (stored in *tokens), or -1 if fn cannot be read. */
+long read_tokens(char *fn, char ***tokens)
+{
+	FILE *fi;
+	char *text, *c;
+	long size, n, max;
+
+	if ((fi = fopen(fn, "rb")) == NULL)
+		return -1;
+	fseek(fi, 0, SEEK_END);
+	size = ftell(fi);
+	rewind(fi);
+	if ((text = malloc(size + 1)) == NULL ||
+	    (long) fread(text, 1, size, fi) != size)
+	{
+		fclose(fi);
+		return -1;
+	}
+	fclose(fi);
+	text[size] = '\0';
+
+	n = 0;
+	max = 1 << 20;
+	*tokens = malloc(max * sizeof **tokens);
+	for (c = text; *c != '\0';)
+	{
+		while (isspace((unsigned char) *c))
+			*c++ = '\0';
+		if (*c == '\0')
+			break;
+		if (n == max)
+			*tokens = realloc(*tokens, (max *= 2) * sizeof **tokens);
+		(*tokens)[n++] = c;
+		while (*c != '\0' && !isspace((unsigned char) *c))
+			++c;
+		/* dict2vec truncates the words to MAXLEN-1 characters */
+		if (c - (*tokens)[n-1] >= MAXLEN)
+			(*tokens)[n-1][MAXLEN-1] = '\0';
+	}
+	return n;
+}
+
+int main(int argc, char **argv)
+{
+	char **tokens;
+	long i, n, sum, old_sum;
+	int r, repeat;
+	double t, insert, lookup = 0, old_lookup = 0;
+
+	if (argc < 2)
+	{
+		printf("usage: ./bench_hash corpus [repeat]\n");
+		return 1;
+	}
+	repeat = argc > 2 ? atoi(argv[2]) : 3;
+
+	if ((n = read_tokens(argv[1], &tokens)) <= 0)
+		return error(ERR_FILE, "Cannot read %s", argv[1]);
+
+	vocab = calloc(vocab_max_size, sizeof(struct entry));
+	if (vocab == NULL || rebuild_hash() < 0)
+		return ERR_MEMORY;
+
+	t = wall_time();
+	for (i = 0; i < n; ++i)
+		if (add_word(tokens[i]) < 0)
+			return ERR_MEMORY;
+	insert = wall_time() - t;
+
+	if ((old_hash = malloc(HASHSIZE * sizeof(int))) == NULL)
+		return error(ERR_MEMORY, "Cannot allocate the previous table");
+	memset(old_hash, -1, HASHSIZE * sizeof(int));
+	for (i = 0; i < vocab_size; ++i)
+		old_hash[old_find(vocab[i].word)] = i;
+
+	/* keep the best of each, alternating the two tables */
+	sum = old_sum = 0;
+	for (r = 0; r < repeat; ++r)
+	{
+		t = wall_time();
+		for (sum = 0, i = 0; i < n; ++i)
+			sum += search_vocab(tokens[i]);
+		t = wall_time() - t;
+		lookup = (r == 0 || t < lookup) ? t : lookup;
+
+		t = wall_time();
+		for (old_sum = 0, i = 0; i < n; ++i)
+			old_sum += old_hash[old_find(tokens[i])];
+		t = wall_time() - t;
+		old_lookup = (r == 0 || t < old_lookup) ? t : old_lookup;
+	}
+
+	if (sum != old_sum)
+		return error(ERR_INVALID, "The two tables disagree");
+
+	printf("Tokens: %ld\n", n);
+	printf("Vocab size: %ld\n", vocab_size);
+	printf("Slots: %ld\n", hash_size);
+	printf("insert_per_sec: %.0f\n", n / insert);
+	printf("lookups_per_sec: %.0f\n", n / lookup);
+	printf("previous_lookups_per_sec: %.0f\n", n / old_lookup);
+
+	free(old_hash);
+	return 0;
+}
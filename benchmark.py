@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Offline benchmark of Dict2vec, to compare the speed of two commits on the
+same machine. It generates a synthetic corpus (words drawn from a Zipf
+distribution, including the words of the evaluation datasets), strong and
+weak pairs and definitions, then times each stage separately:
+  - dict2vec: reading the vocabulary (also in words read/sec), loading the
+    pairs, building the negative table, training (words/sec for each number
+    of threads) and saving the vectors (read from the -metrics-file of
+    dict2vec)
+  - bench_hash: insertions and lookups/sec in the vocabulary hash table,
+    next to the lookups/sec of the previous table (skipped if bench_hash has
+    not been built)
+  - evaluate.py: loading the vectors and computing the scores
+  - generate_pairs.py: for each value of K
+The results are written in a JSON report. Run `make all bench_hash` first,
+then:
+
+    ./benchmark.py -o before.json
+    (change the code, make)
+    ./benchmark.py -o after.json --compare before.json
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+import subprocess
+import numpy as np
+import evaluate
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT, "dict-dl"))
+import generate_pairs
+
+
+def make_vocabulary(size, rng):
+    """Return <size> words: the words of the evaluation datasets (so the
+    trained vectors can be evaluated) and random words, in random order (the
+    order is the frequency rank)"""
+    words = set()
+    for filename in os.listdir(evaluate.FILE_DIR):
+        with open(os.path.join(evaluate.FILE_DIR, filename)) as f:
+            for line in f:
+                words.update(w.lower() for w in line.split()[:2])
+    words = sorted(words)[:size]
+
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    known = set(words)
+    while len(words) < size:
+        word = "".join(rng.choice(letters, rng.integers(3, 11)))
+        if word not in known:
+            known.add(word)
+            words.append(word)
+
+    words = np.array(words, dtype=object)
+    rng.shuffle(words)
+    return words
+
+
+def zipf_probabilities(size, exponent):
+    """Probability of the word of each rank with a Zipf distribution"""
+    p = 1.0 / np.arange(1, size + 1) ** exponent
+    return p / p.sum()
+
+
+def make_corpus(filename, words, nb_tokens, exponent, rng, chunk=1000000):
+    """Write <nb_tokens> words drawn from a Zipf distribution in filename.
+    The last word is the most frequent one, so it is always kept in the
+    vocabulary of dict2vec."""
+    p = zipf_probabilities(len(words), exponent)
+    with open(filename, "w") as f:
+        for start in range(0, nb_tokens - 1, chunk):
+            n = min(chunk, nb_tokens - 1 - start)
+            f.write(" ".join(words[rng.choice(len(words), n, p=p)]) + " ")
+        f.write(words[0] + "\n")
+
+
+def make_pairs(filename, words, nb_pairs, exponent, rng):
+    """Write <nb_pairs> pairs of different words (one pair per line), whose
+    words are drawn from a Zipf distribution"""
+    p = zipf_probabilities(len(words), exponent)
+    pairs = rng.choice(len(words), (nb_pairs, 2), p=p)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    with open(filename, "w") as f:
+        for w1, w2 in words[pairs]:
+            f.write("{} {}\n".format(w1, w2))
+
+
+def make_definitions(filename, words, nb_definitions, exponent, rng):
+    """Write the definitions of the <nb_definitions> most frequent words, in
+    the format of all-definitions-cleaned.txt (5 to 40 words drawn from a
+    Zipf distribution)"""
+    p = zipf_probabilities(len(words), exponent)
+    with open(filename, "w") as f:
+        for word in words[:nb_definitions]:
+            definition = words[rng.choice(len(words), rng.integers(5, 41),
+                                          p=p)]
+            f.write("{} {}\n".format(word, " ".join(definition)))
+
+
+def run_dict2vec(binary, corpus, output, strong_fn, weak_fn, threads, size,
+                 epoch):
+    """Train dict2vec and return the duration of its phases (from its
+    metrics file), the number of words trained per second and the number of
+    words of the corpus read per second by read_vocab (tokenizer, hash table
+    and sort of the vocabulary)"""
+    metrics_fn = output + "-metrics.jsonl"
+    cmd = [binary, "-input", corpus, "-output", output,
+           "-strong-file", strong_fn, "-weak-file", weak_fn,
+           "-size", str(size), "-threads", str(threads), "-epoch", str(epoch),
+           "-strong-draws", "4", "-weak-draws", "5",
+           "-metrics-file", metrics_fn]
+    out = subprocess.run(cmd, stdout=subprocess.PIPE, check=True,
+                         universal_newlines=True).stdout
+    train_words = int(out.split("Words in train file:")[1].split()[0])
+    # versions before the "Read N words" line only give the words kept
+    read_words = re.search(r"Read (\d+) words", out)
+    read_words = int(read_words.group(1)) if read_words else train_words
+
+    phases = {}
+    with open(metrics_fn) as f:
+        for line in f:
+            event = json.loads(line)
+            if event["event"] == "phase":
+                name = event["phase"]
+                phases[name] = phases.get(name, 0.0) + event["seconds"]
+    phases["words_per_sec"] = train_words * epoch / phases["epoch"]
+    phases["read_words_per_sec"] = read_words / phases["read_vocab"]
+    return phases
+
+
+def run_bench_hash(binary, corpus, repeat):
+    """Return the results of bench_hash on corpus ({name: value}): words
+    inserted per second and lookups per second with the hash table of
+    dict2vec.c and with the previous one"""
+    out = subprocess.run([binary, corpus, str(repeat)], stdout=subprocess.PIPE,
+                         check=True, universal_newlines=True).stdout
+    return {name: float(value) for name, value in
+            re.findall(r"^(\w+_per_sec): (\S+)$", out, re.MULTILINE)}
+
+
+def best_time(function, repeat):
+    """Minimum duration of <repeat> calls of function"""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return min(durations)
+
+
+def machine():
+    """Description of the machine and of the code benchmarked"""
+    try:
+        commit = subprocess.run(["git", "describe", "--always", "--dirty"],
+                                cwd=ROOT, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL,
+                                universal_newlines=True).stdout.strip()
+    except OSError:
+        commit = ""
+    return {"commit": commit,
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpus": os.cpu_count(),
+            "python": platform.python_version(),
+            "numpy": np.__version__}
+
+
+def benchmark(args, directory):
+    """Run all the stages and return the results ({name: value}). Durations
+    are in seconds (the best of --repeat runs), speeds in words/sec."""
+    results = {}
+    rng = np.random.default_rng(args.seed)
+    path = lambda name: os.path.join(directory, name)
+
+    print("-- Generating the synthetic data")
+    start = time.perf_counter()
+    words = make_vocabulary(args.vocab, rng)
+    make_corpus(path("corpus"), words, args.tokens, args.exponent, rng)
+    make_pairs(path("strong-pairs"), words, args.strong, args.exponent, rng)
+    make_pairs(path("weak-pairs"), words, args.weak, args.exponent, rng)
+    make_definitions(path("definitions"), words, args.definitions,
+                     args.exponent, rng)
+    results["generate_data"] = time.perf_counter() - start
+
+    print("-- Training with dict2vec")
+    phases = {}
+    for threads in args.threads:
+        for _ in range(args.repeat):
+            run = run_dict2vec(args.dict2vec, path("corpus"), path("vectors"),
+                               path("strong-pairs"), path("weak-pairs"),
+                               threads, args.size, args.epoch)
+            key = "train_words_per_sec_t{}".format(threads)
+            results[key] = max(results.get(key, 0), run["words_per_sec"])
+            results["read_vocab_words_per_sec"] = max(
+                results.get("read_vocab_words_per_sec", 0),
+                run["read_words_per_sec"])
+            for name in ["read_vocab", "read_pairs", "negative_table", "save"]:
+                phases.setdefault(name, []).append(run[name])
+        print("   {} threads: {:.0f} words/sec".format(threads, results[key]))
+    for name, durations in phases.items():
+        results[name if name != "save" else "save_vectors"] = min(durations)
+    print("   read_vocab: {:.0f} words read/sec".format(
+          results["read_vocab_words_per_sec"]))
+
+    print("-- Vocabulary hash table")
+    if os.path.isfile(args.bench_hash):
+        for name, value in run_bench_hash(args.bench_hash, path("corpus"),
+                                          max(args.repeat, 3)).items():
+            results["hash_" + name] = value
+        print("   {:.0f} lookups/sec (previous table: {:.0f})".format(
+              results["hash_lookups_per_sec"],
+              results["hash_previous_lookups_per_sec"]))
+    else:
+        print("   skipped, {} not found (make bench_hash)".format(
+              args.bench_hash))
+
+    print("-- Evaluating the vectors")
+    loaded = []
+    results["evaluate_load"] = best_time(lambda: loaded.append(
+        evaluate.load_embedding(path("vectors.vec"))), args.repeat)
+    mat, wordToNum = loaded[-1]
+    evaluate.init_results()
+    results["evaluate_score"] = best_time(lambda: evaluate.evaluate_embedding(
+        mat, wordToNum, record=False), args.repeat)
+
+    # generate_pairs.py reads vectors files without header line
+    with open(path("vectors.vec")) as f, open(path("embedding"), "w") as of:
+        f.readline()
+        shutil.copyfileobj(f, of)
+
+    print("-- Generating pairs")
+    for K in args.K:
+        with open(os.devnull, "w") as devnull, \
+             contextlib.redirect_stdout(devnull):
+            duration = best_time(lambda: generate_pairs.generate_pairs(
+                path("definitions"), path("embedding"), path("strong"),
+                path("weak"), K), args.repeat)
+        results["generate_pairs_K{}".format(K)] = duration
+        print("   K={}: {:.2f}s".format(K, duration))
+
+    return results
+
+
+def compare(results, previous):
+    """Print each result next to the one of a previous report"""
+    print("\n{}| {}| {}| {}".format("Stage".ljust(26), "BEFORE".ljust(10),
+                                    "AFTER".ljust(10), "SPEEDUP"))
+    print("="*60)
+    for name, value in results.items():
+        if name not in previous:
+            continue
+        # higher is better for speeds, lower is better for durations
+        if "per_sec" in name:
+            speedup = value / previous[name]
+        else:
+            speedup = previous[name] / value if value > 0 else float("inf")
+        print("{}| {:<10.4g}| {:<10.4g}| {:.2f}x".format(name.ljust(26),
+              previous[name], value, speedup))
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+             description="Offline benchmark of Dict2vec on synthetic data.",
+             )
+
+    parser.add_argument('-o', '--output', default="benchmark.json",
+                        help="JSON report (default: benchmark.json).")
+    parser.add_argument('-c', '--compare', metavar='FILE', help="""Report of
+                        a previous run (on the same machine) to compare
+                        with.""")
+    parser.add_argument('--dict2vec', default=os.path.join(ROOT, "dict2vec"),
+                        help="dict2vec executable (default: ./dict2vec).")
+    parser.add_argument('--bench-hash',
+                        default=os.path.join(ROOT, "bench_hash"),
+                        help="""bench_hash executable (default:
+                        ./bench_hash).""")
+    parser.add_argument('-n', '--tokens', type=int, default=5000000,
+                        help="Number of words of the corpus (default: 5M).")
+    parser.add_argument('-v', '--vocab', type=int, default=50000,
+                        help="Number of different words (default: 50000).")
+    parser.add_argument('-z', '--exponent', type=float, default=1.0,
+                        help="Exponent of the Zipf distribution (default: 1).")
+    parser.add_argument('--strong', type=int, default=100000,
+                        help="Number of strong pairs (default: 100000).")
+    parser.add_argument('--weak', type=int, default=500000,
+                        help="Number of weak pairs (default: 500000).")
+    parser.add_argument('--definitions', type=int, default=5000,
+                        help="""Number of definitions for generate_pairs.py
+                        (default: 5000).""")
+    parser.add_argument('-t', '--threads', type=int, nargs='+',
+                        default=[1, 2, 4], help="""Numbers of threads to train
+                        with (default: 1 2 4).""")
+    parser.add_argument('-s', '--size', type=int, default=100,
+                        help="Size of the vectors (default: 100).")
+    parser.add_argument('-e', '--epoch', type=int, default=1,
+                        help="Number of epochs (default: 1).")
+    parser.add_argument('-K', type=int, nargs='+', default=[0, 5, 10],
+                        help="""Values of K for generate_pairs.py (default: 0
+                        5 10).""")
+    parser.add_argument('-r', '--repeat', type=int, default=1,
+                        help="""Run each stage this many times and keep the
+                        best (default: 1).""")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed of the synthetic data (default: 0).")
+    parser.add_argument('-d', '--dir', help="""Directory of the generated
+                        files, kept after the run (default: a temporary
+                        directory).""")
+
+    args = parser.parse_args()
+
+    if not os.path.isfile(args.dict2vec):
+        parser.error("{} not found, run make first".format(args.dict2vec))
+
+    # the evaluation files are read relative to the repository
+    evaluate.FILE_DIR = os.path.join(ROOT, evaluate.FILE_DIR)
+
+    if args.dir is not None:
+        os.makedirs(args.dir, exist_ok=True)
+        results = benchmark(args, args.dir)
+    else:
+        with tempfile.TemporaryDirectory() as directory:
+            results = benchmark(args, directory)
+
+    report = {"machine": machine(), "config": vars(args), "results": results}
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print("\n-> Report written in", args.output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)
+        options = [k for k in report["config"] if k not in
+                   ["output", "compare", "dir"] and
+                   report["config"][k] != previous["config"].get(k)]
+        if options:
+            print("\nWARNING: the reports have different options:",
+                  ", ".join(options))
+        compare(results, previous["results"])
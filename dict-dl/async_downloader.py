@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+"""asyncio engine to download definitions.
+
+All the requests are done by a single OS thread. Each dictionary host has a
+pool of HTTP/1.1 keep-alive connections, so the TCP/TLS handshake is only done
+once per connection instead of once per word, and the number of concurrent
+requests sent to each host is bounded.
+"""
+
+from urllib.parse import urlsplit, urljoin, quote
+from downloader import URLS, HEADERS, NOT_FOUND, RETRY, is_transient, \
+                       parse_page, retry_delay
+from ratelimit import backoff
+import asyncio
+import ssl
+
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS  = 5
+
+
+class HostPool:
+    """Pool of keep-alive connections to one (scheme, host, port). At most
+    <size> requests are sent at the same time to this host."""
+    def __init__(self, scheme, host, port, size):
+        self.scheme    = scheme
+        self.host      = host
+        self.port      = port
+        self.semaphore = asyncio.Semaphore(size)
+        self.idle      = [] # (reader, writer) ready to be reused
+
+    async def connect(self):
+        context = ssl.create_default_context() if self.scheme == "https" \
+                  else None
+        return await asyncio.open_connection(self.host, self.port,
+                                             ssl=context)
+
+    async def request(self, path, headers, timeout):
+        """Send a GET request for path. Return (status, headers, body)."""
+        async with self.semaphore:
+            conn = self.idle.pop() if self.idle else None
+            reused = conn is not None
+            if conn is None:
+                conn = await asyncio.wait_for(self.connect(), timeout)
+
+            try:
+                res = await asyncio.wait_for(
+                      self.roundtrip(conn, path, headers), timeout)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                # the server may have closed an idle connection, retry once
+                # with a new one
+                close(conn)
+                if not reused:
+                    raise
+                conn = await asyncio.wait_for(self.connect(), timeout)
+                try:
+                    res = await asyncio.wait_for(
+                          self.roundtrip(conn, path, headers), timeout)
+                except BaseException:
+                    # the new connection is not in self.idle yet
+                    close(conn)
+                    raise
+            except BaseException:
+                close(conn)
+                raise
+
+            status, res_headers, body, keep_alive = res
+            if keep_alive:
+                self.idle.append(conn)
+            else:
+                close(conn)
+            return status, res_headers, body
+
+    async def roundtrip(self, conn, path, headers):
+        reader, writer = conn
+        lines = ["GET {} HTTP/1.1".format(path), "Host: " + self.host,
+                 "Connection: keep-alive", "Accept-Encoding: identity"]
+        lines += ["{}: {}".format(k, v) for k, v in headers.items()
+                  if k.lower() not in ("host", "connection",
+                                       "accept-encoding")]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("connection closed by server")
+        status = int(status_line.split()[1])
+
+        res_headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            res_headers[key.strip().lower()] = value.strip()
+
+        keep_alive = res_headers.get("connection", "").lower() != "close"
+        if res_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    # skip the trailers until the final empty line
+                    while (await reader.readline()) not in (b"\r\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2) # \r\n after each chunk
+            body = b"".join(chunks)
+        elif "content-length" in res_headers:
+            body = await reader.readexactly(int(res_headers["content-length"]))
+        else:
+            # no length given, the body ends when the connection is closed
+            body = await reader.read()
+            keep_alive = False
+
+        return status, res_headers, body, keep_alive
+
+
+def close(conn):
+    conn[1].close()
+
+
+class Fetcher:
+    """HTTP client keeping one HostPool per host"""
+    def __init__(self, concurrency=8, timeout=30):
+        self.concurrency = concurrency
+        self.timeout     = timeout
+        self.pools       = {}
+
+    def pool(self, url):
+        parts = urlsplit(url)
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        key = (parts.scheme, parts.hostname, port)
+        if key not in self.pools:
+            self.pools[key] = HostPool(parts.scheme, parts.hostname, port,
+                                       self.concurrency)
+        return self.pools[key]
+
+    async def get(self, url, headers=None):
+        """Return (status, headers, body) of url, following redirections"""
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            path = parts.path or "/"
+            if parts.query:
+                path += "?" + parts.query
+            status, res_headers, body = await self.pool(url).request(
+                quote(path, safe="/?=&%:+"), headers or {}, self.timeout)
+            if status in REDIRECT_CODES and "location" in res_headers:
+                url = urljoin(url, res_headers["location"])
+                continue
+            return status, res_headers, body
+        return status, res_headers, body
+
+    def close(self):
+        for pool in self.pools.values():
+            for conn in pool.idle:
+                close(conn)
+            pool.idle = []
+
+
+async def fetch_definition(fetcher, dict_name, word, pos="all", urls=URLS,
+                           cache=None):
+    """Download and parse the definitions of word in dict_name. Return a tuple
+    (status, words, retry_after), like downloader.download_word()."""
+    try:
+        status, headers, body = await fetcher.get(urls[dict_name] + word,
+                                                  HEADERS.get(dict_name))
+    except Exception: # timeout, connection reset...
+        return RETRY, [], None
+
+    if is_transient(status):
+        return RETRY, [], retry_delay(status, headers.get("retry-after"))
+    if status != 200:
+        return NOT_FOUND, [], None
+
+    if cache is not None:
+        cache.put(dict_name, word, body)
+    return parse_page(dict_name, body, pos) + (None,)
+
+
+async def download_all(words, pos, callback, concurrency=8, timeout=30,
+                       urls=URLS, limiters=None, max_attempts=5, cache=None):
+    """
+    Download the definitions of words (dict mapping a dictionary name to the
+    list of words to fetch in this dictionary). Each dictionary is served by
+    <concurrency> workers sharing the connection pool of its host, and by the
+    RateLimiter limiters[dict_name] if given. A word whose request failed with
+    a transient error is retried later (at most max_attempts requests).
+    When a word is done, callback(dict_name, word, status, result) is called,
+    where status is DONE, NOT_FOUND or RETRY (the word has been given up).
+    Pages found in the HTMLCache cache are parsed without any request, the
+    downloaded pages are added to it.
+    """
+    # one Fetcher per dictionary, so the <concurrency> connections of a
+    # dictionary are not shared with another one served by the same host
+    fetchers = {dict_name: Fetcher(concurrency, timeout) for dict_name in words}
+    limiters = limiters or {}
+    loop = asyncio.get_running_loop()
+
+    def requeue(queue, item):
+        # put the retried word back before marking the failed attempt as
+        # done, so queue.join() never sees an empty queue in between
+        queue.put_nowait(item)
+        queue.task_done()
+
+    async def fetch(dict_name, queue, limiter, word, attempt):
+        # return True if the word has been scheduled to be retried
+        body = cache.get(dict_name, word) if cache is not None else None
+        if body is not None:
+            callback(dict_name, word, *parse_page(dict_name, body, pos))
+            return False
+
+        if limiter is not None:
+            await asyncio.sleep(limiter.reserve())
+
+        status, res, retry_after = await fetch_definition(
+            fetchers[dict_name], dict_name, word, pos, urls, cache)
+
+        if status == RETRY:
+            if limiter is not None:
+                limiter.failure(retry_after)
+            if attempt + 1 < max_attempts:
+                loop.call_later(backoff(attempt, retry_after), requeue,
+                                queue, (word, attempt + 1))
+                return True
+        elif limiter is not None:
+            limiter.success()
+
+        callback(dict_name, word, status, res)
+        return False
+
+    async def worker(dict_name, queue):
+        limiter = limiters.get(dict_name)
+        while True:
+            word, attempt = await queue.get()
+            requeued = False
+            try:
+                requeued = await fetch(dict_name, queue, limiter, word,
+                                       attempt)
+            except Exception as e:
+                # an unexpected error (parser, cache, callback...) must not
+                # kill the worker: the word is given up, the others are done
+                print("\nERROR: * {} - {}: {!r}".format(dict_name, word, e))
+                try:
+                    callback(dict_name, word, RETRY, [])
+                except Exception as e:
+                    print("\nERROR: * can not record {} - {}: {!r}".format(
+                          dict_name, word, e))
+            finally:
+                # a requeued word is marked as done by requeue(), otherwise
+                # queue.join() must always be able to return
+                if not requeued:
+                    queue.task_done()
+
+    queues, tasks = [], []
+    for dict_name, to_fetch in words.items():
+        queue = asyncio.Queue()
+        for w in to_fetch:
+            queue.put_nowait((w, 0))
+        queues.append(queue)
+        for _ in range(concurrency):
+            tasks.append(asyncio.create_task(worker(dict_name, queue)))
+
+    try:
+        await asyncio.gather(*[q.join() for q in queues])
+    finally:
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for fetcher in fetchers.values():
+            fetcher.close()
+
+
+def run(words, pos, callback, concurrency=8, timeout=30, urls=URLS,
+        limiters=None, max_attempts=5, cache=None):
+    """Blocking wrapper around download_all()"""
+    asyncio.run(download_all(words, pos, callback, concurrency, timeout, urls,
+                             limiters, max_attempts, cache))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Compare the speed of the definition cleaning of cleaner.py with the
+original one (a Python loop over each character of each word), and check
+that both give the same words.
+
+The definitions are read from a file (one definition per line), or generated
+from the words of 1000-words.txt with punctuation, digits, uppercase and
+non-ASCII letters.
+"""
+
+from cleaner import clean_definition, load_stopwords
+import argparse
+import random
+import time
+
+PUNCTUATION = [",", ".", ";", ":", "(", ")", "'s", "-", "\"", "?", "!"]
+NON_ASCII   = ["é", "ü", "ß", "K", "İ", "ﬁ", "²", "½", "—", "\xa0"]
+
+
+def reference_clean(definition, stopwords):
+    """Cleaning of definition_words() before cleaner.py"""
+    words = []
+    for word in definition.split():
+        word = ''.join([c.lower() for c in word
+                        if c.isalpha() and ord(c) < 128])
+        if not word in stopwords:
+            words.append(word)
+    return words
+
+
+def generate(n, vocabulary, seed=0):
+    """Return n random definitions of 5 to 30 words"""
+    rng = random.Random(seed)
+    definitions = []
+    for _ in range(n):
+        words = []
+        for _ in range(rng.randint(5, 30)):
+            w = rng.choice(vocabulary)
+            r = rng.random()
+            if r < 0.1:
+                w = w.capitalize()
+            elif r < 0.15:
+                w = w.upper()
+            elif r < 0.2:
+                w = str(rng.randint(0, 2000))
+            elif r < 0.205:
+                w = w[:2] + rng.choice(NON_ASCII) + w[2:]
+            if rng.random() < 0.15:
+                w += rng.choice(PUNCTUATION)
+            words.append(w)
+        definitions.append(" ".join(words))
+    return definitions
+
+
+def bench(function, definitions, stopwords, repeat):
+    """Return the best time (over <repeat> runs) and the cleaned words"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        res = [function(d, stopwords) for d in definitions]
+        best = min(best, time.perf_counter() - start)
+    return best, res
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the cleaning of "
+                                     "the definitions.")
+    parser.add_argument("-f", "--file", help="""File of definitions, one per
+        line (default: generated definitions).""")
+    parser.add_argument("-n", type=int, default=200000, help="""Number of
+        generated definitions (default: 200000).""")
+    parser.add_argument("-repeat", type=int, default=3, help="""Number of
+        runs, the best one is reported (default: 3).""")
+    args = parser.parse_args()
+
+    stopwords = load_stopwords()
+
+    if args.file:
+        with open(args.file) as f:
+            definitions = [line.rstrip("\n") for line in f]
+    else:
+        with open("1000-words.txt") as f:
+            vocabulary = [line.strip() for line in f if line.strip()]
+        definitions = generate(args.n, vocabulary)
+
+    t_ref, ref = bench(reference_clean, definitions, stopwords, args.repeat)
+    t_new, new = bench(clean_definition, definitions, stopwords, args.repeat)
+
+    n_words = sum(len(d.split()) for d in definitions)
+    for i in range(len(definitions)):
+        if ref[i] != new[i]:
+            print("MISMATCH on definition", i)
+            print("  ", repr(definitions[i]))
+            print("  reference:", ref[i])
+            print("  cleaner:  ", new[i])
+            break
+    else:
+        print("{} definitions, {} words: same output".format(
+              len(definitions), n_words))
+
+    print("{:<10} {:>8} {:>14}".format("", "seconds", "words/sec"))
+    print("{:<10} {:>8.2f} {:>14.0f}".format("reference", t_ref,
+                                             n_words / t_ref))
+    print("{:<10} {:>8.2f} {:>14.0f}".format("cleaner", t_new,
+                                             n_words / t_new))
+    print("speedup: {:.1f}x".format(t_ref / t_new))
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Measure the speed of the parsers of each dictionary.
+
+The pages are read from DIR/<dict_name>/, either a directory filled with
+download_definitions.py -cache (*.html.gz files) or a directory of HTML
+fixtures (*.html files). Without DIR, the pages are rendered from the
+templates of mock_server.py (the markup expected by each parser, padded to
+-page-size bytes). Each parser is run over all the pages of its dictionary
+and the throughput is compared to the network throughput.
+"""
+
+from parsers import PARSERS
+from downloader import parse_page
+import argparse
+import gzip
+import time
+import os
+
+
+def load_pages(directory, dict_name):
+    """Return the raw bytes of all the pages stored for dict_name"""
+    pages = []
+    for root, _, files in os.walk(os.path.join(directory, dict_name)):
+        for fn in sorted(files):
+            path = os.path.join(root, fn)
+            if fn.endswith(".html.gz"):
+                with gzip.open(path, "rb") as f:
+                    pages.append(f.read())
+            elif fn.endswith(".html"):
+                with open(path, "rb") as f:
+                    pages.append(f.read())
+    return pages
+
+
+def generate_pages(dict_name, n, page_size):
+    """Return n pages of dict_name rendered from the mock server templates"""
+    # imported here, mock_server imports load_pages from this module
+    from mock_server import TEMPLATES
+    pad = "<div>" + "x" * max(0, page_size // 2) + "</div>"
+    return [TEMPLATES[dict_name].format(w="word{}".format(i), pad=pad)
+            .encode("utf-8") for i in range(n)]
+
+
+def bench(dict_name, pages, pos, repeat):
+    """Return the best time (over <repeat> runs) to parse all the pages, and
+    the number of pages with at least one definition"""
+    best, found = float("inf"), 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        found = sum(1 for body in pages
+                    if len(parse_page(dict_name, body, pos)[1]) > 0)
+        best = min(best, time.perf_counter() - start)
+    return best, found
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the parsers.")
+    parser.add_argument("directory", metavar="DIR", nargs="?", help="""
+        Directory containing the pages of each dictionary in DIR/Cam,
+        DIR/Dic... (default: pages generated from the mock server
+        templates).""")
+    parser.add_argument("-n", type=int, default=200, help="""Number of pages
+        generated per dictionary without DIR (default: 200).""")
+    parser.add_argument("-page-size", type=int, default=50000, help="""Size
+        in bytes of the generated pages (default: 50000).""")
+    parser.add_argument("-pos", type=str.lower, default="all", help="""POS of
+        the definitions to extract (default: all).""")
+    parser.add_argument("-repeat", type=int, default=3, help="""Number of
+        runs, the best one is reported (default: 3).""")
+    parser.add_argument("-concurrency", type=int, default=8, help="""Number
+        of concurrent requests per dictionary (default: 8).""")
+    parser.add_argument("-latency", type=float, default=0.3, help="""Average
+        time in seconds to download a page (default: 0.3).""")
+    args = parser.parse_args()
+
+    network = args.concurrency / args.latency
+    print("Network: {:.1f} pages/sec per dictionary ({} requests, {:.0f} ms "
+          "per page)\n".format(network, args.concurrency, args.latency * 1000))
+    print("{:<5} {:>7} {:>9} {:>10} {:>8} {:>9} {:>9}".format(
+          "Dict", "Pages", "Found", "Pages/sec", "MB/sec", "ms/page",
+          "x network"))
+    print("=" * 64)
+
+    for dict_name in sorted(PARSERS):
+        if args.directory is None:
+            pages = generate_pages(dict_name, args.n, args.page_size)
+        else:
+            pages = load_pages(args.directory, dict_name)
+        if len(pages) == 0:
+            print("{:<5} {:>7}".format(dict_name, 0))
+            continue
+
+        t, found = bench(dict_name, pages, args.pos, args.repeat)
+        size = sum(len(body) for body in pages)
+        speed = len(pages) / t
+        print("{:<5} {:>7} {:>9} {:>10.0f} {:>8.1f} {:>9.3f} {:>9.0f}".format(
+              dict_name, len(pages), found, speed, size / t / 1e6,
+              t * 1000 / len(pages), speed / network))
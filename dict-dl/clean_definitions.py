@@ -19,9 +19,21 @@
 # You should have received a copy of the GNU General Public License
 # along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import sys
+import zlib
+import shutil
 import argparse
+import tempfile
+from multiprocessing import Pool
 from collections import defaultdict
+from cleaner import clean_definition, keep_words, load_stopwords
+
+# a line of definitions takes about this many times its size in memory once
+# split into a list of str objects (used to choose the number of shards)
+MEMORY_FACTOR = 10
+
+STOPWORDS = load_stopwords()
 
 
 def flatten(l):
@@ -38,35 +50,167 @@ def load_vocabulary(fn):
 
     return vocabulary
 
+def regroup(lines):
+    """Regroup the definitions of the lines (format of the downloaded
+    definitions file) by word. The definitions are cleaned like in
+    downloader.py: cleaning again the definitions downloaded with cleaning
+    does not change them, the ones downloaded without are cleaned here."""
+    regouped_dictionary = defaultdict(list)
+    for line in lines:
+        # first token is the name of the dictionary, then the word
+        ar = line.split(None, 2)
+        word = ar[1]
+        defs = clean_definition(ar[2], STOPWORDS) if len(ar) > 2 else []
+        regouped_dictionary[word].append(defs)
+
+    return regouped_dictionary
+
+def write_definitions(regouped_dictionary, of, vocabulary=None):
+    """Regroup together all definitions of a word. Remove words
+    that are not in vocabulary (if given)."""
+    for w in regouped_dictionary:
+        definition = ' '.join(keep_words(flatten(regouped_dictionary[w]),
+                                         vocabulary))
+        of.write("%s %s\n" % (w, definition))
+
 def clean_defs(definitions, output_file, vocab):
     """Load fetched definitions and regroup words with all their definitions."""
 
-    regouped_dictionary = defaultdict(list)
-
     with open(definitions) as f:
-        for line in f:
-            line = line.strip()
-            ar = line.split()[1:] # first token is the name of the dictionary
-            word, defs = ar[0], ar[1:]
-            regouped_dictionary[word].append(defs)
-
-    # Regroup together all definitions of a word. Remove words
-    # that are not in vocabulary.
-    of = open(output_file, "w")
-
-    if len(vocab) == 0: # No vocabulary given so no words removed.
-        for w in regouped_dictionary:
-            definition = ' '.join([el for el in flatten(regouped_dictionary[w])
-                                   if len(el) > 1])
-            of.write("%s %s\n" % (w, definition))
-    else:
-        vocabulary = load_vocabulary(vocab)
-        for w in regouped_dictionary:
-            definition = ' '.join([el for el in flatten(regouped_dictionary[w])
-                                   if len(el) > 1 and el in vocabulary])
-            of.write("%s %s\n" % (w, definition))
+        regouped_dictionary = regroup(f)
+
+    vocabulary = load_vocabulary(vocab) if len(vocab) > 0 else None
+    with open(output_file, "w") as of:
+        write_definitions(regouped_dictionary, of, vocabulary)
+
+    print("Done.")
+
+
+# vocabulary used by the processes cleaning the shards
+shard_vocabulary = None
+
+def init_worker(vocab):
+    global shard_vocabulary
+    shard_vocabulary = load_vocabulary(vocab) if len(vocab) > 0 else None
+
+def clean_shard(shard_fn):
+    """Regroup the definitions of a shard, write them in shard_fn.out"""
+    with open(shard_fn) as f:
+        regouped_dictionary = regroup(f)
+    with open(shard_fn + ".out", "w") as of:
+        write_definitions(regouped_dictionary, of, shard_vocabulary)
+    os.remove(shard_fn)
+    return shard_fn + ".out"
+
+def max_open_files(margin=32, cap=512):
+    """Number of shard files that can be open at the same time: the limit of
+    open files of the process minus a margin (for the other files), at most
+    cap"""
+    try:
+        import resource
+        limit = resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+    except (ImportError, ValueError, OSError):
+        return cap
+    if limit == resource.RLIM_INFINITY:
+        return cap
+    return max(2, min(cap, limit - margin))
+
+def write_shards(src, names, index, buffer_size):
+    """Write each line of src in names[index(line)], skipping the lines for
+    which index() returns None"""
+    shards = [open(fn, "w", buffering=buffer_size) for fn in names]
+    try:
+        with open(src) as f:
+            for line in f:
+                i = index(line)
+                if i is not None:
+                    shards[i].write(line)
+    finally:
+        for shard in shards:
+            shard.close()
+
+def split(src, names, index, max_open, buffer_size, depth=0):
+    """Same as write_shards() with at most max_open files open at once: with
+    more files, the lines are first split into max_open groups (the shards
+    i, i + max_open, i + 2*max_open... are in group i), then each group is
+    split into its shards."""
+    if len(names) <= max_open:
+        write_shards(src, names, index, buffer_size)
+        return
+
+    n_groups = max_open
+    groups = ["{}.group{}".format(fn, depth) for fn in names[:n_groups]]
+
+    def group_index(line):
+        i = index(line)
+        return None if i is None else i % n_groups
+
+    write_shards(src, groups, group_index, buffer_size)
+    for g, group in enumerate(groups):
+        # a group only contains lines with a valid index
+        split(group, names[g::n_groups], lambda line: index(line) // n_groups,
+              max_open, buffer_size, depth + 1)
+        os.remove(group)
+
+def shard_index(n_shards):
+    """Return a function giving the shard of a line (by hash of its word, so
+    all the definitions of a word are in the same shard), or None if the line
+    has no word"""
+    def index(line):
+        ar = line.split(None, 2)
+        if len(ar) < 2:
+            return None
+        return zlib.crc32(ar[1].encode("utf-8")) % n_shards
+    return index
+
+def partition(definitions, directory, n_shards, max_open=None,
+              buffer_size=1 << 16):
+    """Split the lines of definitions into n_shards files, according to the
+    hash of their word, so all the definitions of a word are in the same
+    shard. At most max_open files (default: see max_open_files()) are open at
+    the same time, with more shards the definitions are split in several
+    passes. Return the list of shard filenames."""
+    names = [os.path.join(directory, "shard-{:05d}".format(i))
+             for i in range(n_shards)]
+    split(definitions, names, shard_index(n_shards),
+          max_open or max_open_files(), buffer_size)
+    return names
+
+def clean_defs_streaming(definitions, output_file, vocab, memory=1024,
+                         workers=1, tmp_dir=None):
+    """Same as clean_defs() but with a bounded memory: the definitions are
+    split into shards (by word) small enough to be regrouped in <memory> MB
+    by each of the <workers> processes. Words are written shard by shard, so
+    the order of the lines differs from clean_defs()."""
+    size = os.path.getsize(definitions)
+    budget = max(1, memory * 1024 * 1024 // max(1, workers))
+    n_shards = max(1, -(-size * MEMORY_FACTOR // budget)) # ceil division
+    print("Splitting %s into %d shard(s)." % (definitions, n_shards))
+
+    # the write buffers of the shards open at the same time fit in memory
+    max_open = max_open_files()
+    buffer_size = max(4096, min(1 << 16, memory * 1024 * 1024 //
+                                         min(n_shards, max_open)))
+
+    directory = tempfile.mkdtemp(prefix="clean-defs-", dir=tmp_dir)
+    try:
+        shards = partition(definitions, directory, n_shards, max_open,
+                           buffer_size)
+
+        if workers > 1:
+            with Pool(workers, init_worker, (vocab,)) as pool:
+                outputs = pool.map(clean_shard, shards, chunksize=1)
+        else:
+            init_worker(vocab)
+            outputs = [clean_shard(fn) for fn in shards]
+
+        with open(output_file, "w") as of:
+            for fn in outputs:
+                with open(fn) as f:
+                    shutil.copyfileobj(f, of)
+    finally:
+        shutil.rmtree(directory)
 
-    of.close()
     print("Done.")
 
 
@@ -80,9 +224,26 @@ if __name__ == "__main__":
     parser.add_argument("-v", "--vocab", help="""file containing a list of
                         words. The script will remove all words in definitions
                         that are not in this vocab""", default="")
+    parser.add_argument("-s", "--streaming", action="store_true",
+                        help="""regroup the definitions by shards, with a
+                        bounded memory whatever the size of the definitions
+                        file""")
+    parser.add_argument("-m", "--memory", type=int, default=1024, help="""with
+                        --streaming, maximum memory (in MB) used to regroup
+                        the definitions (default: 1024)""")
+    parser.add_argument("-w", "--workers", type=int, default=1, help="""with
+                        --streaming, number of processes cleaning the shards
+                        (default: 1)""")
+    parser.add_argument("-t", "--tmp-dir", help="""with --streaming, directory
+                        for the temporary shard files (default: system
+                        temporary directory)""")
 
     args = parser.parse_args()
 
 
     print("Writing the new definitions file as %s." % (dest_fn))
-    clean_defs(args.definitions, dest_fn, args.vocab)
+    if args.streaming:
+        clean_defs_streaming(args.definitions, dest_fn, args.vocab,
+                             args.memory, args.workers, args.tmp_dir)
+    else:
+        clean_defs(args.definitions, dest_fn, args.vocab)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Fast cleaning of the words of the definitions.
+
+A definition is cleaned in a few passes done in C (str.split, a translation
+table or a precompiled regex, str.lower) instead of a Python loop over each
+character of each word. The result is the same as the original cleaning, word for word: only
+the ASCII letters of each word are kept, lowercased, and stopwords are
+removed (a word without any letter gives an empty string, like before).
+"""
+
+import os
+import re
+import string
+
+STOPWORDS_FN = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "stopwords.txt")
+
+# translation of ASCII definitions (most of them): lowercase the letters and
+# delete all the other characters except the space separating the words
+LOWER  = bytes.maketrans(string.ascii_uppercase.encode(),
+                         string.ascii_lowercase.encode())
+DELETE = bytes(c for c in range(256)
+               if chr(c) not in string.ascii_letters and c != ord(' '))
+
+# same for the other definitions. The characters are removed before
+# lowercasing, because some non-ASCII letters become ASCII letters when
+# lowercased (like the Kelvin sign)
+NOT_LETTERS = re.compile('[^A-Za-z ]+')
+
+
+def clean_definition(definition, stopwords=frozenset()):
+    """Return the list of cleaned words of definition, without stopwords"""
+    words = definition.split()
+    if len(words) == 0:
+        return []
+
+    # each word is separated by exactly one space, so split(' ') gives one
+    # element per word, even when all its characters have been removed
+    definition = ' '.join(words)
+    if definition.isascii():
+        definition = definition.encode().translate(LOWER, DELETE).decode()
+    else:
+        definition = NOT_LETTERS.sub('', definition).lower()
+    words = definition.split(' ')
+    return [w for w in words if w not in stopwords]
+
+
+def load_stopwords(fn=STOPWORDS_FN):
+    """Return the set of the stopwords of fn (one per line), lowercased"""
+    with open(fn) as f:
+        return {line.strip().lower() for line in f}
+
+
+def keep_words(words, vocabulary=None):
+    """Return the words of more than one letter, which are in vocabulary (if
+    given)"""
+    if vocabulary is None:
+        return [w for w in words if len(w) > 1]
+    return [w for w in words if len(w) > 1 and w in vocabulary]
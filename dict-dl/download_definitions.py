@@ -19,190 +19,423 @@
 # You should have received a copy of the GNU General Public License
 # along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
 
-from queue import Queue
-from threading import Thread, Lock
-from multiprocessing import cpu_count
+from queue import Queue, Empty
+from threading import Thread, Lock, Timer, Event
+from multiprocessing import cpu_count, Pool
 from downloader import *
+from ratelimit import RateLimiter, backoff
+from htmlcache import HTMLCache
+from journal import Journal
 from os.path import splitext, isfile
+import async_downloader
 import argparse
 import time
 import sys
 
 # global variables used (and shared) by all ThreadDown instances
-exitFlag = 0
 counterLock = Lock()
 request_counter  = {"Cam": 0, "Dic": 0, "Col": 0, "Oxf": 0}
 download_counter = {"Cam": 0, "Dic": 0, "Col": 0, "Oxf": 0}
+failed_counter   = {"Cam": 0, "Dic": 0, "Col": 0, "Oxf": 0}
+missing_counter  = {"Cam": 0, "Dic": 0, "Col": 0, "Oxf": 0}
+cache = None # HTMLCache storing the raw pages, if enabled with -cache
+journal = None # Journal of the words done, if enabled with -journal
+listener = None # function called with each result (see main())
+
+# in my case, fastest fetching was achieved with 12 threads per core, but since
+# there are 4 types of threads (1 for each dictionary), it gives a default
+# number of thread per dictionary equal to : (NB_CORE * 12 ) / 4 = NB_CORE * 3
+# (use load_test.py to find the best value against a given server behavior)
+NB_THREAD = cpu_count() * 3
+
+def count_result(dict_name, word, pos, status, result=()):
+    """Update the counters (and the journal) once a word is done (downloaded,
+    not found or given up after too many failed attempts)"""
+    if journal is not None:
+        journal.record(dict_name, word, pos, status, result)
+
+    counterLock.acquire()
+    request_counter[dict_name] += 1
+    if status == DONE:
+        download_counter[dict_name] += 1
+    elif status == RETRY:
+        failed_counter[dict_name] += 1
+    counterLock.release()
+
+    if listener is not None:
+        listener(dict_name, word, status, result)
+
+    if status == RETRY:
+        print("\nERROR: * too many failed attempts.")
+        print("       * giving up {} - {}".format(dict_name, word))
+
+def requeue(queue, item):
+    """Put back a word to retry in its queue. The failed attempt is marked as
+    done only after, so queue.join() can not return in between."""
+    queue.put(item)
+    queue.task_done()
 
 class ThreadDown(Thread):
-    """Class representing a thread that download definitions."""
-    def __init__(self, dict_name, pos, data_queue, res_queue):
+    """Class representing a thread that download definitions. It stops when it
+    gets None from data_queue."""
+    def __init__(self, dict_name, pos, data_queue, res_queue, limiter,
+                 max_attempts):
         Thread.__init__(self)
-        self.dict_name  = dict_name
-        self.pos        = pos # part of speech (noun, verb, adjective or all)
-        self.data_queue = data_queue
-        self.res_queue  = res_queue
+        self.dict_name    = dict_name
+        self.pos          = pos # part of speech (noun, verb, adjective or all)
+        self.data_queue   = data_queue # (word, attempt) to download
+        self.res_queue    = res_queue
+        self.limiter      = limiter # shared by all threads of dict_name
+        self.max_attempts = max_attempts
 
     def run(self):
-        while not exitFlag:
-            if not self.data_queue.empty():
-                word = self.data_queue.get()
-                result = download_word_definition(self.dict_name, word,
-                                                  self.pos)
-                counterLock.acquire()
-                request_counter[self.dict_name] += 1
-                counterLock.release()
-
-                if len(result) > 0:
-                    # if len > 0, the downloaded definition contains at least
-                    # one word, we can add 1 to the number of downloads
-                    counterLock.acquire()
-                    download_counter[self.dict_name] += 1
-                    counterLock.release()
-
-                    # then add the fetched definition, the word and the
-                    # dictionary used as a message for ThreadWrite
-                    self.res_queue.put("{} {} {}".format(self.dict_name, word,
-                                                        " ".join(result)))
+        while True:
+            item = self.data_queue.get()
+            if item is None:
+                self.data_queue.task_done()
+                break
+            word, attempt = item
+
+            requeued = False
+            try:
+                requeued = self.fetch(word, attempt)
+            except Exception as e:
+                # an unexpected error (parser, cache, journal...) must not kill
+                # the thread: the word is given up, the others are still done
+                print("\nERROR: * {} - {}: {!r}".format(self.dict_name, word, e))
+                try:
+                    count_result(self.dict_name, word, self.pos, RETRY)
+                except Exception as e:
+                    print("\nERROR: * can not record {} - {}: {!r}".format(
+                          self.dict_name, word, e))
+            finally:
+                # a requeued word is marked as done by requeue(), otherwise
+                # queue.join() must always be able to return
+                if not requeued:
+                    self.data_queue.task_done()
+
+    def fetch(self, word, attempt):
+        """Download (or read from the cache) and parse the page of word.
+        Return True if the word has been scheduled to be retried."""
+        retry_after = None
+        body = cache.get(self.dict_name, word) if cache is not None else None
+        if body is not None:
+            # no request needed, only parse the cached page
+            status, result = parse_page(self.dict_name, body, self.pos)
+        else:
+            time.sleep(self.limiter.reserve())
+            status, result, retry_after = download_word(
+                self.dict_name, word, self.pos, cache=cache)
+
+            if status == RETRY:
+                self.limiter.failure(retry_after)
+            else:
+                self.limiter.success()
+
+        if status == RETRY and attempt + 1 < self.max_attempts:
+            # the word is put back in data_queue after the backoff delay,
+            # until then it is still an unfinished task, so it is not lost
+            timer = Timer(backoff(attempt, retry_after), requeue,
+                          (self.data_queue, (word, attempt + 1)))
+            timer.daemon = True
+            timer.start()
+            return True
+
+        count_result(self.dict_name, word, self.pos, status, result)
+        if status == DONE:
+            # add the fetched definition, the word and the dictionary
+            # used as a message for ThreadWrite
+            self.res_queue.put("{} {} {}".format(self.dict_name, word,
+                                                " ".join(result)))
+        return False
 
 class ThreadWrite(Thread):
-    """Class representing a thread that write definitions to a file."""
-    def __init__(self, filename, msg_queue):
+    """Class representing a thread that write definitions to a file. Messages
+    are written by batches, and the file is flushed at least every
+    flush_interval seconds. It stops when it gets None from msg_queue."""
+    def __init__(self, filename, msg_queue, batch_size=1000,
+                 flush_interval=5.0):
         Thread.__init__(self)
-        self.msg_queue = msg_queue
-        self.of = open(filename, "a")
+        self.msg_queue      = msg_queue
+        self.batch_size     = batch_size
+        self.flush_interval = flush_interval
+        self.of = open(filename, "a", buffering=1 << 20)
 
     def run(self):
-        while not exitFlag:
-            if not self.msg_queue.empty():
-                msg = self.msg_queue.get()
-                self.of.write(msg + "\n")
-
-        while True:
+        last_flush = time.monotonic()
+        running = True
+        while running:
+            # wait for a first message, then take all the ones available
+            batch = []
             try:
-                msg = self.msg_queue.get(True, 5)
-                self.of.write(msg + "\n")
-            except:
-                break
+                batch.append(self.msg_queue.get(timeout=self.flush_interval))
+                while len(batch) < self.batch_size:
+                    batch.append(self.msg_queue.get_nowait())
+            except Empty:
+                pass
+
+            if batch and batch[-1] is None:
+                running = False
+                batch.pop()
+            if batch:
+                self.of.write("\n".join(batch) + "\n")
+
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.of.flush()
+                last_flush = time.monotonic()
 
         self.of.close()
 
-def main(filename, pos="all"):
-    # 0. to measure download time; use `global` to be able to modify exitFlag
-    globalStart = time.time()
-    global exitFlag
+def show_progress(vocabulary_size, stop, interval=0.5):
+    """Print the progress every interval seconds until stop is set"""
+    percent = 0
+    while not stop.wait(interval):
+        # the expected number of fetched words is the number of words in the
+        # vocabulary times 4 because we are using 4 dictionaries. The number
+        # of fetched words is simply the sum of each counter.
+        tmp = sum(request_counter.values()) / (4.0 * vocabulary_size) * 100
+        tmp = int(tmp) + 1
+        if tmp != percent:
+            print('\r{0}%'.format(tmp), end="", flush=True)
+            percent = tmp
+
+def download_async(to_fetch, vocabulary_size, output_fn, pos, limiters,
+                   max_attempts, concurrency):
+    """Download the definitions of the words of to_fetch[dict_name] with the
+    asyncio engine: a single OS thread and <concurrency> keep-alive
+    connections per dictionary."""
+    words = {dic: to_fetch[dic] for dic in sorted(request_counter)}
+    of = open(output_fn, "a")
+    percent = 0
+
+    def on_result(dict_name, word, status, result):
+        nonlocal percent
+        count_result(dict_name, word, pos, status, result)
+        if status == DONE:
+            of.write("{} {} {}\n".format(dict_name, word, " ".join(result)))
+
+        # same progress as the threaded version
+        tmp = sum(request_counter.values()) / (4.0 * vocabulary_size) * 100
+        tmp = int(tmp) + 1
+        if tmp != percent:
+            print('\r{0}%'.format(tmp), end="")
+            percent = tmp
+
+    async_downloader.run(words, pos, on_result, concurrency,
+                         limiters=limiters, max_attempts=max_attempts,
+                         cache=cache)
+    of.close()
+    print()
 
-    # 1. read the file to get the list of words to download definitions
-    vocabulary = set()
-    with open(filename) as f:
-        for line in f:
-            vocabulary.add(line.strip())
+def init_worker(cache_dir):
+    """Open the cache in each worker process of parse_offline()"""
+    global cache
+    cache = HTMLCache(cache_dir)
 
+def parse_cached(task):
+    """Parse the cached page of a word. Return (dict_name, word, status,
+    result) where status is None if the page is not in the cache."""
+    dict_name, word, pos = task
+    body = cache.get(dict_name, word)
+    if body is None:
+        return dict_name, word, None, []
+    return (dict_name, word) + parse_page(dict_name, body, pos)
+
+def parse_offline(vocabulary, output_fn, pos, workers):
+    """Extract again the definitions of all the words from the pages stored in
+    the cache, with <workers> processes. No request is sent: words whose page
+    is not in the cache are only counted as missing."""
     vocabulary_size = len(vocabulary)
-    print("Reading file {}: Done".format(filename))
-    print("Vocabulary size:", vocabulary_size)
+    tasks = [(dic, w, pos) for dic in sorted(request_counter)
+             for w in vocabulary]
+    percent = 0
+    done = 0
 
-    # add "-definitions" before the file extension to create output filename.
-    # If pos is noun/verb/adjective, add it also to the output filename
-    if pos in ["noun", "verb", "adjective"]:
-        output_fn = splitext(filename)[0] + "-definitions-{}.txt".format(pos)
-    else:
-        output_fn = splitext(filename)[0] + "-definitions.txt"
+    with open(output_fn, "w") as of, \
+         Pool(workers, init_worker, (cache.directory,)) as pool:
+        for dict_name, word, status, result in pool.imap_unordered(
+                parse_cached, tasks, chunksize=64):
+            done += 1
+            if status is None:
+                missing_counter[dict_name] += 1
+            else:
+                count_result(dict_name, word, pos, status, result)
+            if status == DONE:
+                of.write("{} {} {}\n".format(dict_name, word, " ".join(result)))
 
-    # look if some definitions have already been downloaded. If that's the case,
-    # add the words present in output_fn in the aleady_done variable
-    already_done = {"Cam": set(), "Dic": set(), "Col": set(), "Oxf": set()}
-    reusing = False
-    if isfile(output_fn): # need to read the file, first test if it exists
-        with open(output_fn) as f:
-            for line in f:
-                line = line.split()
-                # line[0] is dictionary name, line[1] the word (already) fetched
-                if len(line) < 2:
-                    continue
-                already_done[line[0]].add(line[1])
-                reusing = True
-    if reusing:
-        print("\nSome definitions have already been downloaded into {}.".format(
-            output_fn))
-        print("Reusing: ")
-        for dic in already_done:
-            print("  - {} definitions from {}".format(
-                len(already_done[dic]), dic))
+            tmp = int(done / (4.0 * vocabulary_size) * 100) + 1
+            if tmp != percent:
+                print('\r{0}%'.format(tmp), end="")
+                percent = tmp
+    print()
 
+def download_threads(to_fetch, vocabulary_size, output_fn, pos, limiters,
+                     max_attempts, nb_thread):
+    """Download the definitions of the words of to_fetch[dict_name] with
+    nb_thread threads per dictionary"""
     # 2. create queues containing all words to fetch (1 queue per dictionary)
-    # The words to download are in queue_{Cam, Dic, Col, Oxf}, the downloaded
+    # The words to download are in queues[dict_name], the downloaded
     # definitions are pushed in queue_msg
-    queue_Cam = Queue() # no init val -> infinite size
-    queue_Dic = Queue()
-    queue_Col = Queue()
-    queue_Oxf = Queue()
+    queues = {dic: Queue() for dic in sorted(request_counter)} # infinite size
     queue_msg = Queue()
 
-    # only add words in queue if they are not already done
-    for w in vocabulary:
-        if not w in already_done["Cam"]:
-            queue_Cam.put(w)
-        if not w in already_done["Dic"]:
-            queue_Dic.put(w)
-        if not w in already_done["Col"]:
-            queue_Col.put(w)
-        if not w in already_done["Oxf"]:
-            queue_Oxf.put(w)
+    # only words not already done are in to_fetch
+    for dic, queue in queues.items():
+        for w in to_fetch[dic]:
+            queue.put((w, 0))
 
     # 3. create threads
-    threads = []
     thread_writer = ThreadWrite(output_fn, queue_msg)
     thread_writer.start()
-    threads.append(thread_writer)
-
-    # in my case, fastest fetching was achieved with 12 threads per core,
-    # but since there are 4 types of threads (1 for each dictionary), it
-    # gives a number of thread per dictionary equal to :
-    # (NB_CORE * 12 ) / 4 = NB_CORE * 3
-    NB_THREAD = cpu_count() * 3
 
     # start all the download threads
-    for x in range(NB_THREAD):
-        thread_Cam = ThreadDown("Cam", pos, queue_Cam, queue_msg)
-        thread_Cam.start()
-        thread_Dic = ThreadDown("Dic", pos, queue_Dic, queue_msg)
-        thread_Dic.start()
-        thread_Col = ThreadDown("Col", pos, queue_Col, queue_msg)
-        thread_Col.start()
-        thread_Oxf = ThreadDown("Oxf", pos, queue_Oxf, queue_msg)
-        thread_Oxf.start()
-
-        threads.append(thread_Cam)
-        threads.append(thread_Dic)
-        threads.append(thread_Col)
-        threads.append(thread_Oxf)
-
-    # 4. wait until all queues are empty, show progress, terminate all threads
-    percent = 0
-    while not queue_msg.empty() or \
-          not queue_Cam.empty() or \
-          not queue_Dic.empty() or \
-          not queue_Col.empty() or \
-          not queue_Oxf.empty():
-
-        # the expected number of fetched words is the number of words
-        # in the vocabulary times 4 because we are using 4 dictionaries.
-        # The number of fetched words is simply the sum of each counter.
-        tmp = sum(request_counter.values()) / (4.0 * vocabulary_size) * 100
-        tmp = int(tmp) + 1
-        if tmp != percent:
-            print('\r{0}%'.format(tmp), end="")
-            percent = tmp
+    threads = []
+    for x in range(nb_thread):
+        for dic, queue in queues.items():
+            thread = ThreadDown(dic, pos, queue, queue_msg, limiters[dic],
+                                max_attempts)
+            thread.start()
+            threads.append(thread)
+
+    stop_progress = Event()
+    progress = Thread(target=show_progress,
+                      args=(vocabulary_size, stop_progress))
+    progress.start()
+
+    # 4. wait until all words are done (including the ones waiting to be
+    # retried), then stop the threads: one None per download thread, and
+    # the writer once all the download threads have finished
+    for queue in queues.values():
+        queue.join()
+    for queue in queues.values():
+        for x in range(nb_thread):
+            queue.put(None)
+    for thread in threads:
+        thread.join()
 
-    exitFlag = 1
-    # we only wait thread_writer to join because this is the most important
-    # thread in the code and we are only interested in what the program
-    # is writing. And sometimes, some ThreadDown are stuck in a
-    # connection timeout and cause the entire code to freeze and never
-    # terminate.
-    print("\nWaiting thread_writer to join.")
+    queue_msg.put(None)
     thread_writer.join()
+    stop_progress.set()
+    progress.join()
+    print()
+
+def main(filename, pos="all", use_async=False, concurrency=8, rate=10.0,
+         max_attempts=5, cache_dir=None, offline=False, workers=cpu_count(),
+         nb_thread=NB_THREAD, journal_fn=None, on_result=None):
+    """Download the definitions of the words of filename. If on_result is
+    given, it is called with (dict_name, word, status, definition words) once
+    a word is done in a dictionary, from the download threads. The words done
+    in a previous run are given to it first."""
+    global cache, journal, listener
+    # the globals are set again at each call, so main() can be called more
+    # than once in the same process (the journal of a previous call is
+    # closed)
+    for counter in [request_counter, download_counter, failed_counter,
+                    missing_counter]:
+        for dic in counter:
+            counter[dic] = 0
+    listener = on_result
+    cache = HTMLCache(cache_dir) if cache_dir is not None else None
+    journal = None
+    new_journal = False
+
+    # 0. to measure download time
+    globalStart = time.time()
+
+    # add "-definitions" before the file extension to create output filename.
+    # If pos is noun/verb/adjective, add it also to the output filename
+    if pos in ["noun", "verb", "adjective"]:
+        output_fn = splitext(filename)[0] + "-definitions-{}.txt".format(pos)
+    else:
+        output_fn = splitext(filename)[0] + "-definitions.txt"
+
+    if journal_fn is not None:
+        new_journal = not isfile(journal_fn)
+        journal = Journal(journal_fn)
+
+    if journal is not None and not offline:
+        # 1. with a journal, the words and their status are stored in it, so
+        # only the words still to download are read (the file of words is
+        # only read again if it has changed). On the first run with a
+        # journal, import what was already downloaded in output_fn.
+        if new_journal and isfile(output_fn):
+            journal.import_text(output_fn, pos)
+        journal.add_words(filename, pos)
+        vocabulary_size = journal.size(filename, pos)
+        to_fetch = {dic: journal.todo(dic, pos) for dic in request_counter}
+        print("Reading journal {}: Done".format(journal_fn))
+        print("Vocabulary size:", vocabulary_size)
+
+        already_done = {dic: vocabulary_size - len(to_fetch[dic])
+                        for dic in to_fetch}
+        if sum(already_done.values()) > 0:
+            print("\nSome words have already been done (downloaded or not "
+                  "found).")
+            print("Reusing: ")
+            for dic in already_done:
+                print("  - {} words from {}".format(already_done[dic], dic))
+
+        if listener is not None:
+            for dic, word, status, definition in journal.finished(pos):
+                listener(dic, word, status, definition.split())
+    else:
+        # 1. read the file to get the list of words to download definitions
+        vocabulary = set()
+        with open(filename) as f:
+            for line in f:
+                vocabulary.add(line.strip())
+
+        vocabulary_size = len(vocabulary)
+        print("Reading file {}: Done".format(filename))
+        print("Vocabulary size:", vocabulary_size)
+
+        # look if some definitions have already been downloaded. If that's
+        # the case, add the words present in output_fn in the aleady_done
+        # variable (in offline mode, all definitions are extracted again so
+        # output_fn is overwritten)
+        already_done = {"Cam": set(), "Dic": set(), "Col": set(), "Oxf": set()}
+        reusing = False
+        if isfile(output_fn) and not offline:
+            with open(output_fn) as f:
+                for line in f:
+                    line = line.split()
+                    # line[0] is dictionary name, line[1] the word (already)
+                    # fetched
+                    if len(line) < 2:
+                        continue
+                    already_done[line[0]].add(line[1])
+                    reusing = True
+                    if listener is not None:
+                        listener(line[0], line[1], DONE, line[2:])
+        if reusing:
+            print("\nSome definitions have already been downloaded into "
+                  "{}.".format(output_fn))
+            print("Reusing: ")
+            for dic in already_done:
+                print("  - {} definitions from {}".format(
+                    len(already_done[dic]), dic))
+
+        to_fetch = {dic: [w for w in vocabulary if not w in already_done[dic]]
+                    for dic in already_done}
+
+    # one rate limiter per dictionary, shared by all its workers
+    limiters = {dic: RateLimiter(rate) for dic in request_counter}
+
+    if offline:
+        parse_offline(vocabulary, output_fn, pos, workers)
+    elif use_async:
+        download_async(to_fetch, vocabulary_size, output_fn, pos, limiters,
+                       max_attempts, concurrency)
+    else:
+        download_threads(to_fetch, vocabulary_size, output_fn, pos, limiters,
+                         max_attempts, nb_thread)
+
+    # the journal holds all the definitions, including the ones of the
+    # previous runs
+    if journal is not None:
+        journal.export(output_fn, pos)
+        journal.close()
+        journal = None
 
     # 5. get total time and some results infos.
     print("Total time: {:.2f} sec\n".format(time.time() - globalStart))
@@ -214,26 +447,73 @@ def main(filename, pos="all"):
               end="")
         if (request_counter[dic] > 0): # so no division by zero
             print("  ({:.1f}%)".format(
-                download_counter[dic] * 100 / request_counter[dic]))
+                download_counter[dic] * 100 / request_counter[dic]), end="")
+        if offline:
+            print("  not in cache: {}".format(missing_counter[dic]))
         else:
-            print() # add newline if no percentage printed
+            print("  throttled: {}  given up: {}  final rate: {:.1f} "
+                  "req/s".format(limiters[dic].throttled, failed_counter[dic],
+                                 limiters[dic].rate))
 
     print("\n-> Results written in", output_fn)
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument("list_words", metavar="list-words",
-        help="""File containing a list of words (one per line). The script will
-        download the definitions for each word.""")
+def add_download_arguments(parser):
+    """Add the options of the download (all but the file of words) to an
+    argparse parser"""
     parser.add_argument("-pos", help="""Either NOUN/VERB/ADJECTIVE. If POS (Part
         Of Speech) is given, the script will only download the definitions that
         corresponds to that POS, not the other ones. By default, it downloads
         the definitions for all POS""", type=str.lower, default="all")
-    args = parser.parse_args()
+    parser.add_argument("-async", dest="use_async", action="store_true",
+        help="""Download with the asyncio engine (one OS thread, pooled
+        keep-alive connections) instead of threads.""")
+    parser.add_argument("-concurrency", type=int, default=8, help="""Number of
+        concurrent requests per dictionary with -async (default: 8).""")
+    parser.add_argument("-threads", type=int, default=NB_THREAD, help="""
+        Number of threads per dictionary without -async (default: number of
+        CPUs * 3).""")
+    parser.add_argument("-rate", type=float, default=10.0, help="""Initial
+        number of requests per second sent to each dictionary. The rate adapts
+        to the answers of the servers (default: 10).""")
+    parser.add_argument("-max-attempts", type=int, default=5, help="""Number
+        of attempts before giving up a word whose requests fail with a timeout,
+        429 or 5xx error (default: 5).""")
+    parser.add_argument("-cache", metavar="DIR", help="""Directory where the
+        raw HTML pages are stored (compressed). Pages already in the cache are
+        not downloaded again. Shared by all POS.""")
+    parser.add_argument("-offline", action="store_true", help="""Do not
+        download anything, extract again all the definitions from the pages
+        stored in the cache (requires -cache). Overwrite the output file.""")
+    parser.add_argument("-workers", type=int, default=cpu_count(), help="""
+        Number of processes parsing the pages with -offline (default: number
+        of CPUs).""")
+    parser.add_argument("-journal", metavar="FILE", help="""SQLite journal
+        recording the status of each word (done, not-found or
+        failed-retryable). The words done or not found are not downloaded
+        again in the next runs, the failed ones are. The output file is
+        written from the journal at the end.""")
+
+def check_download_arguments(parser, args):
+    """Check the options added by add_download_arguments()"""
+    if args.offline and args.cache is None:
+        parser.error("-offline requires -cache")
 
     if args.pos not in ["noun", "verb", "adjective", "all"]:
         print("WARNING: invalid POS argument \"{}\"".format(args.pos))
         print("It can be NOUN, VERB or ADJECTIVE. Using default POS (ALL)\n")
         args.pos = "all"
 
-    main(args.list_words, pos=args.pos)
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument("list_words", metavar="list-words",
+        help="""File containing a list of words (one per line). The script will
+        download the definitions for each word.""")
+    add_download_arguments(parser)
+    args = parser.parse_args()
+    check_download_arguments(parser, args)
+
+    main(args.list_words, pos=args.pos, use_async=args.use_async,
+         concurrency=args.concurrency, rate=args.rate,
+         max_attempts=args.max_attempts, cache_dir=args.cache,
+         offline=args.offline, workers=args.workers, nb_thread=args.threads,
+         journal_fn=args.journal)
@@ -20,153 +20,31 @@
 # along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
 
 from urllib.error import HTTPError
+from ratelimit import parse_retry_after
+from parsers import PARSERS
+from cleaner import clean_definition, load_stopwords
 import urllib.request
-import re
 
-def download_cambridge(word, pos="all"):
-    URL = "http://dictionary.cambridge.org/dictionary/english/" + word
-
-    if pos not in ["all", "adjective", "noun", "verb"]:
-        pos = "all"
-
-    try:
-        html = urllib.request.urlopen(URL).read().decode('utf-8')
-
-        # definitions are in a <b> tag that has the class "def"
-        defs_pat = re.compile('<b class="def">(.*?)</b>', re.I|re.S)
-
-        # need to extract definitions only if it's a certain pos type
-        if pos in ["adjective", "noun", "verb"]:
-
-            # each type entry (adj, noun or verb) is in a "entry-body__el"
-            # block. A word might have many blocks (if it is both a noun and a
-            # verb, it will have 2 blocks). Moreover, there are also different
-            # blocks for British or American language. I can't extract blocks
-            # because there is no ending regex that works for every word, so I
-            # consider a block to be between the indexes of 2 consecutive
-            # block_pat matches. Last block goes to the end of html string.
-            block_pat = re.compile('<div class="entry-body__el ', re.I|re.S)
-            idx = [m.start() for m in block_pat.finditer(html)] + [len(html)]
-            span = [(idx[i], idx[i+1]) for i in range(len(idx)-1)]
-
-            # then for each block, I only extract the definitions if it matches
-            # the pos argument
-            pos_pat = re.compile('class="pos".*?>(.*?)</span>', re.I|re.S)
-            defs = []
-
-            for start, end in span:
-                pos_extracted = re.search(pos_pat, html[start:end])
-
-                # some words (like mice) do not have a pos info, so no pos
-                # extracted
-                if pos_extracted is None:
-                    continue
-
-                pos_extracted = pos_extracted.group(1)
-
-                if pos_extracted != pos:
-                    continue
-
-                defs += re.findall(defs_pat, html[start:end])
-
-        # otherwise extract all definitions available
-        else:
-            defs = re.findall(defs_pat, html)
-
-        # need to clean definitions of <a> and <span> tags. Use cleaner to
-        # replace these tags by empty string
-        cleaner = re.compile('<.+?>', re.I|re.S)
-        return [ re.sub(cleaner, '', x) for x in defs ]
-
-    except HTTPError:
-        return -1
-    except UnicodeDecodeError:
-        return -1
-    except Exception as e:
-        print("\nERROR: * timeout error.")
-        print("       * retry Cambridge -", word)
-        return -1
-
-def download_dictionary(word, pos="all"):
-    URL = "http://www.dictionary.com/browse/" + word
-
-    if pos not in ["all", "adjective", "noun", "verb"]:
-        pos = "all"
-
-    try:
-        html = urllib.request.urlopen(URL).read().decode('utf-8')
-
-        # definitions are in <section> tags with class "css-171jvig". Each POS
-        # type has its own <section>, so extract them all.
-        block_pat = re.compile('<section class="css-171jvig(.*?)</section>',
-                               re.I|re.S)
-        blocks = re.findall(block_pat, html)
-
-        # inside each block, definitions are in <span> tags with the class
-        # "css-1e3ziqc". Sometimes there is another class, so use the un-greedy
-        # regex pattern .+? to go until the closing '>' of the opening <span>
-        # tag.
-        defs_pat = re.compile('<span class=".+?css-1e3ziqc.+?>(.*?)</span>', re.I|re.S)
-
-        # need to extract definitions only if it's a certain pos type
-        if pos in ["adjective", "noun", "verb"]:
-
-            # for each block, if the extracted POS matches the pos argument, add
-            # the definitions in defs (.+ because class is either luna-pos or
-            # pos)
-            pos_pat = re.compile('class=.+pos">(.*?)</span>', re.I|re.S)
-            defs = []
-
-            for block in blocks:
-                pos_extracted = re.search(pos_pat, block)
-
-                # some words (like cia) do not have a pos info so no pos
-                # extracted
-                if pos_extracted is None:
-                    continue
-
-                pos_extracted = pos_extracted.group(1)
-
-                if pos not in pos_extracted:
-                    continue
-
-                # remove possible sentence examples in definitions and possible
-                # non informative labels (like "Archaic" in one of the
-                # definition of "wick")
-                defs += [ re.sub('<span class="luna-example.+$', '', x)
-                          for x in re.findall(defs_pat, block)
-                          if "luna-label" not in x ]
-
-        # otherwise, concatenate all blocks and extract all definitions
-        # available. Remove possible sentence examples in definitions and
-        # possible non informative labels (like "Archaic" in one of the
-        # definition of "wick")
-        else:
-            defs = re.findall(defs_pat, " ".join(blocks))
-            defs = [ re.sub('<span class="luna-example.+$', '', x)
-                     for x in defs if "luna-label" not in x]
-
-        # need to clean definitions of <span> tags. Use cleaner to replace these
-        # tags by empty string, Use .strip() to also clean some \r or \n.
-        cleaner = re.compile('<.+?>', re.I|re.S)
-        return [ re.sub(cleaner, '', x).strip() for x in defs ]
-
-    except HTTPError:
-        return -1
-    except UnicodeDecodeError:
-        return -1
-    except IndexError:
-        return -1
-    except Exception as e:
-        print("\nERROR: * timeout error.")
-        print("       * retry dictionary.com -", word)
-        return -1
-
-def download_collins(word, pos="all"):
-    URL = "https://www.collinsdictionary.com/dictionary/english/" + word
+# status of a download: the word has definitions, the word has no definition
+# (404, no definition for this POS...) or the request failed and should be
+# retried later (timeout, 429 or 5xx)
+DONE      = "done"
+NOT_FOUND = "not-found"
+RETRY     = "failed-retryable"
+
+TIMEOUT = 30 # seconds
+
+# address of the page of a word is URLS[dict_name] + word
+URLS = {
+    "Cam": "http://dictionary.cambridge.org/dictionary/english/",
+    "Dic": "http://www.dictionary.com/browse/",
+    "Col": "https://www.collinsdictionary.com/dictionary/english/",
+    "Oxf": "http://en.oxforddictionaries.com/definition/",
+}
 
-    # Collins has set some server restrictions. Need to spoof the HTTP headers
-    headers = {
+# Collins has set some server restrictions. Need to spoof the HTTP headers
+HEADERS = {
+    "Col": {
         'User-Agent':
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.11 (KHTML, like '
             'Gecko) Chrome/23.0.1271.64 Safari/537.11',
@@ -176,191 +54,94 @@ def download_collins(word, pos="all"):
             'none',
         'Accept-Language':
             'en-US,en;q=0.8',
-        }
-    req = urllib.request.Request(URL, headers=headers)
-
-    if pos not in ["all", "adjective", "noun", "verb"]:
-        pos = "all"
-
-    try:
-        html = urllib.request.urlopen(req).read().decode('utf-8')
-
-        # definitions are in big blocks <div class="content definitions [...] >
-        # Use the next <div> with "copyright" for ending regex. Regroup all
-        # blocks.
-        block_p = re.compile('<div class="content definitions.+?"(.*?)'
-                             '<div class="div copyright', re.I|re.S)
-        blocks = " ".join(re.findall(block_p, html))
-
-        # inside this block, definitions are in <div class="def">...</div>
-        defs_pat = re.compile('<div class="def">(.+?)</div>', re.I|re.S)
-
-        # need to extract definitions only if it's a certain pos type
-        if pos in ["adjective", "noun", "verb"]:
-
-            # each sense of the word is inside a <div class="hom">. Get all the
-            # starting and ending indexes of these blocks
-            sense_pat = re.compile('<div class="hom">', re.I| re.S)
-            idx = [m.start() for m in sense_pat.finditer(blocks)]
-            idx.append(len(blocks))
-            span = [(idx[i], idx[i+1]) for i in range(len(idx)-1)]
-
-            # then for each sense, I only extract the definitions if it matches
-            # the pos argument
-            pos_pat = re.compile('class="pos">(.*?)</span>', re.I|re.S)
-            defs = []
-
-            for start, end in span:
-                pos_extracted = re.search(pos_pat, blocks[start:end])
-                # sometimes, sense is just a sentence or an idiom, so no pos
-                # extracted
-                if pos_extracted is None:
-                    continue
-
-                # noun is sometimes written as "countable noun". "verb" as
-                # "verb transitive". Use the `in` trick to match these 2
-                # categories with either "noun" or "verb"
-                pos_extracted = pos_extracted.group(1)
-
-                if pos not in pos_extracted:
-                    continue
-
-                defs += re.findall(defs_pat, blocks[start:end])
-
-        # otherwise extract all definitions available
-        else:
-            defs = re.findall(defs_pat, blocks)
-
-        # need to clean definitions of <a> and <span> tags. Use cleaner to
-        # replace these tags by empty string, Use .strip() to also clean some
-        # \r or \n, and replace because sometimes there are \n inside a sentence
-        cleaner = re.compile('<.+?>', re.I|re.S)
-        return [re.sub(cleaner, '', x).replace('\n', ' ').strip() for x in defs]
-
-    except HTTPError:
-        return -1
-    except UnicodeDecodeError:
-        return -1
-    except IndexError:
-        return -1
-    except Exception as e:
-        print("\nERROR: * timeout error.")
-        print("       * retry Collins -", word)
-        return -1
-
-def download_oxford(word, pos="all"):
-    URL = "http://en.oxforddictionaries.com/definition/"+ word
-
-    if pos not in ["all", "adjective", "noun", "verb"]:
-        pos = "all"
-
-    try:
-        html = urllib.request.urlopen(URL).read().decode('utf-8')
-
-        # extract blocks containing POS type and definitions. For example, if
-        # word is both a noun and a verb, there is one <section class="gramb">
-        # block for the noun definitions, and another for the verb definitions
-        block_p = re.compile('<section class="gramb">(.*?)</section>', re.I|re.S)
-        blocks  = re.findall(block_p, html)
-
-        # inside these blocks, definitions are in <span class="ind">
-        defs_pat = re.compile('<span class="ind">(.*?)</span>', re.I|re.S)
-
-        # need to extract definitions only if it's a certain pos type
-        if pos in ["adjective", "noun", "verb"]:
-
-            # for each block, I only extract the definitions if it matches the
-            # pos argument
-            pos_pat = re.compile('class="pos">(.*?)</span>', re.I|re.S)
-            defs = []
-
-            for block in blocks:
-                pos_extracted = re.search(pos_pat, block).group(1)
-
-                if pos_extracted != pos:
-                    continue
-
-                defs += re.findall(defs_pat, block)
-
-        # otherwise extract all definitions available
-        else:
-            defs = re.findall(defs_pat, "".join(blocks))
-
-        # need to clean definitions of <a> and <span> tags. Use cleaner to
-        # replace these tags by empty string
-        cleaner = re.compile('<.+?>', re.I|re.S)
-        return [ re.sub(cleaner, '', x) for x in defs ]
-
-    except HTTPError:
-        return -1
-    except UnicodeDecodeError:
-        return -1
-    except IndexError:
-        return -1
-    except Exception as e:
-        print("\nERROR: * timeout error.")
-        print("       * retry Oxford -", word)
-        return -1
-
-MAP_DICT = {
-    "Cam": download_cambridge,
-    "Dic": download_dictionary,
-    "Col": download_collins,
-    "Oxf": download_oxford,
+    },
 }
 
-STOPSWORD = set()
-with open('stopwords.txt') as f:
-    for line in f:
-        STOPSWORD.add(line.strip().lower())
+STOPSWORD = load_stopwords()
 
-def download_word_definition(dict_name, word, pos="all", clean=True):
+def definition_words(res, clean=True):
     """
-    Download the definition(s) for word from the dictionary dict_name. If clean
-    is True, clean the definition before returning it (remove stopwords and non
-    letters characters in definition).
+    Return the words of the definitions in res (list of definitions returned
+    by a parser of parsers.py). If clean is True, remove stopwords and non
+    letters characters.
     """
-    words    = []
-    download = MAP_DICT[dict_name]
-    res      = download(word, pos=pos)
-    if res == -1: # no definition fetched
-        res = []
-
+    words = []
     for definition in res: # there can be more than one definition fetched
         # if no cleaning needed, add the whole definition
         if not clean:
             words.append(definition)
             continue
 
-        for word in definition.split():
-            word = ''.join([c.lower() for c in word
-                         if c.isalpha() and ord(c) < 128])
-            if not word in STOPSWORD:
-                words.append(word)
+        words += clean_definition(definition, STOPSWORD)
 
     return words
 
+def is_transient(code):
+    """Return True if the HTTP status code means the server is overloaded or
+    throttling us, so the request can be retried later"""
+    return code == 429 or code >= 500
+
+def retry_delay(code, retry_after):
+    """Return the delay asked by the server in the answer of a failed request
+    (code and value of its Retry-After header): 0 for a 429 without
+    Retry-After, None if the server did not ask us to slow down."""
+    delay = parse_retry_after(retry_after)
+    if delay is None and code == 429:
+        return 0.0
+    return delay
+
+def parse_word(dict_name, html, pos="all", clean=True):
+    """
+    Extract the definition words of the page html from dictionary dict_name.
+    Return a tuple (status, words) where status is DONE or NOT_FOUND.
+    """
+    try:
+        words = definition_words(PARSERS[dict_name].parse(html, pos), clean)
+    except (IndexError, AttributeError): # page without the expected blocks
+        return NOT_FOUND, []
+    return (DONE if len(words) > 0 else NOT_FOUND), words
+
+def parse_page(dict_name, body, pos="all", clean=True):
+    """Same as parse_word() but body is the raw bytes of the page (as
+    downloaded or read from an HTMLCache)."""
+    try:
+        html = body.decode('utf-8')
+    except UnicodeDecodeError:
+        return NOT_FOUND, []
+    return parse_word(dict_name, html, pos, clean)
+
+def download_word(dict_name, word, pos="all", clean=True, urls=URLS,
+                  cache=None):
+    """
+    Download the definition(s) for word from the dictionary dict_name. Return
+    a tuple (status, words, retry_after): status is DONE, NOT_FOUND or RETRY,
+    words the definition words (see definition_words) and retry_after the
+    delay asked by the server before retrying (see retry_delay()). If cache
+    is an HTMLCache, the downloaded page is stored in it.
+    """
+    req = urllib.request.Request(urls[dict_name] + word,
+                                 headers=HEADERS.get(dict_name, {}))
+    try:
+        res = urllib.request.urlopen(req, timeout=TIMEOUT)
+        body = res.read()
+    except HTTPError as e:
+        if is_transient(e.code):
+            return RETRY, [], retry_delay(e.code, e.headers.get("Retry-After"))
+        return NOT_FOUND, [], None
+    except Exception: # timeout, connection reset...
+        return RETRY, [], None
+
+    if cache is not None:
+        cache.put(dict_name, word, body)
+    return parse_page(dict_name, body, pos, clean) + (None,)
+
 if __name__ == '__main__':
     print("-- TEST : definitions of wick --")
-    print("Cambridge")
-    print(download_cambridge("wick", "all"))
-    print("\ndictionary.com")
-    print(download_dictionary("wick", "all"))
-    print("\nCollins")
-    print(download_collins("wick", "all"))
-    print("\nOxford")
-    print(download_oxford("wick", "all"))
+    for dict_name in sorted(URLS):
+        print(dict_name, download_word(dict_name, "wick", "all", clean=False))
 
     print("\n\n-- TEST : definitions according to POS of alert --")
-    print("dictionary.com -- alert [ADJECTIVE]")
-    print(download_dictionary("alert", "adjective"))
-    print()
-    print("dictionary.com -- alert [NOUN]")
-    print(download_dictionary("alert", "noun"))
-    print()
-    print("dictionary.com -- alert [VERB]")
-    print(download_dictionary("alert", "verb"))
-    print()
-    print("dictionary.com -- alert [ALL]")
-    print(download_dictionary("alert", "all"))
-    print()
+    for pos in ["adjective", "noun", "verb", "all"]:
+        print("Dic -- alert [{}]".format(pos.upper()))
+        print(download_word("Dic", "alert", pos, clean=False))
+        print()
@@ -20,12 +20,12 @@
 # along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
 
 import sys
-import os.path
+import os
 import argparse
 import numpy as np
 import time
 from numpy.linalg import norm
-from collections import Counter
+from collections import Counter, defaultdict
 
 
 def cosineSim(v1, v2):
@@ -34,16 +34,18 @@ def cosineSim(v1, v2):
     return dot_prod / (norm(v1) * norm(v2))
 
 
-def loadEmbedding(filename, list_words):
+def loadEmbedding(filename, list_words, verbose=True):
     """
     Read the file <filename> and generate the embedding matrix. Only load
     embeddings of words in <list_words>. There is no reason to load the
     embedding of a word if we are not going to do computation with it.
+    If verbose is False, nothing is printed.
     """
+    log = print if verbose else lambda *args, **kwargs: None
 
     # Read the file to get the number of words and the embedding dimension
-    print("   Reading \"{}\" to get the dimension and the number of"
-          " words ... ".format(filename), end="")
+    log("   Reading \"{}\" to get the dimension and the number of"
+        " words ... ".format(filename), end="")
     nb_word = 0
     with open(filename) as f:
         first_line = f.readline().split()
@@ -57,8 +59,8 @@ def loadEmbedding(filename, list_words):
             if line.split()[0] in list_words:
                 nb_word += 1
 
-    print("Done.\n   Loading {} embeddings of dimension"
-          " {} ... ".format(nb_word, nb_dims), end="")
+    log("Done.\n   Loading {} embeddings of dimension"
+        " {} ... ".format(nb_word, nb_dims), end="")
 
     # each row is the embedding of a word
     embedding = np.zeros((nb_word, nb_dims))
@@ -80,154 +82,220 @@ def loadEmbedding(filename, list_words):
                 wordsToNum[word] = idx
                 idx += 1
 
-    print("Done.")
-    print("   Normalizing the embeddings ... ", end="")
+    log("Done.")
+    log("   Normalizing the embeddings ... ", end="")
 
     # norm(., axis=1) gives the norm of each rows. It is an array with
     # dimension (n, ). To divide each coefficicent of embedding with the
     # corresponding norm, we need to reshape the array to (n, 1)
     embedding = embedding / norm(embedding, axis=1)[:, np.newaxis]
 
-    print("Done.")
+    log("Done.")
 
     return embedding, numToWords, wordsToNum
 
 
-def generate_pairs(definition_fn, embedding_fn, strg_fn, weak_fn, K):
+def subEmbedding(embedding, numToWords, list_words):
     """
-    Generate weak and strong pairs of words based on definitions in
-    defs_fn. A and B are a strong pair if :
+    Return the rows of embedding (loaded by loadEmbedding()) of the words in
+    <list_words>, with their own numToWords and wordsToNum. The rows keep
+    their order, so the result is the same as loading the file again with
+    <list_words>.
+    """
+    rows = [idx for idx in range(len(numToWords))
+            if numToWords[idx] in list_words]
+    numToWords = {i: numToWords[idx] for i, idx in enumerate(rows)}
+    wordsToNum = {word: i for i, word in numToWords.items()}
+    return embedding[rows], numToWords, wordsToNum
+
+
+class PairBuilder:
+    """
+    Classify the pairs (word, word of its definition) into strong and weak
+    pairs, one word at a time. A and B are a strong pair if :
         - A is in definition of B
         - B is in definition of A
-    All others pairs of words (ie a word and a word from its definition)
-    are considered as a weak pair.
+    All others pairs are weak pairs. The pairs of a word are classified as
+    soon as its definition is added (add()), the ones with a word whose
+    definition is not known yet are kept pending until it is added, or until
+    finish() is called. The order in which definitions are added does not
+    change the pairs.
+    """
+    def __init__(self):
+        self.dictionary = {} # word -> Counter of its definition words
+        self.uniq_words = set() # headwords and words of their definitions
+        self.done       = set() # words added, with or without a definition
+        self.pending    = defaultdict(list) # word -> words waiting for it
+        self.linked     = defaultdict(list) # token -> words strongly paired
+        self.strong     = set()
+        self.weak       = set()
+
+    def add(self, word, definition_words):
+        """Add the definition of word (list of words, None if word has no
+        definition at all) and classify its pairs."""
+        if word in self.done:
+            return
+        self.done.add(word)
+
+        # use Counter to take into account the number of occurence of each
+        # definition words
+        definition = None
+        if definition_words is not None:
+            definition = Counter(definition_words)
+            self.dictionary[word] = definition
+            self.uniq_words.add(word)
+            self.uniq_words.update(definition)
+
+            for definition_token in definition:
+                # case 0: word is used in its definition. Obvious strong
+                # pair, but not interesting.
+                if word == definition_token:
+                    continue
+
+                # definition_token not added yet, the pair is classified
+                # when it is (or by finish())
+                if not definition_token in self.done:
+                    self.pending[definition_token].append(word)
+
+                # case 1: strong pair
+                # Some words (like eurynome) are in vocabulary, and are used
+                # in some definitions, but do not have a definition
+                # themselves. So we need to be sure that definition_token is
+                # in the dictionary.
+                elif definition_token in self.dictionary and \
+                     word in self.dictionary[definition_token]:
+                    # use alphabetical order -> no duplicate
+                    self.strong.add((min(word, definition_token),
+                                     max(word, definition_token)))
+                    self.linked[definition_token].append(word)
+                    self.linked[word].append(definition_token)
+
+                # case 2: weak pair
+                else:
+                    self.weak.add((min(word, definition_token),
+                                   max(word, definition_token)))
+
+        # words whose definition contains word, and which are not in the
+        # definition of word (otherwise it is a strong pair, added above)
+        for other in self.pending.pop(word, []):
+            if definition is None or not other in definition:
+                self.weak.add((min(word, other), max(word, other)))
+
+    def finish(self):
+        """Classify the pairs still pending: their words have no definition,
+        so they are all weak pairs."""
+        for word, others in self.pending.items():
+            for other in others:
+                self.weak.add((min(word, other), max(word, other)))
+        self.pending.clear()
+
+    def add_neighbours(self, embedding, numToWords, wordsToNum, K):
+        """For each strong pair (A, B), add K artificial strong pairs made of
+        A and the K closest neighbours of B (and conversely)."""
+        nb_words_done = 0
+        for definition_token, words in self.linked.items():
+            nb_words_done += 1
+            if nb_words_done % 100 == 0:
+                progress = nb_words_done / len(self.linked) * 100
+                print("\r", "{:.2f}%".format(progress), end="")
+
+            # to create more strong pairs, we need the embedding of
+            # definition_token. If it does not exist, can't do anything
+            if not definition_token in wordsToNum:
+                continue
+
+            embed_def_token = embedding[wordsToNum[definition_token]]
+
+            # To generate K other strong pairs, we need to find the K closest
+            # word to definition_token. Then we can create the pairs :
+            #   * (word, closest_1)
+            #   * (word, closest_2)
+            #   * ...
+            #   * (word, closest_K)
+            #
+            # Instead of taking each row of the embedding matrix and computing
+            # the cosine similarity with embed_def_token and take the K best
+            # scores, we do the dot product between the embedding matrix and
+            # embed_def_token. Because our embedding matrix is normalized,
+            # we'll get a vector containing all cosine similarities. Then we
+            # only need to find the K indexes of the maximum scores with the
+            # argpartition function. But when we compute the dot product
+            # between the matrix and the vector, we'll compute the dot product
+            # between embed_def_token and itself (hence getting a cosine sim
+            # of 1). So we need to get the K+1 best scores of similarities.
+            # It is computed once for all the words strongly paired with
+            # definition_token.
+            cosine_sim = embedding.dot(embed_def_token)
+            max_indexes = np.argpartition(cosine_sim, -(K+1))[-(K+1):]
+            closest = [numToWords[index] for index in max_indexes
+                       if numToWords[index] != definition_token]
+
+            for word in words:
+                for close_word in closest:
+                    self.strong.add((min(word, close_word),
+                                     max(word, close_word)))
+
+
+def pairs_filenames(strg_fn, weak_fn, K, suffix=""):
+    """Names of the strong and weak pairs files written by write_pairs()"""
+    return ["{}-K{}.txt{}".format(fn, K, suffix) for fn in [strg_fn, weak_fn]]
+
+
+def write_pairs(strong, weak, strg_fn, weak_fn, K, suffix=""):
+    """Write the pairs in <strg_fn>-K<K>.txt and <weak_fn>-K<K>.txt (followed
+    by suffix). Each file is written next to its final name first, so a file
+    is never seen half written."""
+    for pairs, filename in zip([strong, weak],
+                               pairs_filenames(strg_fn, weak_fn, K, suffix)):
+        with open(filename + ".tmp", "w") as of:
+            for s in pairs:
+                of.write(' '.join(s) + '\n')
+        os.replace(filename + ".tmp", filename)
+
 
+def generate_pairs(definition_fn, embedding_fn, strg_fn, weak_fn, K):
+    """
+    Generate weak and strong pairs of words based on definitions in
+    defs_fn (see PairBuilder).
     """
 
-    # load all words and their definitions.
+    # load all words and their definitions, and classify their pairs
     print("-- Loading definitions from \"{}\"".format(definition_fn))
     print("   Reading file ... ", end="")
 
-    dictionary = {}
-    uniq_words = set() # list of all words in definition_file
-
+    builder = PairBuilder()
     with open(definition_fn) as f:
         for line in f:
             ar = line.strip().split()
-            # use Counter to take into account the number of occurence
-            # of each definition words
-            word, definition_words = ar[0], Counter(ar[1:])
-            dictionary[word] = definition_words
-
-            uniq_words.add(word)
-            uniq_words.update(set(ar[1:]))
+            builder.add(ar[0], ar[1:])
+    builder.finish()
 
     print("Done.")
-    print("   Entries in \"{}\":\t{}".format(definition_fn, len(dictionary)))
-    print("   Uniq words in \"{}\":\t{}".format(definition_fn, len(uniq_words)))
+    print("   Entries in \"{}\":\t{}".format(definition_fn,
+                                            len(builder.dictionary)))
+    print("   Uniq words in \"{}\":\t{}".format(definition_fn,
+                                               len(builder.uniq_words)))
 
 
     # load pre-existing embeddings.
     print("\n-- Loading embedding from \"{}\"".format(embedding_fn))
-    embedding, numToWords, wordsToNum = loadEmbedding(embedding_fn, uniq_words)
+    embedding, numToWords, wordsToNum = loadEmbedding(embedding_fn,
+                                                      builder.uniq_words)
 
 
-    # generate strong and weak pairs
+    # generate artificial strong pairs
     print("\n-- Generating strong and weak pairs")
-    weak, strong = set(), set()
-
-    nb_words_done = 0;
-    for word in dictionary:
-        nb_words_done += 1
-        if nb_words_done % 100 == 0:
-            progress = nb_words_done / len(dictionary) * 100
-            print("\r", "{:.2f}%".format(progress), end="")
-
-        for definition_token in dictionary[word]:
-
-            # case 0: word is used in its definition. Obvious strong pair,
-            # but not interesting.
-            if word == definition_token:
-                continue
-
-            # case 1: strong pair
-            # Some words (like eurynome) are in vocabulary, and are used in
-            # some definitions, but do not have a definition themselves. So
-            # we need to be sure that definition_token is in the dictionary.
-            if definition_token in dictionary and \
-               word in dictionary[definition_token]:
-
-                # use alphabetical order -> no duplicate
-                w1, w2 = min(word, definition_token), max(word,definition_token)
-                if not (w1,w2) in strong:
-                    strong.add((w1,w2))
-
-                # |- Artificial strong pairs generation -|
-                if K > 0:
-
-                    # to create more strong pairs, we need the embedding of
-                    # definition_token. If it does not exist, can't do anything
-                    if not definition_token in wordsToNum:
-                        continue
-
-                    embed_def_token = embedding[wordsToNum[definition_token]]
-
-                    # To generate K other strong pairs, we need to find the K
-                    # closest word to definition_token. Then we can create the
-                    # pairs :
-                    #   * (word, closest_1)
-                    #   * (word, closest_2)
-                    #   * ...
-                    #   * (word, closest_K)
-                    #
-                    # Instead of taking each row of the embedding matrix and
-                    # computing the cosine similarity with embed_def_token and
-                    # take the K best scores, we do the dot product between the
-                    # embedding matrix and embed_def_token. Because our
-                    # embedding matrix is normalized, we'll get a vector
-                    # containing all cosine similarities. Then we only need to
-                    # find the K indexes of the maximum scores with the
-                    # argpartition function. But when we compute the dot product
-                    # between the matrix and the vector, we'll compute the dot
-                    # product between embed_def_token and itself (hence getting
-                    # a cosine sim of 1). So we need to get the K+1 best scores
-                    # of similarities.
-
-                    #start = time.time()
-                    cosine_sim = embedding.dot(embed_def_token)
-                    max_indexes = np.argpartition(cosine_sim, -(K+1))[-(K+1):]
-                    #duree = time.time() - start
-                    #print("duree:", duree, "\n")
-
-                    for index in max_indexes:
-                        close_word = numToWords[index]
-
-                        if close_word != definition_token:
-                            #print(close_word, "\t", cosine_sim[index])
-                            w1, w2 = min(word,close_word), max(word,close_word)
-                            strong.add((w1,w2))
-
-            # case 2: weak pair
-            else:
-                w1, w2 = min(word, definition_token), max(word,definition_token)
-                if not (w1,w2) in weak:
-                    weak.add((w1,w2))
+    if K > 0:
+        builder.add_neighbours(embedding, numToWords, wordsToNum, K)
 
 
     # write pairs into files
     print("\n\n-- Writing pairs")
-    strg_of = open("{}-K{}.txt".format(strg_fn, K), "w")
-    weak_of = open("{}-K{}.txt".format(weak_fn, K), "w")
-
-    for s in strong:
-        strg_of.write(' '.join(s) + '\n')
-
-    for s in weak:
-        weak_of.write(' '.join(s) + '\n')
+    write_pairs(builder.strong, builder.weak, strg_fn, weak_fn, K)
+    print_stats(builder.strong, builder.weak)
 
-    strg_of.close()
-    weak_of.close()
 
+def print_stats(strong, weak):
     total = (len(strong) + len(weak)) / 100.0
     print("   # strong pairs: % 8d (%.2f%%)" % (len(strong), len(strong)/total))
     print("   # weak   pairs: % 8d (%.2f%%)" % (len(weak), len(weak)/total))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""On-disk cache of the raw HTML pages downloaded from the dictionaries.
+
+Pages are stored compressed, keyed by (dictionary, word). The page of a word
+contains the definitions for all POS, so the cache is shared by all -pos runs.
+When a parser is fixed, the definitions can be extracted again from the cache
+(download_definitions.py -offline) instead of downloading every word again.
+"""
+
+from hashlib import sha1
+from tempfile import NamedTemporaryFile
+import gzip
+import os
+
+
+class HTMLCache:
+    """
+    Pages are written in <directory>/<dict_name>/<xx>/<key>.html.gz where key
+    is the SHA-1 of the word and xx its first two hex digits (so no directory
+    contains too many files, and words with any character can be stored).
+    Thread-safe and process-safe: files are written in a temporary file with
+    a unique name, then renamed.
+    """
+    def __init__(self, directory, level=6):
+        self.directory = directory
+        self.level     = level
+
+    def path(self, dict_name, word):
+        key = sha1(word.encode("utf-8")).hexdigest()
+        return os.path.join(self.directory, dict_name, key[:2],
+                            key + ".html.gz")
+
+    def get(self, dict_name, word):
+        """Return the raw bytes of the cached page, or None"""
+        try:
+            with gzip.open(self.path(dict_name, word), "rb") as f:
+                return f.read()
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+            return None
+
+    def put(self, dict_name, word, body):
+        """Store the raw bytes body of the page of word"""
+        path = self.path(dict_name, word)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # unique name, the same word can be stored by two threads at once
+        with NamedTemporaryFile(dir=os.path.dirname(path), suffix=".tmp",
+                                delete=False) as f:
+            try:
+                f.write(gzip.compress(body, self.level))
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, path)
+
+    def __contains__(self, key):
+        return os.path.isfile(self.path(*key))
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Transactional journal of the downloads, stored in SQLite (WAL mode).
+
+Each (dictionary, word, pos) is recorded with its status (pending, done,
+not-found or failed-retryable), its number of attempts and its definition. On
+restart, the words still pending or failed are selected with an index, so
+resuming does not depend on the number of words already downloaded (and the
+list of words is only read again if it has changed). The journal can export the definitions in the
+text format read by clean_definitions.py:
+
+    ./journal.py 1000-words-definitions.db -export 1000-words-definitions.txt
+"""
+
+from downloader import DONE, NOT_FOUND, RETRY
+from threading import Lock
+import argparse
+import sqlite3
+import os
+
+PENDING = "pending" # in the journal but not downloaded yet
+
+DICTS = ["Cam", "Dic", "Col", "Oxf"]
+
+
+class Journal:
+    """
+    Records are buffered and written by batches of <batch_size> in a single
+    transaction (call flush() or close() to write the last ones). Thread-safe.
+    """
+    def __init__(self, filename, batch_size=1000):
+        self.filename   = filename
+        self.batch_size = batch_size
+        self.buffer     = []
+        self.lock       = Lock()
+        self.db = sqlite3.connect(filename, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS words (
+                               dict       TEXT NOT NULL,
+                               word       TEXT NOT NULL,
+                               pos        TEXT NOT NULL,
+                               status     TEXT NOT NULL,
+                               attempts   INTEGER NOT NULL DEFAULT 1,
+                               definition TEXT NOT NULL DEFAULT '',
+                               PRIMARY KEY (dict, pos, word)
+                           ) WITHOUT ROWID""")
+        # only the words still to download are indexed, so the index stays
+        # small and resuming does not read the words already done
+        self.db.execute("""CREATE INDEX IF NOT EXISTS words_todo
+                           ON words (dict, pos, status)
+                           WHERE status IN ('{}', '{}')""".format(PENDING,
+                                                                  RETRY))
+        # files of words added in the journal (to only read them again when
+        # they change)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS sources (
+                               filename TEXT NOT NULL,
+                               pos      TEXT NOT NULL,
+                               mtime    REAL NOT NULL,
+                               size     INTEGER NOT NULL,
+                               words    INTEGER NOT NULL,
+                               PRIMARY KEY (filename, pos)
+                           )""")
+        self.db.commit()
+
+    def record(self, dict_name, word, pos, status, definition=()):
+        """Record the final status of a word (definition is the list of words
+        of its definition)"""
+        with self.lock:
+            self.buffer.append((dict_name, word, pos, status,
+                                " ".join(definition)))
+            if len(self.buffer) >= self.batch_size:
+                self._write()
+
+    def flush(self):
+        with self.lock:
+            self._write()
+
+    def _write(self):
+        if not self.buffer:
+            return
+        with self.db: # one transaction per batch
+            self.db.executemany("""
+                INSERT INTO words (dict, word, pos, status, definition)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (dict, pos, word) DO UPDATE SET
+                    status = excluded.status,
+                    definition = excluded.definition,
+                    attempts = attempts + 1""", self.buffer)
+        self.buffer = []
+
+    def add_words(self, filename, pos="all"):
+        """Add the words of filename (one per line) as pending in all the
+        dictionaries, except the ones already in the journal. Nothing is done
+        if filename has not changed since the last call. Return True if the
+        file has been read."""
+        stat = os.stat(filename)
+        key = (os.path.abspath(filename), pos)
+        row = self.db.execute("""SELECT mtime, size FROM sources
+                                 WHERE filename = ? AND pos = ?""",
+                              key).fetchone()
+        if row == (stat.st_mtime, stat.st_size):
+            return False
+
+        self.flush()
+        with open(filename) as f:
+            words = sorted({line.strip() for line in f})
+        with self.db:
+            # inserted in the order of the primary key, much faster
+            self.db.executemany("""
+                INSERT OR IGNORE INTO words (dict, word, pos, status, attempts)
+                VALUES (?, ?, ?, ?, 0)""",
+                ((d, w, pos, PENDING) for d in sorted(DICTS) for w in words))
+            self.db.execute("""INSERT OR REPLACE INTO sources
+                               VALUES (?, ?, ?, ?, ?)""",
+                            key + (stat.st_mtime, stat.st_size, len(words)))
+        return True
+
+    def todo(self, dict_name, pos="all"):
+        """Return the list of words of dict_name to download (pending, or
+        failed in a previous run)"""
+        self.flush()
+        cur = self.db.execute("""SELECT word FROM words INDEXED BY words_todo
+                                 WHERE dict = ? AND pos = ? AND
+                                 status IN ('{}', '{}')""".format(PENDING,
+                                                                  RETRY),
+                              (dict_name, pos))
+        return [w for (w,) in cur]
+
+    def finished(self, pos="all"):
+        """Iterate over the (dict_name, word, status, definition) of the words
+        done or not found"""
+        self.flush()
+        return self.db.execute("""SELECT dict, word, status, definition
+                                  FROM words WHERE pos = ? AND
+                                  status IN (?, ?)""", (pos, DONE, NOT_FOUND))
+
+    def size(self, filename, pos="all"):
+        """Number of words of filename (added with add_words())"""
+        row = self.db.execute("""SELECT words FROM sources WHERE filename = ?
+                                 AND pos = ?""", (os.path.abspath(filename),
+                                                  pos)).fetchone()
+        return row[0] if row else 0
+
+    def counts(self, pos="all"):
+        """Return {dict_name: {status: number of words}}"""
+        self.flush()
+        res = {}
+        for dict_name, status, n in self.db.execute("""
+                SELECT dict, status, COUNT(*) FROM words WHERE pos = ?
+                GROUP BY dict, status""", (pos,)):
+            res.setdefault(dict_name, {})[status] = n
+        return res
+
+    def export(self, filename, pos="all"):
+        """Write the definitions in filename with the format of the output
+        of download_definitions.py. Return the number of lines written."""
+        self.flush()
+        n = 0
+        with open(filename, "w") as of:
+            for dict_name, word, definition in self.db.execute("""
+                    SELECT dict, word, definition FROM words
+                    WHERE pos = ? AND status = ?""", (pos, DONE)):
+                of.write("{} {} {}\n".format(dict_name, word, definition))
+                n += 1
+        return n
+
+    def import_text(self, filename, pos="all"):
+        """Record the definitions of a file written by download_definitions.py
+        (without journal) as done. Return the number of lines read."""
+        n = 0
+        with open(filename) as f:
+            for line in f:
+                line = line.split()
+                if len(line) < 2:
+                    continue
+                self.record(line[0], line[1], pos, DONE, line[2:])
+                n += 1
+        self.flush()
+        return n
+
+    def close(self):
+        self.flush()
+        self.db.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect a download journal.")
+    parser.add_argument("journal", metavar="FILE", help="Journal (.db) file.")
+    parser.add_argument("-pos", type=str.lower, default="all", help="""POS of
+        the definitions (default: all).""")
+    parser.add_argument("-export", metavar="OUT", help="""Write the downloaded
+        definitions in OUT (format read by clean_definitions.py).""")
+    parser.add_argument("-import", dest="import_fn", metavar="DEFS",
+        help="""Record the definitions of DEFS (output of
+        download_definitions.py) as done.""")
+    args = parser.parse_args()
+
+    journal = Journal(args.journal)
+    if args.import_fn:
+        n = journal.import_text(args.import_fn, args.pos)
+        print("Imported {} definitions from {}".format(n, args.import_fn))
+    if args.export:
+        n = journal.export(args.export, args.pos)
+        print("Exported {} definitions in {}".format(n, args.export))
+
+    for dict_name, statuses in sorted(journal.counts(args.pos).items()):
+        print("{}  {}".format(dict_name, "  ".join("{}: {}".format(s, n)
+              for s, n in sorted(statuses.items()))))
+    journal.close()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Load test of download_definitions.py against the local mock server.
+
+Each configuration (engine, number of threads or concurrency, initial rate)
+runs the full downloader in its own process against a MockServer, then the
+throughput, the latency of the requests and the number of lost definitions
+(words which have a page on the server but are missing from the output) are
+reported. For example, to choose the number of threads of the default engine:
+
+    ./load_test.py -engine threads -threads 3 6 12 24 -latency 0.2 -max-rate 100
+"""
+
+from multiprocessing import Process, Queue
+from queue import Empty
+from mock_server import DICTS, add_server_arguments, server_from_args, \
+                        not_found
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+
+def percentile(values, p):
+    """p-th percentile of values (nearest rank)"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+def run_downloader(url, words_fn, config, results):
+    """Run download_definitions.main() with config, in a child process (the
+    downloader uses global variables, so each run needs a fresh process)"""
+    import downloader
+    import async_downloader
+    import download_definitions
+
+    for dict_name in DICTS:
+        downloader.URLS[dict_name] = url + dict_name + "/"
+
+    # measure the latency of each request (rate limiter waits excluded)
+    latencies = []
+    download_word = download_definitions.download_word
+    fetch_definition = async_downloader.fetch_definition
+
+    def timed_download_word(*args, **kwargs):
+        start = time.perf_counter()
+        res = download_word(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        return res
+
+    async def timed_fetch_definition(*args, **kwargs):
+        start = time.perf_counter()
+        res = await fetch_definition(*args, **kwargs)
+        latencies.append(time.perf_counter() - start)
+        return res
+
+    download_definitions.download_word = timed_download_word
+    async_downloader.fetch_definition = timed_fetch_definition
+
+    sys.stdout = open(os.devnull, "w")
+    start = time.perf_counter()
+    download_definitions.main(words_fn, use_async=config["engine"] == "async",
+                              concurrency=config["concurrency"],
+                              nb_thread=config["threads"],
+                              rate=config["rate"],
+                              max_attempts=config["max_attempts"])
+    elapsed = time.perf_counter() - start
+
+    results.put({
+        "elapsed": elapsed,
+        "latencies": latencies,
+        "given_up": sum(download_definitions.failed_counter.values()),
+    })
+
+
+def wait_result(p, results, timeout):
+    """Return the report sent by the child process p in results. Raise
+    RuntimeError if p exits without sending it or is still running after
+    timeout seconds (it is then killed)."""
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return results.get(timeout=1.0)
+        except Empty:
+            pass
+        if not p.is_alive():
+            # the report may have been sent just before the exit
+            try:
+                return results.get(timeout=1.0)
+            except Empty:
+                raise RuntimeError("downloader exited with code {} without "
+                                   "report".format(p.exitcode))
+        if time.monotonic() > deadline:
+            p.terminate()
+            raise RuntimeError("downloader still running after {:.0f} "
+                               "sec".format(timeout))
+
+
+def run_config(server, words, config, timeout=600):
+    """Run one configuration, return its report. Raise RuntimeError if the
+    downloader fails or takes more than timeout seconds."""
+    with tempfile.TemporaryDirectory() as tmp:
+        words_fn = os.path.join(tmp, "words.txt")
+        with open(words_fn, "w") as f:
+            f.write("\n".join(words) + "\n")
+
+        before = sum(server.codes.values())
+        codes_before = server.codes.copy()
+        results = Queue()
+        p = Process(target=run_downloader,
+                    args=(server.url, words_fn, config, results))
+        p.start()
+        try:
+            res = wait_result(p, results, timeout)
+        finally:
+            p.join()
+
+        fetched = set()
+        with open(os.path.join(tmp, "words-definitions.txt")) as f:
+            for line in f:
+                line = line.split()
+                if len(line) >= 2:
+                    fetched.add((line[0], line[1]))
+
+    codes = server.codes - codes_before
+    expected = {(d, w) for d in DICTS for w in words
+                if not not_found(w, server.not_found_rate)}
+    requests = sum(server.codes.values()) - before
+    lat = res["latencies"]
+    return dict(config,
+        seconds=res["elapsed"],
+        requests=requests,
+        requests_per_sec=requests / res["elapsed"],
+        words_per_sec=len(words) * len(DICTS) / res["elapsed"],
+        p50_ms=percentile(lat, 50) * 1000,
+        p95_ms=percentile(lat, 95) * 1000,
+        p99_ms=percentile(lat, 99) * 1000,
+        max_ms=max(lat, default=0) * 1000,
+        throttled=sum(n for (d, c), n in codes.items() if c == 429),
+        errors=sum(n for (d, c), n in codes.items() if c in (0, 503)),
+        given_up=res["given_up"],
+        lost=len(expected - fetched),
+    )
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Load test of the "
+                                     "downloader against the mock server.")
+    parser.add_argument("-words", metavar="FILE", help="""File with the words
+        to download, one per line (default: -n generated words).""")
+    parser.add_argument("-n", type=int, default=500, help="""Number of
+        generated words (default: 500).""")
+    parser.add_argument("-engine", nargs="+", choices=["threads", "async"],
+        default=["threads", "async"], help="Engines to test (default: both).")
+    parser.add_argument("-threads", type=int, nargs="+", default=[3, 12],
+        help="Numbers of threads per dictionary to test (default: 3 12).")
+    parser.add_argument("-concurrency", type=int, nargs="+", default=[8, 32],
+        help="Concurrency values to test with async (default: 8 32).")
+    parser.add_argument("-rate", type=float, nargs="+", default=[10.0],
+        help="Initial rates (requests/sec/dictionary) to test (default: 10).")
+    parser.add_argument("-max-attempts", type=int, default=5, help="""Number
+        of attempts before giving up a word (default: 5).""")
+    parser.add_argument("-timeout", type=float, default=600, help="""Maximum
+        time in seconds of one configuration, a downloader still running
+        after it is stopped (default: 600).""")
+    parser.add_argument("-json", metavar="FILE", help="""Also write the
+        reports in FILE (one JSON object per line).""")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if args.words:
+        with open(args.words) as f:
+            words = sorted({line.strip() for line in f if line.strip()})
+    else:
+        words = ["word{}".format(i) for i in range(args.n)]
+
+    configs = []
+    for engine in args.engine:
+        values = args.threads if engine == "threads" else args.concurrency
+        for value in values:
+            for rate in args.rate:
+                configs.append({"engine": engine, "threads": value,
+                                "concurrency": value, "rate": rate,
+                                "max_attempts": args.max_attempts})
+
+    server = server_from_args(args).start()
+    print("{} words x {} dictionaries, server latency {:.0f} ms".format(
+          len(words), len(DICTS), args.latency * 1000))
+    print("{:<8} {:>5} {:>6} {:>8} {:>8} {:>7} {:>7} {:>7} {:>6} {:>6} "
+          "{:>5}".format("engine", "conc", "rate", "words/s", "req/s", "p50ms",
+                         "p95ms", "p99ms", "429", "errors", "lost"))
+    print("=" * 84)
+
+    reports = []
+    for config in configs:
+        try:
+            r = run_config(server, words, config, args.timeout)
+        except RuntimeError as e:
+            print("{:<8} {:>5} {:>6.0f}   FAILED: {}".format(
+                  config["engine"], config["threads"], config["rate"], e),
+                  flush=True)
+            continue
+        reports.append(r)
+        print("{:<8} {:>5} {:>6.0f} {:>8.1f} {:>8.1f} {:>7.0f} {:>7.0f} "
+              "{:>7.0f} {:>6} {:>6} {:>5}".format(
+              r["engine"], r["threads"], r["rate"], r["words_per_sec"],
+              r["requests_per_sec"], r["p50_ms"], r["p95_ms"], r["p99_ms"],
+              r["throttled"], r["errors"], r["lost"]), flush=True)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            for r in reports:
+                f.write(json.dumps(r) + "\n")
+    server.shutdown()
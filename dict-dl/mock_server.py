@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Local stand-in for the 4 dictionary websites.
+
+A page is served for each /<dict_name>/<word> (dict_name is Cam, Dic, Col or
+Oxf), with the markup expected by the parsers of parsers.py, or read from a
+directory of stored pages. The behavior of the servers can be configured:
+latency of each response, rate of 5xx errors and of connection resets, rate
+of words not found and maximum number of requests per second per dictionary
+(above it, the server answers 429 with a Retry-After header).
+
+Used by load_test.py to measure the downloader without hitting the real
+websites. Can also be run alone:
+
+    ./mock_server.py -port 8000 -latency 0.2 -error-rate 0.01 -max-rate 50
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import unquote
+from threading import Lock, Thread
+from collections import Counter
+from bench_parsers import load_pages
+import argparse
+import random
+import time
+import zlib
+
+DICTS = ["Cam", "Dic", "Col", "Oxf"]
+
+# one template per dictionary, with a noun block and a verb block. {w} is
+# replaced by the word, {pad} by some content not containing definitions so
+# the pages have a realistic size.
+TEMPLATES = {
+    "Cam": '<html><body>{pad}'
+           '<div class="entry-body__el clrd"><span class="pos dpos">noun</span>'
+           '<b class="def">a small piece of {w} used in a <a href="/x">lamp'
+           '</a></b><b class="def">the {w} of a candle</b></div>'
+           '<div class="entry-body__el clrd"><span class="pos dpos">verb</span>'
+           '<b class="def">to draw {w} up by capillary action</b></div>'
+           '{pad}</body></html>',
+    "Dic": '<html><body>{pad}'
+           '<section class="css-171jvig e1hk9ate0"><span class="luna-pos">noun'
+           '</span><span class="one-click-content css-1e3ziqc e1q3nk1v4">a '
+           'bundle of loosely twisted {w} fibers <span class="luna-example">'
+           'the {w} of a lamp</span></span></section>'
+           '<section class="css-171jvig e1hk9ate0"><span class="luna-pos">verb'
+           '</span><span class="one-click-content css-1e3ziqc e1q3nk1v4">to '
+           'draw off liquid by {w} action</span></section>'
+           '{pad}</body></html>',
+    "Col": '<html><body>{pad}'
+           '<div class="content definitions cobuild br">'
+           '<div class="hom"><span class="pos">countable noun</span>'
+           '<div class="def">The {w} of a candle is the piece of string\n'
+           'in it</div></div>'
+           '<div class="hom"><span class="pos">verb transitive</span>'
+           '<div class="def">to move liquid like a {w}</div></div>'
+           '<div class="div copyright">{pad}</body></html>',
+    "Oxf": '<html><body>{pad}'
+           '<section class="gramb"><span class="pos">noun</span>'
+           '<span class="ind">A strip of porous {w} material</span></section>'
+           '<section class="gramb"><span class="pos">verb</span>'
+           '<span class="ind">Absorb or draw off liquid as a {w} does</span>'
+           '</section>{pad}</body></html>',
+}
+
+
+def not_found(word, rate):
+    """Decide if word is missing from the dictionaries. The decision only
+    depends on the word, so it is the same for all requests and runs."""
+    return zlib.crc32(word.encode("utf-8")) % 10000 < rate * 10000
+
+
+class MockServer(ThreadingHTTPServer):
+    """HTTP server simulating the 4 dictionaries. All the rates are fractions
+    of the requests (between 0 and 1)."""
+    daemon_threads = True
+    request_queue_size = 128 # listen() backlog, the default 5 drops SYNs
+
+    def __init__(self, address=("127.0.0.1", 0), latency=0.1, jitter=0.5,
+                 error_rate=0.0, reset_rate=0.0, not_found_rate=0.0,
+                 max_rate=0.0, page_size=50000, pages_dir=None, seed=0):
+        ThreadingHTTPServer.__init__(self, address, Handler)
+        self.latency        = latency
+        self.jitter         = jitter
+        self.error_rate     = error_rate
+        self.reset_rate     = reset_rate
+        self.not_found_rate = not_found_rate
+        self.pad            = "<div>" + "x" * max(0, page_size // 2) + "</div>"
+        self.random         = random.Random(seed)
+        self.lock           = Lock()
+        self.codes          = Counter() # (dict_name, status code) -> count
+
+        # one token bucket per dictionary: a request without token is
+        # throttled (and does not consume any token)
+        self.max_rate = max_rate
+        self.buckets  = {d: [max(1.0, max_rate), time.monotonic()]
+                         for d in DICTS}
+
+        # stored pages are served in turn, whatever the word
+        self.pages = {}
+        if pages_dir is not None:
+            self.pages = {d: load_pages(pages_dir, d) for d in DICTS}
+
+    @property
+    def url(self):
+        return "http://{}:{}/".format(*self.server_address)
+
+    def page(self, dict_name, word):
+        pages = self.pages.get(dict_name)
+        if pages:
+            return pages[zlib.crc32(word.encode("utf-8")) % len(pages)]
+        return TEMPLATES[dict_name].format(w=word, pad=self.pad).encode("utf-8")
+
+    def admit(self, dict_name):
+        """Return False if the request is above max_rate"""
+        if self.max_rate <= 0:
+            return True
+        with self.lock:
+            bucket = self.buckets[dict_name]
+            now = time.monotonic()
+            bucket[0] = min(max(1.0, self.max_rate),
+                            bucket[0] + (now - bucket[1]) * self.max_rate)
+            bucket[1] = now
+            if bucket[0] < 1:
+                return False
+            bucket[0] -= 1
+            return True
+
+    def decide(self, dict_name, word):
+        """Return the status code of the answer to a request (0 means the
+        connection is reset without answer)"""
+        with self.lock:
+            r = self.random.random()
+        if not self.admit(dict_name):
+            return 429
+        if r < self.reset_rate:
+            return 0
+        if r < self.reset_rate + self.error_rate:
+            return 503
+        if not_found(word, self.not_found_rate):
+            return 404
+        return 200
+
+    def delay(self):
+        with self.lock:
+            j = self.random.uniform(-self.jitter, self.jitter)
+        return max(0.0, self.latency * (1 + j))
+
+    def count(self, dict_name, code):
+        with self.lock:
+            self.codes[dict_name, code] += 1
+
+    def start(self):
+        """Serve in a background thread"""
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive connections
+    # the headers and the body are sent by two writes, with Nagle's algorithm
+    # the body waits for the (delayed) ACK of the headers
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        parts = self.path.strip("/").split("/", 1)
+        if len(parts) != 2 or parts[0] not in DICTS:
+            self.answer(404, b"")
+            return
+        dict_name, word = parts[0], unquote(parts[1])
+
+        code = server.decide(dict_name, word)
+        time.sleep(server.delay())
+        server.count(dict_name, code)
+
+        if code == 0:
+            self.close_connection = True
+            self.connection.close()
+        elif code == 200:
+            self.answer(200, server.page(dict_name, word))
+        elif code == 429:
+            self.answer(429, b"", {"Retry-After": "1"})
+        else:
+            self.answer(code, b"")
+
+    def answer(self, code, body, headers={}):
+        self.send_response(code)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def add_server_arguments(parser):
+    """Options describing the behavior of the server (shared with
+    load_test.py)"""
+    parser.add_argument("-latency", type=float, default=0.1, help="""Average
+        time in seconds before answering a request (default: 0.1).""")
+    parser.add_argument("-jitter", type=float, default=0.5, help="""Latency
+        is uniformly drawn in latency * (1 +/- jitter) (default: 0.5).""")
+    parser.add_argument("-error-rate", type=float, default=0.0, help="""
+        Fraction of requests answered with a 503 error (default: 0).""")
+    parser.add_argument("-reset-rate", type=float, default=0.0, help="""
+        Fraction of requests whose connection is closed without answer
+        (default: 0).""")
+    parser.add_argument("-not-found-rate", type=float, default=0.0, help="""
+        Fraction of words without page (404) (default: 0).""")
+    parser.add_argument("-max-rate", type=float, default=0.0, help="""Maximum
+        number of requests per second per dictionary, above it requests are
+        answered with 429 (default: 0, no limit).""")
+    parser.add_argument("-page-size", type=int, default=50000, help="""Size
+        in bytes of the generated pages (default: 50000).""")
+    parser.add_argument("-pages", metavar="DIR", help="""Serve the pages
+        stored in DIR/<dict_name>/ (a -cache directory or HTML fixtures)
+        instead of generated pages.""")
+
+
+def server_from_args(args, port=0):
+    return MockServer(("127.0.0.1", port), args.latency, args.jitter,
+                      args.error_rate, args.reset_rate, args.not_found_rate,
+                      args.max_rate, args.page_size, args.pages)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local stand-in for the "
+                                     "dictionary websites.")
+    parser.add_argument("-port", type=int, default=8000, help="""Port to
+        listen on (default: 8000).""")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = server_from_args(args, args.port)
+    print("Serving on {} (pages at {}<Cam|Dic|Col|Oxf>/<word>)".format(
+          server.url, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Extract the definitions from the HTML pages of each dictionary.
+
+Parsing is independent of fetching: a parser takes the HTML of a page,
+whether it has just been downloaded or read from an HTMLCache. There is one
+parser object per dictionary in PARSERS. All the regexes are compiled once,
+when the class is created, and POS blocks are searched in place (with the pos
+and endpos arguments of the patterns) instead of being copied into slices.
+"""
+
+from abc import ABC, abstractmethod
+import re
+
+POS = ["adjective", "noun", "verb"]
+
+# need to clean definitions of <a> and <span> tags. Use cleaner to replace
+# these tags by empty string
+CLEANER = re.compile('<.+?>', re.I|re.S)
+
+# registry of the parsers, dict_name -> parser object
+PARSERS = {}
+
+def register(cls):
+    """Class decorator adding an instance of a parser to PARSERS"""
+    PARSERS[cls.name] = cls()
+    return cls
+
+
+class Parser(ABC):
+    """Base class of the parsers. Subclasses define name and extract()."""
+    name = None
+
+    def parse(self, html, pos="all"):
+        """Return the list of definitions of the page html. If pos is noun,
+        verb or adjective, only return the definitions of this POS."""
+        if pos not in POS:
+            pos = "all"
+        return self.extract(html, pos)
+
+    @abstractmethod
+    def extract(self, html, pos):
+        """Return the list of definitions of the page html for pos (noun,
+        verb, adjective or all)."""
+
+
+def block_spans(block_pat, html, pos=0, endpos=None):
+    """Some pages have no ending regex for their blocks, so a block goes from
+    one match of block_pat to the next one. The last block goes to endpos."""
+    endpos = len(html) if endpos is None else endpos
+    idx = [m.start() for m in block_pat.finditer(html, pos, endpos)] + [endpos]
+    return [(idx[i], idx[i+1]) for i in range(len(idx)-1)]
+
+
+@register
+class CambridgeParser(Parser):
+    name = "Cam"
+
+    # definitions are in a <b> tag that has the class "def"
+    defs_pat = re.compile('<b class="def">(.*?)</b>', re.I|re.S)
+
+    # each type entry (adj, noun or verb) is in a "entry-body__el" block. A
+    # word might have many blocks (if it is both a noun and a verb, it will
+    # have 2 blocks). Moreover, there are also different blocks for British or
+    # American language.
+    block_pat = re.compile('<div class="entry-body__el ', re.I|re.S)
+    pos_pat = re.compile('class="pos".*?>(.*?)</span>', re.I|re.S)
+
+    def extract(self, html, pos):
+        if pos == "all":
+            defs = self.defs_pat.findall(html)
+        else:
+            defs = []
+            for start, end in block_spans(self.block_pat, html):
+                pos_extracted = self.pos_pat.search(html, start, end)
+
+                # some words (like mice) do not have a pos info, so no pos
+                # extracted
+                if pos_extracted is None or pos_extracted.group(1) != pos:
+                    continue
+
+                defs += self.defs_pat.findall(html, start, end)
+
+        return [ CLEANER.sub('', x) for x in defs ]
+
+
+@register
+class DictionaryParser(Parser):
+    name = "Dic"
+
+    # definitions are in <section> tags with class "css-171jvig". Each POS
+    # type has its own <section>.
+    block_pat = re.compile('<section class="css-171jvig(.*?)</section>',
+                           re.I|re.S)
+
+    # inside each block, definitions are in <span> tags with the class
+    # "css-1e3ziqc". Sometimes there is another class, so use the un-greedy
+    # regex pattern .+? to go until the closing '>' of the opening <span> tag.
+    defs_pat = re.compile('<span class=".+?css-1e3ziqc.+?>(.*?)</span>',
+                          re.I|re.S)
+
+    # .+ because class is either luna-pos or pos
+    pos_pat = re.compile('class=.+pos">(.*?)</span>', re.I|re.S)
+
+    # possible sentence examples at the end of a definition
+    example_pat = re.compile('<span class="luna-example.+$')
+
+    def extract(self, html, pos):
+        if pos == "all":
+            defs = self.defs_pat.findall(" ".join(self.block_pat.findall(html)))
+        else:
+            defs = []
+            for block in self.block_pat.findall(html):
+                pos_extracted = self.pos_pat.search(block)
+
+                # some words (like cia) do not have a pos info so no pos
+                # extracted
+                if pos_extracted is None or pos not in pos_extracted.group(1):
+                    continue
+
+                defs += self.defs_pat.findall(block)
+
+        # remove possible sentence examples in definitions and possible non
+        # informative labels (like "Archaic" in one of the definition of
+        # "wick"). Use .strip() to also clean some \r or \n.
+        return [ CLEANER.sub('', self.example_pat.sub('', x)).strip()
+                 for x in defs if "luna-label" not in x ]
+
+
+@register
+class CollinsParser(Parser):
+    name = "Col"
+
+    # definitions are in big blocks <div class="content definitions [...] >
+    # Use the next <div> with "copyright" for ending regex.
+    block_pat = re.compile('<div class="content definitions.+?"(.*?)'
+                           '<div class="div copyright', re.I|re.S)
+
+    # inside this block, definitions are in <div class="def">...</div>
+    defs_pat = re.compile('<div class="def">(.+?)</div>', re.I|re.S)
+
+    # each sense of the word is inside a <div class="hom">
+    sense_pat = re.compile('<div class="hom">', re.I|re.S)
+    pos_pat = re.compile('class="pos">(.*?)</span>', re.I|re.S)
+
+    def extract(self, html, pos):
+        blocks = " ".join(self.block_pat.findall(html))
+
+        if pos == "all":
+            defs = self.defs_pat.findall(blocks)
+        else:
+            defs = []
+            for start, end in block_spans(self.sense_pat, blocks):
+                pos_extracted = self.pos_pat.search(blocks, start, end)
+
+                # sometimes, sense is just a sentence or an idiom, so no pos
+                # extracted. noun is sometimes written as "countable noun",
+                # "verb" as "verb transitive", so use `in` to match them.
+                if pos_extracted is None or pos not in pos_extracted.group(1):
+                    continue
+
+                defs += self.defs_pat.findall(blocks, start, end)
+
+        # replace \n because sometimes there are \n inside a sentence
+        return [CLEANER.sub('', x).replace('\n', ' ').strip() for x in defs]
+
+
+@register
+class OxfordParser(Parser):
+    name = "Oxf"
+
+    # extract blocks containing POS type and definitions. For example, if
+    # word is both a noun and a verb, there is one <section class="gramb">
+    # block for the noun definitions, and another for the verb definitions
+    block_pat = re.compile('<section class="gramb">(.*?)</section>', re.I|re.S)
+
+    # inside these blocks, definitions are in <span class="ind">
+    defs_pat = re.compile('<span class="ind">(.*?)</span>', re.I|re.S)
+    pos_pat = re.compile('class="pos">(.*?)</span>', re.I|re.S)
+
+    def extract(self, html, pos):
+        if pos == "all":
+            defs = self.defs_pat.findall("".join(self.block_pat.findall(html)))
+        else:
+            defs = []
+            for block in self.block_pat.findall(html):
+                if self.pos_pat.search(block).group(1) != pos:
+                    continue
+                defs += self.defs_pat.findall(block)
+
+        return [ CLEANER.sub('', x) for x in defs ]
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Download definitions and generate the strong and weak pairs in a single
+run: the definitions of a word are cleaned as soon as all the dictionaries
+are done with it, and its pairs are classified right away (see PairBuilder),
+so the definitions file does not need to be read again once the download is
+over. The embedding used for the artificial strong pairs is loaded during
+the download. The output files are the ones of the batch scripts:
+
+    ./download_definitions.py 1000-words.txt
+    ./clean_definitions.py -d 1000-words-definitions.txt -v vocab.txt
+    ./generate_pairs.py -d all-definitions-cleaned.txt -e vectors.vec -K 5
+
+is the same as
+
+    ./pipeline.py 1000-words.txt -vocab vocab.txt -embedding vectors.vec -K 5
+"""
+
+from queue import Queue, Empty
+from threading import Thread
+from downloader import DONE
+from cleaner import keep_words
+from clean_definitions import flatten, load_vocabulary
+from generate_pairs import PairBuilder, loadEmbedding, subEmbedding, \
+                           write_pairs, pairs_filenames, print_stats
+import download_definitions
+import argparse
+import time
+import os
+
+CLEANED_FN = "all-definitions-cleaned.txt" # same as clean_definitions.py
+
+
+class ThreadPairs(Thread):
+    """
+    Thread receiving the results of the download (put()). The results are
+    regrouped by word, and once all the dictionaries are done with a word, its
+    definitions are cleaned, written in the cleaned definitions file and
+    given to a PairBuilder. Every <checkpoint> seconds, the cleaned file is
+    flushed and the pairs classified so far are written (without the
+    artificial strong pairs) in the pairs files followed by ".partial": the
+    final files are only written by main(), once all the pairs are known. It
+    stops when it gets None.
+    """
+    def __init__(self, vocabulary, strg_fn, weak_fn, K, checkpoint=60.0):
+        Thread.__init__(self)
+        self.vocabulary = vocabulary # None to keep all the words
+        self.strg_fn    = strg_fn
+        self.weak_fn    = weak_fn
+        self.K          = K
+        self.checkpoint = checkpoint
+        self.queue      = Queue()
+        self.results    = {} # word -> {dict_name: definition or None}
+        self.nb_dicts   = len(download_definitions.request_counter)
+        self.builder    = PairBuilder()
+        self.of = open(CLEANED_FN, "w", buffering=1 << 20)
+
+    def put(self, dict_name, word, status, result):
+        """Called by the downloader for each word done in a dictionary"""
+        self.queue.put((dict_name, word, status, result))
+
+    def run(self):
+        last_checkpoint = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.checkpoint)
+            except Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                self.add(*item)
+
+            if time.monotonic() - last_checkpoint >= self.checkpoint:
+                self.save()
+                last_checkpoint = time.monotonic()
+
+        # the download is over, no other result will come for the words not
+        # done in all the dictionaries (pages missing from the cache with
+        # -offline)
+        for word in list(self.results):
+            self.complete(word)
+        self.builder.finish()
+        self.of.close()
+
+    def add(self, dict_name, word, status, result):
+        if word in self.builder.done: # already given by a previous run
+            return
+        definitions = self.results.setdefault(word, {})
+        definitions[dict_name] = result if status == DONE else None
+        if len(definitions) == self.nb_dicts:
+            self.complete(word)
+
+    def complete(self, word):
+        definitions = [d for d in self.results.pop(word).values()
+                       if d is not None]
+        if not definitions:
+            self.builder.add(word, None)
+            return
+
+        # same as clean_definitions.py
+        words = keep_words(flatten(definitions), self.vocabulary)
+        self.of.write("%s %s\n" % (word, ' '.join(words)))
+        self.builder.add(word, words)
+
+    def save(self):
+        self.of.flush()
+        write_pairs(self.builder.strong, self.builder.weak, self.strg_fn,
+                    self.weak_fn, self.K, suffix=".partial")
+
+
+class ThreadEmbedding(Thread):
+    """Thread loading the embeddings of list_words (see loadEmbedding())"""
+    def __init__(self, filename, list_words):
+        Thread.__init__(self, daemon=True)
+        self.filename   = filename
+        self.list_words = list_words
+        self.result     = None
+
+    def run(self):
+        self.result = loadEmbedding(self.filename, self.list_words,
+                                    verbose=False)
+
+
+def main(filename, vocab_fn, embedding_fn, strg_fn, weak_fn, K, checkpoint,
+         **download_args):
+    globalStart = time.time()
+    vocabulary = load_vocabulary(vocab_fn) if vocab_fn else None
+
+    # the pairs only contain words of the list and of the vocabulary, so
+    # their embeddings can be loaded before knowing the definitions. Without
+    # vocabulary, any word can be in a definition: the embedding is loaded
+    # at the end.
+    loader = None
+    if K > 0 and vocabulary is not None:
+        list_words = load_vocabulary(filename) | vocabulary
+        loader = ThreadEmbedding(embedding_fn, list_words)
+        loader.start()
+
+    pairs = ThreadPairs(vocabulary, strg_fn, weak_fn, K, checkpoint)
+    pairs.start()
+    download_definitions.main(filename, on_result=pairs.put, **download_args)
+    pairs.queue.put(None)
+    pairs.join()
+    downloadEnd = time.time()
+
+    builder = pairs.builder
+    print("\n-- Definitions cleaned in \"{}\"".format(CLEANED_FN))
+    print("   Entries:\t{}".format(len(builder.dictionary)))
+    print("   Uniq words:\t{}".format(len(builder.uniq_words)))
+
+    if K > 0:
+        print("\n-- Loading embedding from \"{}\"".format(embedding_fn))
+        if loader is not None:
+            loader.join()
+        if loader is not None and builder.uniq_words <= loader.list_words:
+            embedding, numToWords, wordsToNum = subEmbedding(
+                *loader.result[:2], builder.uniq_words)
+        else: # words from a journal shared with another list of words
+            embedding, numToWords, wordsToNum = loadEmbedding(
+                embedding_fn, builder.uniq_words)
+
+        print("\n-- Generating artificial strong pairs")
+        builder.add_neighbours(embedding, numToWords, wordsToNum, K)
+
+    print("\n\n-- Writing pairs")
+    write_pairs(builder.strong, builder.weak, strg_fn, weak_fn, K)
+    for fn in pairs_filenames(strg_fn, weak_fn, K, ".partial"):
+        if os.path.isfile(fn): # no checkpoint if the download was short
+            os.remove(fn)
+    print_stats(builder.strong, builder.weak)
+    print("\nTotal time: {:.2f} sec ({:.2f} sec after the download)".format(
+          time.time() - globalStart, time.time() - downloadEnd))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="""Download definitions and
+        generate strong & weak pairs in a single run.""")
+    parser.add_argument("list_words", metavar="list-words",
+        help="""File containing a list of words (one per line). The script will
+        download the definitions for each word.""")
+    parser.add_argument("-vocab", help="""File containing a list of words.
+        The words of the definitions which are not in this vocab are
+        removed.""", default="")
+    parser.add_argument("-embedding", help="""File containing words
+        embeddings, used to compute the K closest neighbours (required if K is
+        not 0).""")
+    parser.add_argument("-K", help="""Number of artificially generated strong
+        pairs for each real strong pairs (default: 5).""", default=5, type=int)
+    parser.add_argument("-strong-file", help="""Filename where the strong pairs
+        will be saved (default: strong-pairs).""", default="strong-pairs")
+    parser.add_argument("-weak-file", help="""Filename where the weak pairs
+        will be saved (default: weak-pairs).""", default="weak-pairs")
+    parser.add_argument("-checkpoint", type=float, default=60.0, help="""
+        Number of seconds between two writes of the cleaned definitions and of
+        the pairs found so far (default: 60).""")
+    download_definitions.add_download_arguments(parser)
+    args = parser.parse_args()
+    download_definitions.check_download_arguments(parser, args)
+    if args.K > 0 and args.embedding is None:
+        parser.error("-embedding is required when K is not 0")
+
+    main(args.list_words, args.vocab, args.embedding, args.strong_file,
+         args.weak_file, args.K, args.checkpoint, pos=args.pos,
+         use_async=args.use_async, concurrency=args.concurrency,
+         rate=args.rate, max_attempts=args.max_attempts, cache_dir=args.cache,
+         offline=args.offline, workers=args.workers, nb_thread=args.threads,
+         journal_fn=args.journal)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+from collections import deque
+from threading import Lock
+import random
+import time
+
+
+class RateLimiter:
+    """
+    Token bucket limiting the number of requests per second sent to a
+    dictionary. The rate adapts to the answers of the server: it increases
+    after each success, proportionally to the current rate, and it is halved
+    (at most once per second) when the server asks us to slow down (429 or
+    Retry-After header) or when more than error_rate of the last <window>
+    requests failed (5xx or timeout). An isolated failure does not change the
+    rate, the request is only retried later (see backoff()). If the server
+    gives a Retry-After delay, no request is sent before this delay.
+    Thread-safe, and usable from asyncio: reserve() only computes the time to
+    wait, the caller decides how to sleep.
+    """
+    def __init__(self, rate=10.0, min_rate=0.5, max_rate=200.0, increase=0.05,
+                 growth=0.01, window=50, error_rate=0.2):
+        self.rate         = rate
+        self.min_rate     = min_rate
+        self.max_rate     = max_rate
+        self.increase     = increase # minimum increase after a success
+        self.growth       = growth # increase as a fraction of the rate
+        self.error_rate   = error_rate
+        self.outcomes     = deque(maxlen=window) # True for a failure
+        self.tokens       = 1.0
+        self.last         = time.monotonic()
+        self.last_cut     = 0.0
+        self.paused_until = 0.0
+        self.throttled    = 0 # number of throttle events, for stats
+        self.lock         = Lock()
+
+    def reserve(self):
+        """Take one token. Return the number of seconds to wait before
+        sending the request."""
+        with self.lock:
+            now = time.monotonic()
+            burst = max(1.0, self.rate)
+            self.tokens = min(burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+
+            # negative tokens are a debt, paid at the current rate
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return max(wait, self.paused_until - now)
+
+    def success(self):
+        with self.lock:
+            self.outcomes.append(False)
+            self.rate = min(self.max_rate, self.rate +
+                            max(self.increase, self.rate * self.growth))
+
+    def failure(self, retry_after=None):
+        """Record a failed request. retry_after is None if the server did not
+        ask to slow down (5xx without Retry-After, timeout, reset), else the
+        delay it asked for (0 for a 429 without Retry-After)."""
+        with self.lock:
+            now = time.monotonic()
+            self.outcomes.append(True)
+
+            if retry_after is not None:
+                self.throttled += 1
+                self.paused_until = max(self.paused_until, now + retry_after)
+                self.cut(now)
+            elif (len(self.outcomes) * 2 >= self.outcomes.maxlen and
+                  sum(self.outcomes) > self.error_rate * len(self.outcomes)):
+                # the server is failing, not just a few unlucky requests
+                self.cut(now)
+                self.outcomes.clear()
+
+    def cut(self, now):
+        # all the requests in flight may fail at the same time, only cut the
+        # rate once for all of them (called with the lock held)
+        if now - self.last_cut > 1.0:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.last_cut = now
+
+
+def backoff(attempt, retry_after=None, base=1.0, cap=60.0):
+    """Delay before retrying a request which failed <attempt> + 1 times:
+    exponential backoff with full jitter, never less than Retry-After."""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    return max(delay, retry_after or 0.0)
+
+
+def parse_retry_after(value):
+    """Return the number of seconds of a Retry-After header, or None. Only the
+    delay-seconds form is supported (HTTP dates are ignored)."""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
@@ -19,11 +19,13 @@
  */
 
 #include <ctype.h>
+#include <stdarg.h>
 #include <stdio.h>
 #include <stdlib.h>
 #include <stdint.h>
 #include <string.h>      /* strcat */
 #include <math.h>
+#include <time.h>
 #include <pthread.h>
 
 #define MAXLEN       100
@@ -32,7 +34,14 @@
 #define SIGMOID_SIZE 512
 #define MAX_SIGMOID  4
 
-#define HASHSIZE     30000000
+#define HASH_MIN_SIZE (1 << 16) /* must be a power of 2 */
+
+#define READ_BUFSIZE (1 << 20)
+
+/* errors returned by the functions of the training (and by dict2vec_train()) */
+#define ERR_INVALID  -1 /* invalid parameters or vectors file */
+#define ERR_FILE     -2 /* a file cannot be opened */
+#define ERR_MEMORY   -3 /* memory allocation failed */
 
 struct entry
 {
@@ -51,16 +60,74 @@ struct entry
 	int pos_wp;     /* current cursor position in wp[] */
 	int *wp;
 
+	/* with -minibatch 1, the words of sp[] and wp[] sorted in increasing
+	 * order, to find quickly if a word forms a pair with entry */
+	int n_pairs;
+	int *pairs;
+
 
 	long  count;    /* number of occurrences of entry in input file */
 	char  *word;    /* string associated to the entry */
 	float pdiscard; /* probability to discard entry when found in input */
 };
 
+/* counters updated by each training thread and read by the metrics thread */
+struct thread_stats
+{
+	long   words;             /* number of words processed */
+	long   negsamp_discarded; /* negative samples forming a strong/weak pair */
+	long   negsamp_total;     /* negative samples used for training */
+	double loss;              /* sum of the loss of each trained pair */
+	long   loss_pairs;        /* number of pairs summed in loss */
+};
+
+/* slot of the vocabulary hash table. The full hash of the word is stored with
+ * its index in vocab, so probing a slot of another word almost never needs to
+ * read and compare its string. The word is also stored, so comparing it does
+ * not need to read its entry in vocab. */
+struct slot
+{
+	uint32_t hash;
+	int      index; /* index of the word in vocab, -1 if the slot is empty */
+	char     *word;
+};
+
+/* buffered reader splitting the input file into words (see read_word) */
+struct reader
+{
+	FILE *fi;
+	char *buf;      /* READ_BUFSIZE characters of the file, plus a '\0' */
+	char *cur;      /* position of the next character to read in buf */
+	char *end;      /* end of the characters read in buf */
+	char saved;     /* character replaced by the '\0' ending the last word */
+};
+
+/* buffers of a thread training with -minibatch 1, allocated once by
+ * batch_init() with the sizes given by the parameters. The rows of a window are
+ * used in place in WI and WO, only their addresses are stacked. */
+struct batch
+{
+	int   n_in;      /* number of context words of a window */
+	int   n_out;     /* central word + negative samples */
+	int   n_draws;   /* strong + weak pairs drawn for each context word */
+	float **in;      /* n_in rows of WI of the context words */
+	float **out;     /* n_out rows of WO of the central word and negatives */
+	int   *words;    /* n_out words of the rows of out */
+	float **pairs;   /* n_in x n_draws rows of WO of the words drawn in the
+	                    strong and weak pairs of each context word */
+	float *grads;    /* n_in x n_out gradients of the dot products */
+	float *grads_t;  /* n_out x n_in, grads transposed */
+	float *d_in;     /* n_in x dim gradients of the rows of in */
+	float *d_pairs;  /* n_draws gradients of the pairs of a context word */
+};
+
 struct parameters
 {
 	char input[MAXLEN];
 	char output[MAXLEN];
+	char metrics_file[MAXLEN];
+	char init_vectors[MAXLEN];
+	char init_context[MAXLEN];
 
 	int dim;
 	int window;
@@ -71,21 +138,24 @@ struct parameters
 	int num_threads;
 	int epoch;
 	int save_each_epoch;
+	int minibatch;
+	int binary;
 
 	float alpha;
 	float starting_alpha;
 	float sample;
 	float beta_strong;
 	float beta_weak;
+	float metrics_interval;
 };
 
 /* dynamic array containing 1 entry for each word in vocabulary */
 struct entry *vocab;
 
 struct parameters args = {
-	"", "",
-	100, 5, 5, 5, 0, 0, 1, 1, 0,
-	0.025, 0.025, 1e-4, 1.0, 0.25
+	"", "", "", "", "",
+	100, 5, 5, 5, 0, 0, 1, 1, 0, 0, 0,
+	0.025, 0.025, 1e-4, 1.0, 0.25, 1.0
 };
 
 /* variables required for processing input file */
@@ -93,7 +163,8 @@ long vocab_max_size = 10000, vocab_size = 0, train_words = 0, file_size = 0,
 	word_count_actual = 0;
 
 
-int *vocab_hash;   /* hash table to know index of a word */
+struct slot *vocab_hash; /* hash table to know index of a word */
+long hash_size = 0;      /* number of slots of vocab_hash (a power of 2) */
 float *WI, *WO;    /* weight matrices */
 int *table;        /* array of indexes for negative sampling */
 
@@ -166,16 +237,164 @@ static float sigmoid(const float x)
 		0.9797, 0.9800, 0.9803, 0.9806, 0.9809, 0.9812, 0.9815, 0.9817,
 	};
 
-	static int index;
+	/* not static: sigmoid() is called by all threads at the same time.
+	 * x can be exactly +/-MAX_SIGMOID, keep index in the table */
+	int index;
 
 	index = ((x / MAX_SIGMOID) + 1) / 2 * SIGMOID_SIZE;
+	if (index < 0)
+		index = 0;
+	else if (index > SIGMOID_SIZE - 1)
+		index = SIGMOID_SIZE - 1;
 	return values[index];
 }
 
 /* other variables */
-clock_t start;
+double start;
 int current_epoch = 0, table_size = 1e7, neg_pos = 0;
 
+/* message of the last error (see error()) and error of the training threads
+ * (0 if none failed) */
+char last_error[2 * MAXLEN + 100] = "";
+int thread_error = 0;
+
+/* variables used to write training metrics. metrics_fo is NULL if no
+ * -metrics-file is given. */
+FILE *metrics_fo = NULL;
+struct thread_stats *stats;
+int metrics_stop = 0;
+pthread_mutex_t metrics_lock = PTHREAD_MUTEX_INITIALIZER;
+pthread_cond_t  metrics_cond = PTHREAD_COND_INITIALIZER;
+
+/* error: print the message fmt (a printf format) and keep it in last_error so
+ * the shared library can give it to the caller. Return code, so the caller can
+ * write `return error(ERR_FILE, ...);`. */
+int error(int code, const char *fmt, ...)
+{
+	va_list ap;
+
+	va_start(ap, fmt);
+	vsnprintf(last_error, sizeof last_error, fmt, ap);
+	va_end(ap);
+
+	printf("%s\n", last_error);
+	return code;
+}
+
+/* wall_time: return the current wall-clock time in seconds. clock() can not be
+ * used to compute speeds because it returns the CPU time of all threads. */
+double wall_time()
+{
+	struct timespec ts;
+
+	timespec_get(&ts, TIME_UTC);
+	return ts.tv_sec + ts.tv_nsec * 1e-9;
+}
+
+/* pair_loss: return the negative log-likelihood of a (context, target) pair
+ * whose dot product is dot_prod. label is 1 for a positive target, 0 for a
+ * negative sample. */
+static float pair_loss(float dot_prod, float label)
+{
+	float s;
+
+	if (dot_prod >= MAX_SIGMOID)
+		s = sigmoid(MAX_SIGMOID - 0.01);
+	else if (dot_prod <= -MAX_SIGMOID)
+		s = sigmoid(-MAX_SIGMOID);
+	else
+		s = sigmoid(dot_prod);
+
+	return -log(label > 0.5 ? s : 1.0 - s);
+}
+
+/* log_phase: write the duration of a phase of the program (reading vocab,
+ * training an epoch, saving vectors...) in the metrics file. */
+void log_phase(const char *phase, int epoch, double duration)
+{
+	if (metrics_fo == NULL)
+		return;
+
+	pthread_mutex_lock(&metrics_lock);
+	fprintf(metrics_fo, "{\"event\": \"phase\", \"phase\": \"%s\", "
+	        "\"epoch\": %d, \"seconds\": %.3f}\n", phase, epoch, duration);
+	fflush(metrics_fo);
+	pthread_mutex_unlock(&metrics_lock);
+}
+
+/* metrics_thread: every metrics_interval seconds, write one JSON line in the
+ * metrics file with the words/sec of each thread and of all threads, the
+ * learning rate, the ratio of discarded negative samples and the average loss
+ * of the pairs trained since the previous line. Stop when metrics_stop is set.
+ */
+void *metrics_thread(void *unused)
+{
+	struct timespec deadline;
+	double now, last, elapsed, next, loss, last_loss;
+	long i, words, discarded, total, pairs, last_pairs, *last_words;
+
+	(void) unused;
+	last_words = calloc(args.num_threads, sizeof *last_words);
+	last_loss  = last_pairs = 0;
+	last = next = wall_time();
+
+	pthread_mutex_lock(&metrics_lock);
+	while (!metrics_stop)
+	{
+		/* sleep until next deadline (or until told to stop) */
+		next += args.metrics_interval;
+		deadline.tv_sec  = (time_t) next;
+		deadline.tv_nsec = (long) ((next - deadline.tv_sec) * 1e9);
+		while (!metrics_stop && wall_time() < next)
+			pthread_cond_timedwait(&metrics_cond, &metrics_lock,
+			                       &deadline);
+		if (metrics_stop)
+			break;
+
+		now     = wall_time();
+		elapsed = now - last;
+		last    = now;
+
+		fprintf(metrics_fo, "{\"event\": \"progress\", \"time\": %.3f, "
+		        "\"epoch\": %d, \"progress\": %.2f, \"lr\": %f, "
+		        "\"thread_words_per_sec\": [", now - start,
+		        current_epoch + 1, word_count_actual * 100.0 / train_words
+		        - 100.0 * current_epoch, args.alpha);
+
+		words = discarded = total = pairs = 0;
+		loss  = 0;
+		for (i = 0; i < args.num_threads; ++i)
+		{
+			fprintf(metrics_fo, "%s%.0f", i ? ", " : "",
+			        (stats[i].words - last_words[i]) / elapsed);
+			words        += stats[i].words - last_words[i];
+			last_words[i] = stats[i].words;
+			discarded += stats[i].negsamp_discarded;
+			total     += stats[i].negsamp_total;
+			loss      += stats[i].loss;
+			pairs     += stats[i].loss_pairs;
+		}
+
+		fprintf(metrics_fo, "], \"words_per_sec\": %.0f, "
+		        "\"discarded\": %.4f, \"loss\": ", words / elapsed,
+		        total + discarded > 0 ?
+		        (double) discarded / (total + discarded) : 0.0);
+		if (pairs > last_pairs)
+			fprintf(metrics_fo, "%.4f}\n",
+			        (loss - last_loss) / (pairs - last_pairs));
+		else
+			fprintf(metrics_fo, "null}\n");
+		fflush(metrics_fo);
+
+		last_loss  = loss;
+		last_pairs = pairs;
+	}
+	pthread_mutex_unlock(&metrics_lock);
+
+	free(last_words);
+	return NULL;
+}
+
 
 /* contains: return 1 if value is inside array. 0 otherwise. */
 int contains(int *array, int value, int size)
@@ -206,9 +425,9 @@ void shuffle(int *array, int size)
 
 /* init_negative_table: initialize the negative table used for negative
  * sampling. The table is composed of indexes of words, each one proportional
- * to the number of occurrence of this word.
+ * to the number of occurrence of this word. Return 0 or ERR_MEMORY.
  */
-void init_negative_table()
+int init_negative_table()
 {
 	int i, n_cells, pos;
 	float sum, d;
@@ -217,10 +436,8 @@ void init_negative_table()
 	table = calloc(table_size, sizeof *table);
 
 	if (table == NULL)
-	{
-		printf("Cannot allocate memory for the negative table\n");
-		exit(1);
-	}
+		return error(ERR_MEMORY,
+		             "Cannot allocate memory for the negative table");
 
 	/* compute the sum of count^0.75 for all words */
 	for (i = 0, sum = 0.0; i < vocab_size; ++i)
@@ -245,6 +462,7 @@ void init_negative_table()
 	 * table[position_index] value and increment position_index. This is the
 	 * same as drawing a new random index i and get table[i]. */
 	shuffle(table, table_size);
+	return 0;
 }
 
 /* compute_discard_prob: compute the discard probabilty of each word. The
@@ -266,34 +484,80 @@ void compute_discard_prob()
 		vocab[i].pdiscard = w / sqrt(vocab[i].count);
 }
 
-/* hash: form hash value for string s */
-unsigned int hash(char *s)
+/* hash: form hash value for string s (64-bit FNV-1a). The bits are mixed at the
+ * end, so the lowest bits used to index vocab_hash depend on all characters. */
+uint32_t hash(const char *s)
 {
-	unsigned int hashval;
-
-	for (hashval = 0; *s != '\0'; ++s)
-		hashval = hashval * 257 + *s;
-	return hashval % HASHSIZE;
+	uint64_t h = 0xcbf29ce484222325ULL;
+
+	for (; *s != '\0'; ++s)
+		h = (h ^ (unsigned char) *s) * 0x100000001b3ULL;
+	h ^= h >> 33;
+	h *= 0xc4ceb9fe1a85ec53ULL;
+	h ^= h >> 33;
+	return (uint32_t) h;
 }
 
-/* find: return the position of string s in vocab_hash. If word has never been
- * met, the cell at index hash(word) in vocab_hash will be -1. If the cell is
- * not -1, we start to compare word to each element with the same hash.
+/* find: return the position of string s (whose hash is h) in vocab_hash. If
+ * word has never been met, the index of this slot is -1. Slots are probed
+ * linearly from h, and the string of a slot is only compared to s when their
+ * hashes are equal.
  */
-unsigned int find(char *s)
+long find(const char *s, uint32_t h)
 {
-	unsigned int h = hash(s);
+	long mask = hash_size - 1, pos = h & mask;
+
+	while (vocab_hash[pos].index != -1 && (vocab_hash[pos].hash != h ||
+	       strcmp(s, vocab_hash[pos].word)))
+		pos = (pos + 1) & mask;
+	return pos;
+}
+
+/* search_vocab: return the index of word in vocab, or -1 if it is not in the
+ * vocabulary. */
+int search_vocab(const char *word)
+{
+	return vocab_hash[find(word, hash(word))].index;
+}
+
+/* rebuild_hash: replace vocab_hash by an empty table large enough for the
+ * words of vocab (at most half of the slots used) and add all of them. Return
+ * 0 or ERR_MEMORY. */
+int rebuild_hash()
+{
+	long i, pos;
+	uint32_t h;
+
+	for (hash_size = HASH_MIN_SIZE; hash_size < 2 * vocab_size;)
+		hash_size *= 2;
+
+	free(vocab_hash);
+	if ((vocab_hash = malloc(hash_size * sizeof *vocab_hash)) == NULL)
+		return error(ERR_MEMORY, "Cannot allocate memory for the "
+		             "vocabulary hash table");
+	for (i = 0; i < hash_size; ++i)
+		vocab_hash[i].index = -1;
+
+	for (i = 0; i < vocab_size; ++i)
+	{
+		h = hash(vocab[i].word);
+		pos = find(vocab[i].word, h);
+		vocab_hash[pos].hash  = h;
+		vocab_hash[pos].index = i;
+		vocab_hash[pos].word  = vocab[i].word;
+	}
 
-	while (vocab_hash[h] != -1 && strcmp(s, vocab[vocab_hash[h]].word))
-		h = (h + 1) % HASHSIZE;
-	return h;
+	return 0;
 }
 
-/* add word to the vocabulary. If word already exists, increment its count */
-void add_word(char *word)
+/* add word to the vocabulary. If word already exists, increment its count.
+ * Return 0 or ERR_MEMORY. */
+int add_word(char *word)
 {
-	unsigned int h = find(word);
-	if (vocab_hash[h] == -1)
+	uint32_t h = hash(word);
+	long pos = find(word, h);
+
+	if (vocab_hash[pos].index == -1)
 	{
 		/* create new entry */
 		struct entry e;
@@ -307,10 +571,19 @@ void add_word(char *word)
 		e.pos_wp   = 0;
 		e.sp       = NULL;
 		e.wp       = NULL;
+		e.n_pairs  = 0;
+		e.pairs    = NULL;
 
 		/* add it to vocab and set its index in vocab_hash */
 		vocab[vocab_size] = e;
-		vocab_hash[h] = vocab_size++;
+		vocab_hash[pos].hash  = h;
+		vocab_hash[pos].word  = e.word;
+		vocab_hash[pos].index = vocab_size++;
+
+		/* keep at least half of the slots empty, so probing stays
+		 * short */
+		if (2 * vocab_size > hash_size && rebuild_hash() < 0)
+			return ERR_MEMORY;
 
 		/* reallocate more space if needed */
 		if (vocab_size >= vocab_max_size)
@@ -321,8 +594,10 @@ void add_word(char *word)
 	}
 	else
 	{
-		vocab[vocab_hash[h]].count++;
+		vocab[vocab_hash[pos].index].count++;
 	}
+
+	return 0;
 }
 
 /* compare_words: used to sort two words */
@@ -347,15 +622,18 @@ void destroy_vocab()
 
 		if (vocab[i].wp != NULL)
 			free(vocab[i].wp);
+
+		free(vocab[i].pairs);
 	}
 
 	free(vocab);
 }
 
 /* sort_and_reduce_vocab: sort the words in vocabulary by their number of
- * occurrences. Remove all words with less than min_count occurrences.
+ * occurrences. Remove all words with less than min_count occurrences. Return 0
+ * or ERR_MEMORY.
  */
-void sort_and_reduce_vocab()
+int sort_and_reduce_vocab()
 {
 	int i, valid_words;
 
@@ -385,12 +663,9 @@ void sort_and_reduce_vocab()
 	vocab_size = valid_words;
 	vocab = realloc(vocab, vocab_size * sizeof(struct entry));
 
-	/* sorting has changed the index of each word, so update the value
-	 in vocab_hash. Start by reseting all values to -1.*/
-	for (i = 0; i < HASHSIZE; ++i)
-		vocab_hash[i] = -1;
-	for (i = 0; i < vocab_size; ++i)
-		vocab_hash[find(vocab[i].word)] = i;
+	/* sorting has changed the index of each word, so rebuild vocab_hash
+	 (smaller, now that rare words are removed) */
+	return rebuild_hash();
 }
 
 /* read_strong_pairs; read the file containing the strong pairs. For each pair,
@@ -411,17 +686,13 @@ int read_strong_pairs(char *filename)
 
 	while ((fscanf(fi, "%s %s", word1, word2) != EOF))
 	{
-		i1 = find(word1);
-		i2 = find(word2);
+		i1 = search_vocab(word1);
+		i2 = search_vocab(word2);
 
 		/* nothing to do if one of the word is not in vocab */
-		if (vocab_hash[i1] == -1 || vocab_hash[i2] == -1)
+		if (i1 == -1 || i2 == -1)
 			continue;
 
-		/* get the real indexes (not the index in the hash table) */
-		i1 = vocab_hash[i1];
-		i2 = vocab_hash[i2];
-
 		/* look if we already have added one strong pair for i1. If not,
 		 * create the array. Else, expand by one cell. */
 		len = vocab[i1].n_sp;
@@ -471,17 +742,13 @@ int read_weak_pairs(char *filename)
 
 	while ((fscanf(fi, "%s %s", word1, word2) != EOF))
 	{
-		i1 = find(word1);
-		i2 = find(word2);
+		i1 = search_vocab(word1);
+		i2 = search_vocab(word2);
 
 		/* nothing to do if one of the word is not in vocab */
-		if (vocab_hash[i1] == -1 || vocab_hash[i2] == -1)
+		if (i1 == -1 || i2 == -1)
 			continue;
 
-		/* get the real indexes (not the index in the hash table) */
-		i1 = vocab_hash[i1];
-		i2 = vocab_hash[i2];
-
 		/* look if we already have added one pair for i1. If not, create
 		the array. Else, expand by one cell. */
 		len = vocab[i1].n_wp;
@@ -513,29 +780,161 @@ int read_weak_pairs(char *filename)
 	return 0;
 }
 
+/* compare_indexes: used to sort indexes of words */
+int compare_indexes(const void *a, const void *b)
+{
+	return *(int *) a - *(int *) b;
+}
+
+/* sort_pairs: store the strong and weak pairs of each word in its array pairs,
+ * sorted so is_pair() can search it. Return 0 or ERR_MEMORY. */
+int sort_pairs()
+{
+	int i;
+	struct entry *e;
+
+	for (i = 0; i < vocab_size; ++i)
+	{
+		e = &vocab[i];
+		if ((e->n_pairs = e->n_sp + e->n_wp) == 0)
+			continue;
+
+		if ((e->pairs = malloc(e->n_pairs * sizeof *e->pairs)) == NULL)
+			return error(ERR_MEMORY, "Cannot allocate memory for "
+			             "the sorted pairs");
+
+		if (e->n_sp > 0)
+			memcpy(e->pairs, e->sp, e->n_sp * sizeof *e->pairs);
+		if (e->n_wp > 0)
+			memcpy(e->pairs + e->n_sp, e->wp,
+			       e->n_wp * sizeof *e->pairs);
+		qsort(e->pairs, e->n_pairs, sizeof *e->pairs, compare_indexes);
+	}
+
+	return 0;
+}
+
+/* is_space: same as isspace() in the "C" locale, without the function call and
+ * the lookup of the locale. */
+static inline int is_space(char c)
+{
+	return c == ' ' || (c >= '\t' && c <= '\r');
+}
+
+/* reader_init: prepare r to read the words of fi from its current position.
+ * Return 0 or ERR_MEMORY. */
+int reader_init(struct reader *r, FILE *fi)
+{
+	if ((r->buf = malloc(READ_BUFSIZE + 1)) == NULL)
+		return error(ERR_MEMORY,
+		             "Cannot allocate memory for the input buffer");
+
+	r->fi    = fi;
+	r->cur   = r->end = r->buf;
+	*r->end  = '\0';
+	r->saved = '\0';
+	return 0;
+}
+
+/* reader_free: free the buffer of r (the file is not closed). */
+void reader_free(struct reader *r)
+{
+	free(r->buf);
+	r->buf = NULL;
+}
+
+/* fill_buffer: move the characters of r->buf from keep to the end at the
+ * beginning of the buffer, then fill the rest of the buffer with the next
+ * characters of the file. Return the number of characters read. */
+static size_t fill_buffer(struct reader *r, char *keep)
+{
+	size_t kept = r->end - keep, n;
+
+	memmove(r->buf, keep, kept);
+	n = fread(r->buf + kept, 1, READ_BUFSIZE - kept, r->fi);
+
+	r->cur  = r->buf + (r->cur - keep);
+	r->end  = r->buf + kept + n;
+	*r->end = '\0';
+	return n;
+}
+
+/* read_word: return the next word of the file read by r, or NULL at the end of
+ * the file. Like fscanf(fi, "%100s", word), words are separated by whitespace
+ * and a word longer than MAXLEN characters is cut into several words of at
+ * most MAXLEN characters. The word is not copied: the character following it
+ * in the buffer is replaced by '\0' (and put back at the next call), so the
+ * returned word is only valid until the next call.
+ */
+char *read_word(struct reader *r)
+{
+	char *start, *limit;
+	size_t n;
+
+	*r->cur = r->saved;
+
+	/* skip whitespace, reading the next block of the file if needed. The
+	 * '\0' at r->end is not a space, so it stops the loop. */
+	while (1)
+	{
+		while (is_space(*r->cur))
+			++r->cur;
+		if (r->cur < r->end)
+			break;
+		if (fill_buffer(r, r->cur) == 0)
+		{
+			r->saved = '\0';
+			return NULL;
+		}
+	}
+
+	start = r->cur;
+	while (1)
+	{
+		limit = r->end - start > MAXLEN ? start + MAXLEN : r->end;
+		while (r->cur < limit && !is_space(*r->cur))
+			++r->cur;
+		if (r->cur < r->end || r->cur - start == MAXLEN)
+			break;
+
+		/* the word may continue in the next block of the file, move
+		 * its first characters at the beginning of the buffer */
+		n = fill_buffer(r, start);
+		start = r->buf;
+		if (n == 0)
+			break;
+	}
+
+	r->saved = *r->cur;
+	*r->cur  = '\0';
+	return start;
+}
+
 /* read_vocab: read the file given as -input. For each word, either add it in
  * the vocab or increment its occurrence. Also read the strong and weak pairs
  * files if provided. Sort the vocabulary by occurrences and display some infos.
+ * Return 0, ERR_FILE or ERR_MEMORY.
  */
-void read_vocab(char *input_fn, char *strong_fn, char *weak_fn)
+int read_vocab(char *input_fn, char *strong_fn, char *weak_fn)
 {
 	FILE *fi;
-	int i, failure_strong, failure_weak;
-	char word[MAXLEN];
+	struct reader reader;
+	int failure_strong, failure_weak, err;
+	char *word;
+	long read_words;
+	double phase_start = wall_time(), duration;
 
 	if ((fi = fopen(input_fn, "r")) == NULL)
+		return error(ERR_FILE, "ERROR: training data file not found!");
+
+	/* init an empty hash table, it grows with the vocabulary */
+	if ((err = rebuild_hash()) < 0 || (err = reader_init(&reader, fi)) < 0)
 	{
-		printf("ERROR: training data file not found!\n");
-		exit(1);
+		fclose(fi);
+		return err;
 	}
 
-	/* init the hash table with -1 */
-	for (i = 0; i < HASHSIZE; ++i)
-		vocab_hash[i] = -1;
-
-	/* some words are longer than MAXLEN, need to indicate a maximum width
-	 * to scanf so no buffer overflow. */
-	while ((fscanf(fi, "%100s", word) != EOF))
+	while ((word = read_word(&reader)) != NULL)
 	{
 		/* increment total number of read words */
 		train_words++;
@@ -546,27 +945,35 @@ void read_vocab(char *input_fn, char *strong_fn, char *weak_fn)
 		}
 
 		/* add word we just read or increment its count if needed */
-		add_word(word);
-
-		/* Wikipedia has around 8M unique words, so we never hit the
-		 * 21M words limit and therefore never need to reduce the vocab
-		 * during creation of vocabulary. If your input file contains
-		 * much more unique words, you might need to uncomment it. */
-		/*if (vocab_size > HASHSIZE * 0.7)
-			sort_and_reduce_vocab();*/
+		if ((err = add_word(word)) < 0)
+			break;
+	}
+	reader_free(&reader);
+	duration = wall_time() - phase_start;
+	read_words = train_words;
+
+	if (err < 0 || (err = sort_and_reduce_vocab()) < 0)
+	{
+		fclose(fi);
+		return err;
 	}
 
-	sort_and_reduce_vocab(HASHSIZE);
+	/* words of the file, before the words below min_count are removed */
+	printf("Read %ld words in %.2fs (%.0fk words/sec)\n", read_words,
+	       duration, read_words / (duration * 1000.0));
 
 	printf("Vocab size: %ld\n", vocab_size);
 	printf("Words in train file: %ld\n", train_words);
+	log_phase("read_vocab", 0, wall_time() - phase_start);
 
+	phase_start = wall_time();
 	printf("Adding strong pairs...");
 	failure_strong = read_strong_pairs(strong_fn);
 	printf("\nAdding weak pairs...");
 	failure_weak = read_weak_pairs(weak_fn);
 	if (!failure_strong || !failure_weak)
 		printf("\nAdding pairs done.\n");
+	log_phase("read_pairs", 0, wall_time() - phase_start);
 
 	/* compute the discard probability for each word (only if we
 	 * subsample)*/
@@ -577,27 +984,103 @@ void read_vocab(char *input_fn, char *strong_fn, char *weak_fn)
 	 the work to each thread, we need to know the total size of the file */
 	file_size = ftell(fi);
 	fclose(fi);
+	return 0;
 }
 
-/* init_network: initialize matrix WI (random values) and WO (zero values) */
-void init_network()
+/* load_vectors: copy the vectors of filename into the rows of matrix M (WI or
+ * WO) of the words of the vocabulary. filename is a .vec file (one word and its
+ * values per line, after a line with the number of vectors and the dimension)
+ * or, if its name ends with ".bin", the same in binary format (the values of
+ * each word are float32 saved with -binary 1). Vectors of words not in the
+ * vocabulary are skipped, rows of words without vector are not changed. Return
+ * the number of rows copied, ERR_FILE if the file cannot be opened,
+ * ERR_INVALID if it has vectors of another dimension or is truncated, or
+ * ERR_MEMORY.
+ */
+long load_vectors(char *filename, float *M)
 {
-	float r, l;
-	int i, j;
+	FILE *fi;
+	long n_vectors, i, loaded;
+	int dim, j, w, binary, len;
+	char word[MAXLEN + 1];
+	float *row;
 
-	if ((WI = malloc(sizeof *WI * vocab_size * args.dim)) == NULL)
+	if ((fi = fopen(filename, "rb")) == NULL)
+		return error(ERR_FILE, "ERROR: vectors file %s not found!",
+		             filename);
+
+	if (fscanf(fi, "%ld %d", &n_vectors, &dim) != 2 || dim != args.dim)
 	{
-		printf("Memory allocation failed for WI\n");
-		exit(1);
+		fclose(fi);
+		return error(ERR_INVALID, "ERROR: %s does not contain vectors "
+		             "of size %d", filename, args.dim);
 	}
 
+	if ((row = malloc(dim * sizeof *row)) == NULL)
+	{
+		fclose(fi);
+		return error(ERR_MEMORY, "Cannot allocate memory to read %s",
+		             filename);
+	}
 
-	if ((WO = calloc(vocab_size * args.dim, sizeof *WO)) == NULL)
+	len    = strlen(filename);
+	binary = len > 4 && strcmp(filename + len - 4, ".bin") == 0;
+	loaded = 0;
+
+	for (i = 0; i < n_vectors; ++i)
 	{
-		printf("Memory allocation failed for WO\n");
-		exit(1);
+		if (fscanf(fi, "%100s", word) != 1)
+			break;
+
+		/* a binary vector starts right after the space following the
+		 * word */
+		if (binary)
+		{
+			fgetc(fi);
+			j = fread(row, sizeof *row, dim, fi);
+		}
+		else
+			for (j = 0; j < dim && fscanf(fi, "%f", &row[j]) == 1;)
+				++j;
+
+		if (j < dim)
+			break;
+
+		if ((w = search_vocab(word)) == -1)
+			continue;
+
+		memcpy(M + (long) w * args.dim, row, dim * sizeof *row);
+		++loaded;
 	}
 
+	free(row);
+	fclose(fi);
+
+	if (i < n_vectors)
+		return error(ERR_INVALID, "ERROR: %s is truncated (vector %ld "
+		             "of %ld)", filename, i + 1, n_vectors);
+
+	return loaded;
+}
+
+/* init_network: initialize matrix WI (random values) and WO (zero values). If
+ * -init-vectors (resp. -init-context) is given, the rows of WI (resp. WO) of
+ * the words having a vector in this file are initialized with it instead, so
+ * training continues from a previous model. Return 0, or the error of
+ * load_vectors() or ERR_MEMORY.
+ */
+int init_network()
+{
+	float r, l;
+	int i, j;
+	long loaded;
+
+	if ((WI = malloc(sizeof *WI * vocab_size * args.dim)) == NULL)
+		return error(ERR_MEMORY, "Memory allocation failed for WI");
+
+	if ((WO = calloc(vocab_size * args.dim, sizeof *WO)) == NULL)
+		return error(ERR_MEMORY, "Memory allocation failed for WO");
+
 	/* WI is initialized with random values from (-0.5 / vec_dimension)
 	 * and (0.5 / vec_dimension). Multiply is faster than divide so
 	 * precompute 1 / RAND_MAX and 1 / dim. */
@@ -606,47 +1089,463 @@ void init_network()
 	for (i = 0; i < vocab_size; ++i)
 		for (j = 0; j < args.dim; ++j)
 			WI[i * args.dim + j] = ( (rand() * r) - 0.5 ) * l;
+
+	if (strlen(args.init_vectors) > 0)
+	{
+		if ((loaded = load_vectors(args.init_vectors, WI)) < 0)
+			return loaded;
+		printf("Initialized %ld/%ld word vectors from %s\n", loaded,
+		       vocab_size, args.init_vectors);
+	}
+
+	if (strlen(args.init_context) > 0)
+	{
+		if ((loaded = load_vectors(args.init_context, WO)) < 0)
+			return loaded;
+		printf("Initialized %ld/%ld context vectors from %s\n", loaded,
+		       vocab_size, args.init_context);
+	}
+
+	return 0;
 }
 
 /* destroy_network: free the memory allocated for matrices WI and WO */
 void destroy_network()
 {
-	if (WI != NULL)
-		free(WI);
+	free(WI);
+	free(WO);
+	WI = WO = NULL;
+}
+
+/* next_pair: return the pair at the cursor and move the cursor, going back to
+ * the first pair after the last one. The cursors are shared by all threads
+ * without lock (like the vectors), so the cursor is read only once: another
+ * thread moving it at the same time can not make it go past the end of pairs.
+ */
+static inline int next_pair(int *pairs, int n_pairs, int *cursor)
+{
+	int pos = *(volatile int *) cursor;
+
+	if (pos < 0 || pos > n_pairs - 1)
+		pos = 0;
+	*cursor = pos + 1;
+
+	return pairs[pos];
+}
+
+/* draw_negative: return the next word of the negative table which is not w_t.
+ * Words forming a pair with a context word are not redrawn, callers skip them
+ * for this context word. */
+static inline int draw_negative(int w_t)
+{
+	int target;
+
+	do
+	{
+		target = table[neg_pos++];
+		if (neg_pos > table_size-1)
+			neg_pos = 0;
+	} while (target == w_t);
+
+	return target;
+}
+
+/* dot: return the dot product of the n values of a and b */
+static inline float dot(const float *restrict a, const float *restrict b, int n)
+{
+	float sum = 0.0;
+	int k;
+
+	for (k = 0; k < n; ++k)
+		sum += a[k] * b[k];
+	return sum;
+}
+
+/* axpy: add alpha * x to the n values of y */
+static inline void axpy(float alpha, const float *restrict x,
+                        float *restrict y, int n)
+{
+	int k;
+
+	for (k = 0; k < n; ++k)
+		y[k] += alpha * x[k];
+}
+
+/* dot_rows: set out[r] to the dot product of the n values of a and of x[r], for
+ * the rows x[0] to x[n_rows-1]. The rows are read by blocks of 4, so a is read
+ * once for 4 rows. */
+static void dot_rows(const float *restrict a, float **x, int n_rows,
+                     float *out, int n)
+{
+	const float *restrict x0, *restrict x1, *restrict x2, *restrict x3;
+	float s0, s1, s2, s3;
+	int r, k;
+
+	for (r = 0; r + 4 <= n_rows; r += 4)
+	{
+		x0 = x[r]; x1 = x[r + 1]; x2 = x[r + 2]; x3 = x[r + 3];
+		s0 = s1 = s2 = s3 = 0.0;
+		for (k = 0; k < n; ++k)
+		{
+			s0 += a[k] * x0[k];
+			s1 += a[k] * x1[k];
+			s2 += a[k] * x2[k];
+			s3 += a[k] * x3[k];
+		}
+		out[r] = s0; out[r + 1] = s1; out[r + 2] = s2; out[r + 3] = s3;
+	}
+
+	for (; r < n_rows; ++r)
+		out[r] = dot(a, x[r], n);
+}
+
+/* add_rows: add c[r] * x[r] to the n values of y, for the rows x[0] to
+ * x[n_rows-1]. The rows are read by blocks of 4, so y is read and written once
+ * for 4 rows. */
+static void add_rows(float *restrict y, float **x, const float *c, int n_rows,
+                     int n)
+{
+	const float *restrict x0, *restrict x1, *restrict x2, *restrict x3;
+	float c0, c1, c2, c3;
+	int r, k;
+
+	for (r = 0; r + 4 <= n_rows; r += 4)
+	{
+		x0 = x[r]; x1 = x[r + 1]; x2 = x[r + 2]; x3 = x[r + 3];
+		c0 = c[r]; c1 = c[r + 1]; c2 = c[r + 2]; c3 = c[r + 3];
+		for (k = 0; k < n; ++k)
+			y[k] += c0 * x0[k] + c1 * x1[k] + c2 * x2[k] +
+			        c3 * x3[k];
+	}
+
+	for (; r < n_rows; ++r)
+		axpy(c[r], x[r], y, n);
+}
+
+/* prefetch_row: start loading the row of M of word w in the cache, so it is
+ * ready when the window reaches it instead of waiting for it */
+static inline void prefetch_row(const float *M, int w)
+{
+	const float *row = M + (long) w * args.dim;
+	int k;
+
+	for (k = 0; k < args.dim; k += 64 / sizeof *row)
+		__builtin_prefetch(row + k);
+}
+
+/* is_pair: return 1 if w forms a strong or a weak pair with the word of e (a
+ * binary search in its sorted pairs, see sort_pairs()). 0 otherwise. The
+ * search has no branch depending on the values (compiled as conditional
+ * moves), branches would be mispredicted half of the time. */
+static inline int is_pair(const struct entry *e, int w)
+{
+	const int *base = e->pairs;
+	int n = e->n_pairs, half;
+
+	if (n == 0)
+		return 0;
+
+	/* base[0] is the last value <= w (or the first value) */
+	while (n > 1)
+	{
+		half = n / 2;
+		base = base[half] <= w ? base + half : base;
+		n   -= half;
+	}
+
+	return *base == w;
+}
+
+/* batch_init: allocate the buffers of b for the sizes given by args. Return 0
+ * or ERR_MEMORY. */
+int batch_init(struct batch *b)
+{
+	b->n_in    = 2 * (args.window / 2);
+	b->n_out   = args.negative + 1;
+	b->n_draws = args.strong_draws + args.weak_draws;
+
+	/* n_in and n_draws can be 0, and malloc(0) can return NULL */
+	b->in      = malloc((b->n_in + 1) * sizeof *b->in);
+	b->out     = malloc(b->n_out * sizeof *b->out);
+	b->words   = malloc(b->n_out * sizeof *b->words);
+	b->pairs   = malloc((b->n_in * b->n_draws + 1) * sizeof *b->pairs);
+	b->grads   = malloc((b->n_in * b->n_out + 1) * sizeof *b->grads);
+	b->grads_t = malloc((b->n_in * b->n_out + 1) * sizeof *b->grads_t);
+	b->d_in    = malloc((b->n_in * args.dim + 1) * sizeof *b->d_in);
+	b->d_pairs = malloc((b->n_draws + 1) * sizeof *b->d_pairs);
+
+	if (b->in == NULL || b->out == NULL || b->words == NULL ||
+	    b->pairs == NULL || b->grads == NULL || b->grads_t == NULL ||
+	    b->d_in == NULL || b->d_pairs == NULL)
+		return error(ERR_MEMORY, "Cannot allocate memory for the "
+		             "minibatch buffers");
+	return 0;
+}
+
+/* batch_free: free the buffers of b */
+void batch_free(struct batch *b)
+{
+	free(b->in);
+	free(b->out);
+	free(b->words);
+	free(b->pairs);
+	free(b->grads);
+	free(b->grads_t);
+	free(b->d_in);
+	free(b->d_pairs);
+}
+
+/* update_pairs: positive sampling update of a context word for the n rows of
+ * WO of the words drawn in its strong (or weak) pairs. in is the row of WI of
+ * the context word and d_in accumulates the gradient that has to be
+ * back-propagated to this row. All the dot products are computed (in grads)
+ * before updating the rows, so a word drawn twice is updated twice from the
+ * same value.
+ */
+static void update_pairs(float **rows, int n, float beta, float *in,
+                         float *d_in, float *grads)
+{
+	int d;
+
+	dot_rows(in, rows, n, grads, args.dim);
+	for (d = 0; d < n; ++d)
+	{
+		/* dot product is already high, nothing to do */
+		if (grads[d] > MAX_SIGMOID)
+			grads[d] = 0.0;
+		else if (grads[d] < -MAX_SIGMOID)
+			grads[d] = args.alpha * beta;
+		else
+			grads[d] = args.alpha * beta * (1 - sigmoid(grads[d]));
+	}
+
+	add_rows(d_in, rows, grads, n, args.dim);
+	for (d = 0; d < n; ++d)
+		if (grads[d] != 0.0)
+			axpy(grads[d], in, rows[d], args.dim);
+}
+
+/* prefetch_pairs: prefetch the rows of WO of the next draws words of pairs
+ * returned by next_pair() (for the cursor value it has now) */
+static void prefetch_pairs(int *pairs, int n_pairs, int cursor, int draws)
+{
+	for (; n_pairs > 0 && draws > 0; --draws, ++cursor)
+	{
+		if (cursor < 0 || cursor > n_pairs - 1)
+			cursor = 0;
+		prefetch_row(WO, pairs[cursor]);
+	}
+}
+
+/* prefetch_window: prefetch the rows used to train the window centered on
+ * line[pos]. Its negative samples and pairs are not drawn yet, but they are
+ * the next words of the negative table and of the pairs arrays. */
+static void prefetch_window(int *line, int pos, int half_ws)
+{
+	int j, n, w;
+
+	prefetch_row(WO, line[pos]);
+	for (j = 0, n = neg_pos; j < args.negative; ++j)
+	{
+		prefetch_row(WO, table[n]);
+		if (++n > table_size-1)
+			n = 0;
+	}
+
+	for (j = pos - half_ws; j < pos + half_ws + 1; ++j)
+	{
+		if (j == pos)
+			continue;
+
+		w = line[j];
+		prefetch_row(WI, w);
+		prefetch_pairs(vocab[w].sp, vocab[w].n_sp, vocab[w].pos_sp,
+		               args.strong_draws);
+		prefetch_pairs(vocab[w].wp, vocab[w].n_wp, vocab[w].pos_wp,
+		               args.weak_draws);
+	}
+}
+
+/* train_window_minibatch: train all the (context, central word) pairs of the
+ * window centered on line[pos] at once. The same negative samples are shared
+ * by all context words (like in pword2vec), so the rows of the context words
+ * (inputs) and the rows of the central word + negative samples (outputs) form
+ * two small dense matrices. The forward pass is the product inputs x
+ * outputs^T and the backward pass two other matrix products, computed with
+ * dot() and axpy() on whole rows.
+ * Training is limited by the time needed to load the rows from memory, not by
+ * the computations. All the rows of the next window (the line has line_size
+ * words) are known, so they are prefetched while this one is trained.
+ * As in the default mode, a negative sample is redrawn if it is the central
+ * word, and skipped for a context word if it forms a strong or a weak pair
+ * with it. Counters of st are updated.
+ */
+static void train_window_minibatch(int *line, int line_size, int pos,
+                                   int half_ws, struct batch *b,
+                                   struct thread_stats *st)
+{
+	int i, j, d, w_c, w_t, n_strong, n_weak, dim = args.dim;
+	float dot_prod, *grads, **pairs;
+
+	/* the rows of the first window of the line have not been prefetched
+	 * by the previous window */
+	if (pos == half_ws)
+		prefetch_window(line, pos, half_ws);
+
+	/* draw the words of the window */
+	w_t = line[pos];
+	b->words[0] = w_t;
+	for (j = 1; j < b->n_out; ++j)
+		b->words[j] = draw_negative(w_t);
+	for (j = 0; j < b->n_out; ++j)
+		b->out[j] = WO + (long) b->words[j] * dim;
+
+	for (i = 0; i < b->n_in; ++i)
+	{
+		w_c      = line[pos - half_ws + i + (i >= half_ws)];
+		b->in[i] = WI + (long) w_c * dim;
+		pairs    = b->pairs + i * b->n_draws;
+		n_strong = vocab[w_c].n_sp > 0 ? args.strong_draws : 0;
+		n_weak   = vocab[w_c].n_wp > 0 ? args.weak_draws : 0;
+		for (d = 0; d < n_strong; ++d)
+			pairs[d] = WO + (long) dim * next_pair(vocab[w_c].sp,
+			           vocab[w_c].n_sp, &vocab[w_c].pos_sp);
+		for (d = n_strong; d < n_strong + n_weak; ++d)
+			pairs[d] = WO + (long) dim * next_pair(vocab[w_c].wp,
+			           vocab[w_c].n_wp, &vocab[w_c].pos_wp);
+	}
+
+	if (pos + 1 < line_size - half_ws)
+		prefetch_window(line, pos + 1, half_ws);
+
+	/* forward propagation: grads = inputs x outputs^T, then turn each dot
+	 * product into a gradient */
+	for (i = 0; i < b->n_in; ++i)
+	{
+		w_c   = line[pos - half_ws + i + (i >= half_ws)];
+		grads = b->grads + i * b->n_out;
+		dot_rows(b->in[i], b->out, b->n_out, grads, dim);
+
+		for (j = 0; j < b->n_out; ++j)
+		{
+			/* negative samples forming a strong or a weak pair
+			 * with w_c are not used for w_c */
+			if (j > 0 && is_pair(&vocab[w_c], b->words[j]))
+			{
+				++st->negsamp_discarded;
+				grads[j] = 0.0;
+				continue;
+			}
+			if (j > 0)
+				++st->negsamp_total;
+
+			dot_prod = grads[j];
+			if (dot_prod > MAX_SIGMOID)
+				grads[j] = args.alpha * ((j == 0) - 1.0);
+			else if (dot_prod < -MAX_SIGMOID)
+				grads[j] = args.alpha * (j == 0);
+			else
+				grads[j] = args.alpha * ((j == 0) - sigmoid(dot_prod));
+
+			if (metrics_fo != NULL)
+			{
+				st->loss += pair_loss(dot_prod, j == 0);
+				++st->loss_pairs;
+			}
+		}
+
+		for (j = 0; j < b->n_out; ++j)
+			b->grads_t[j * b->n_in + i] = grads[j];
+	}
 
-	if (WO != NULL)
-		free(WO);
+	/* back-propagation: d_in = grads x outputs, then outputs +=
+	 * grads^T x inputs (after, d_in needs the outputs before the update).
+	 * The inputs are only updated at the end. */
+	for (i = 0; i < b->n_in; ++i)
+	{
+		memset(b->d_in + i * dim, 0, dim * sizeof *b->d_in);
+		add_rows(b->d_in + i * dim, b->out, b->grads + i * b->n_out,
+		         b->n_out, dim);
+	}
+	for (j = 0; j < b->n_out; ++j)
+		add_rows(b->out[j], b->in, b->grads_t + j * b->n_in, b->n_in,
+		         dim);
+
+	/* strong and weak pairs are specific to each context word, so they
+	 * can not be shared. Update them row by row, their gradient is added
+	 * to d_in. */
+	for (i = 0; i < b->n_in; ++i)
+	{
+		w_c      = line[pos - half_ws + i + (i >= half_ws)];
+		pairs    = b->pairs + i * b->n_draws;
+		n_strong = vocab[w_c].n_sp > 0 ? args.strong_draws : 0;
+		n_weak   = vocab[w_c].n_wp > 0 ? args.weak_draws : 0;
+		update_pairs(pairs, n_strong, args.beta_strong, b->in[i],
+		             b->d_in + i * dim, b->d_pairs);
+		update_pairs(pairs + n_strong, n_weak, args.beta_weak, b->in[i],
+		             b->d_in + i * dim, b->d_pairs);
+	}
+
+	/* Back-propagate hidden -> input */
+	for (i = 0; i < b->n_in; ++i)
+		axpy(1.0, b->d_in + i * dim, b->in[i], dim);
 }
 
 void *train_thread(void *id)
 {
 	FILE *fi;
-	char word[MAXLEN];
-	int w_t, w_c, c, d, target, line_size, pos, line[MAXLINE];
-	int index1, index2, k, half_ws;
-	long word_count_local, negsamp_discarded, negsamp_total;
+	struct reader reader;
+	char *word;
+	int w_t, w_c, w_in, c, d, target, line_size, pos, line[MAXLINE];
+	int index1, index2, k, half_ws, err;
+	long word_count_local;
 	float label, dot_prod, grad, *hidden;
-	double progress, wts, discarded, cps, d_train, lr_coef;
+	double progress, wts, discarded, d_train, lr_coef;
 
-	clock_t now;
+	/* counters are incremented locally and regularly added to the shared
+	 * stats[] of this thread, so threads do not write the same cache
+	 * lines at each update */
+	struct thread_stats local = {0, 0, 0, 0.0, 0};
+	struct thread_stats *st = &stats[(intptr_t) id];
 	int rnd = (intptr_t) id;
+	struct batch batch;
 
+	/* on error, stop this thread and let train() report the error */
 	if ((fi = fopen(args.input, "r")) == NULL)
 	{
-		printf("ERROR: training data file not found!\n");
-		exit(1);
+		thread_error = error(ERR_FILE,
+		                     "ERROR: training data file not found!");
+		pthread_exit(NULL);
 	}
 
 	/* init variables */
 	fseek(fi, file_size / args.num_threads * rnd, SEEK_SET);
-	word_count_local = negsamp_discarded = negsamp_total = 0;
+	if (reader_init(&reader, fi) < 0)
+	{
+		thread_error = ERR_MEMORY;
+		fclose(fi);
+		pthread_exit(NULL);
+	}
+	w_in             = -1;
+	word_count_local = 0;
 	hidden           = calloc(args.dim, sizeof *hidden);
 	half_ws          = args.window / 2;
 	wts = discarded  = 0.0f;
-	cps              = 1000.0f / CLOCKS_PER_SEC;
 	d_train          = 1.0f / train_words;
 	lr_coef          = args.starting_alpha / ((double) (args.epoch * train_words));
 
+	/* buffers holding the rows and gradients of a window (only report an
+	 * error, another thread may already have set thread_error) */
+	if (args.minibatch && (err = batch_init(&batch)) < 0)
+	{
+		thread_error = err;
+		batch_free(&batch);
+		reader_free(&reader);
+		fclose(fi);
+		free(hidden);
+		pthread_exit(NULL);
+	}
+
 	while (word_count_actual < (train_words * (current_epoch + 1)))
 	{
 		/* update learning rate and print progress */
@@ -654,16 +1553,24 @@ void *train_thread(void *id)
 		{
 			args.alpha -= word_count_local * lr_coef;
 			word_count_actual += word_count_local;
+			st->words             += word_count_local;
+			st->negsamp_discarded += local.negsamp_discarded;
+			st->negsamp_total     += local.negsamp_total;
+			st->loss              += local.loss;
+			st->loss_pairs        += local.loss_pairs;
 			word_count_local = 0;
-			now = clock();
+			local.negsamp_discarded = local.negsamp_total = 0;
+			local.loss = local.loss_pairs = 0;
 
 			/* "Discarded" is the percentage of discarded negative
 			 * samples because they form either a strong or a weak
-			 * pair with context word */
+			 * pair with context word. Speed is computed with the
+			 * wall-clock time, words are shared among all threads */
 			progress = word_count_actual * d_train * 100;
 			progress -= 100 * current_epoch;
-			wts = word_count_actual / ((double)(now - start) * cps);
-			discarded = negsamp_discarded * 100.0 / negsamp_total;
+			wts = word_count_actual / ((wall_time() - start) * 1000.0
+			                           * args.num_threads);
+			discarded = st->negsamp_discarded * 100.0 / st->negsamp_total;
 			printf("%clr: %f  Progress: %.2f%%  Words/thread/sec:"
 			       " %.2fk  Discarded: %.2f%% ",
 			       13, args.alpha, progress, wts, discarded);
@@ -677,10 +1584,11 @@ void *train_thread(void *id)
 		line_size = 0;
 		for (k = MAXLINE; k--;)
 		{
-			/* some words are longer than MAXLEN, need to indicate a
-			 * maximum width to scanf so no buffer overflow. */
-			fscanf(fi, "%100s", word);
-			w_t = vocab_hash[find(word)];
+			/* at the end of the file, the last word is read again
+			 * until all threads have processed enough words */
+			if ((word = read_word(&reader)) != NULL)
+				w_in = search_vocab(word);
+			w_t = w_in;
 
 			/* word is not in vocabulary, move to next one */
 			if (w_t == -1)
@@ -700,6 +1608,14 @@ void *train_thread(void *id)
 		/* for each word of the line */
 		for (pos = half_ws; pos < line_size - half_ws; ++pos)
 		{
+			/* all pairs of the window are trained together */
+			if (args.minibatch)
+			{
+				train_window_minibatch(line, line_size, pos,
+				                       half_ws, &batch, &local);
+				continue;
+			}
+
 			w_t = line[pos];  /* central word */
 
 			/* for each word of the context window */
@@ -727,12 +1643,7 @@ void *train_thread(void *id)
 					/* target is random word */
 					else
 					{
-						do
-						{
-							target = table[neg_pos++];
-							if (neg_pos > table_size-1)
-								neg_pos = 0;
-						} while (target == w_t);
+						target = draw_negative(w_t);
 
 						/* if random word form a strong a weak pair
 						 with w_c, move to next one */
@@ -741,11 +1652,11 @@ void *train_thread(void *id)
 						    contains(vocab[w_c].wp, target,
 						             vocab[w_c].n_wp))
 						{
-							++negsamp_discarded;
+							++local.negsamp_discarded;
 							continue;
 						}
 
-						++negsamp_total;
+						++local.negsamp_total;
 						label = 0.0;
 					}
 
@@ -756,6 +1667,12 @@ void *train_thread(void *id)
 					for (k = 0; k < args.dim; ++k)
 						dot_prod += WI[index1 + k] * WO[index2 + k];
 
+					if (metrics_fo != NULL)
+					{
+						local.loss += pair_loss(dot_prod, label);
+						++local.loss_pairs;
+					}
+
 					if (dot_prod > MAX_SIGMOID)
 						grad = args.alpha * (label - 1.0);
 					else if (dot_prod < -MAX_SIGMOID)
@@ -782,9 +1699,9 @@ void *train_thread(void *id)
 					if (vocab[w_c].n_sp == 0)
 						break;
 
-					if (vocab[w_c].pos_sp > vocab[w_c].n_sp - 1)
-						vocab[w_c].pos_sp = 0;
-					target = vocab[w_c].sp[vocab[w_c].pos_sp++];
+					target = next_pair(vocab[w_c].sp,
+					                   vocab[w_c].n_sp,
+					                   &vocab[w_c].pos_sp);
 
 					index2 = target * args.dim;
 					dot_prod = 0;
@@ -814,9 +1731,9 @@ void *train_thread(void *id)
 					if (vocab[w_c].n_wp == 0)
 						break;
 
-					if (vocab[w_c].pos_wp > vocab[w_c].n_wp - 1)
-						vocab[w_c].pos_wp = 0;
-					target = vocab[w_c].wp[vocab[w_c].pos_wp++];
+					target = next_pair(vocab[w_c].wp,
+					                   vocab[w_c].n_wp,
+					                   &vocab[w_c].pos_wp);
 
 					index2 = target * args.dim;
 					dot_prod = 0;
@@ -846,6 +1763,12 @@ void *train_thread(void *id)
 		}     /* end for each word in line */
 	}         /* end while() loop for reading file */
 
+	st->words             += word_count_local;
+	st->negsamp_discarded += local.negsamp_discarded;
+	st->negsamp_total     += local.negsamp_total;
+	st->loss              += local.loss;
+	st->loss_pairs        += local.loss_pairs;
+
 	/* sometimes, progress go over 100% because of rounding float error.
 	print a proper 100% progress */
 	if (args.alpha < 0) args.alpha = 0;
@@ -853,34 +1776,28 @@ void *train_thread(void *id)
 	       " %.2f%% ", 13, args.alpha, 100.0, wts, discarded);
 	fflush(stdout);
 
+	reader_free(&reader);
 	fclose(fi);
 	free(hidden);
+	if (args.minibatch)
+		batch_free(&batch);
 	pthread_exit(NULL);
 }
 
-/* save the word vectors in output file. If epoch > 0, add the suffix
- * indicating the epoch */
-void save_vectors(char *output, int epoch)
+/* write_vectors: write the vocab_size rows of matrix M (WI or WO) in filename,
+ * one word and its values per line after a line with the number of vectors and
+ * the dimension. If binary is set, the values are written as float32 instead
+ * of text with 3 decimals (the word2vec binary format), so they can be loaded
+ * back with -init-vectors/-init-context without losing precision. Return 0 or
+ * ERR_FILE. */
+int write_vectors(char *filename, float *M, int binary)
 {
 	FILE *fo;
-	char suffix[15], copy[MAXLEN];
 	int i, j;
 
-	if (epoch > 0)
-	{
-		sprintf(suffix, "-epoch-%d.vec", epoch);
-		strcpy(copy, output);
-		fo = fopen(strcat(copy, suffix), "w");
-	}
-
-	else
-		fo = fopen(strcat(output, ".vec"), "w");
-
-	if (fo == NULL)
-	{
-		printf("Cannot open %s: permission denied\n", output);
-		exit(1);
-	}
+	if ((fo = fopen(filename, "wb")) == NULL)
+		return error(ERR_FILE, "Cannot open %s: permission denied",
+		             filename);
 
 	/* first line is number of vectors + dimension */
 	fprintf(fo, "%ld %d\n", vocab_size, args.dim);
@@ -889,13 +1806,41 @@ void save_vectors(char *output, int epoch)
 	{
 		fprintf(fo, "%s ", vocab[i].word);
 
-		for (j = 0; j < args.dim; j++)
-			fprintf(fo, "%.3f ", WI[i * args.dim + j]);
+		if (binary)
+			fwrite(M + (long) i * args.dim, sizeof *M, args.dim, fo);
+		else
+			for (j = 0; j < args.dim; j++)
+				fprintf(fo, "%.3f ", M[i * args.dim + j]);
 
 		fprintf(fo, "\n");
 	}
 
 	fclose(fo);
+	return 0;
+}
+
+/* save the word vectors in output file. If epoch > 0, add the suffix
+ * indicating the epoch. With -binary 1, WI and WO are also saved in binary
+ * in <output>.bin and <output>-context.bin. Return 0 or ERR_FILE. */
+int save_vectors(char *output, int epoch)
+{
+	char base[MAXLEN + 20], filename[MAXLEN + 40];
+	int err;
+
+	if (epoch > 0)
+		sprintf(base, "%s-epoch-%d", output, epoch);
+	else
+		strcpy(base, output);
+
+	sprintf(filename, "%s.vec", base);
+	if ((err = write_vectors(filename, WI, 0)) < 0 || !args.binary)
+		return err;
+
+	sprintf(filename, "%s.bin", base);
+	if ((err = write_vectors(filename, WI, 1)) < 0)
+		return err;
+	sprintf(filename, "%s-context.bin", base);
+	return write_vectors(filename, WO, 1);
 }
 
 int arg_pos(char *str, int argc, char **argv)
@@ -965,7 +1910,29 @@ void print_help()
 	"  -epoch <int>\n"
 	"    Number of epoch; default 1\n\n"
 	"  -save-each-epoch <int>\n"
-	"    Save the embeddings after each epoch; 0 (off, default), 1 (on)"
+	"    Save the embeddings after each epoch; 0 (off, default), 1 (on)\n\n"
+	"  -minibatch <int>\n"
+	"    Share the negative samples between all the context words of a\n"
+	"    window and update them as dense matrix blocks (faster); 0 (off,\n"
+	"    default), 1 (on)\n\n"
+	"  -metrics-file <file>\n"
+	"    Write training metrics (speed, learning rate, loss, duration of\n"
+	"    each phase) as JSON lines in <file>\n\n"
+	"  -metrics-interval <float>\n"
+	"    Number of seconds between two lines of metrics; default 1.0"
+	);
+
+	printf(
+	"\n\n"
+	"  -binary <int>\n"
+	"    Also save the word and context vectors in binary in <file>.bin\n"
+	"    and <file>-context.bin; 0 (off, default), 1 (on)\n\n"
+	"  -init-vectors <file>\n"
+	"    Initialize the vectors of the words found in <file> (.vec or\n"
+	"    .bin) instead of random values, to continue training a model\n\n"
+	"  -init-context <file>\n"
+	"    Same for the context vectors (<file>-context.bin of a model\n"
+	"    saved with -binary 1)"
 	);
 
 	printf(
@@ -992,6 +1959,12 @@ void parse_args(int argc, char **argv, struct parameters *args,
 			strcpy(args->input, *++argv);
 		if (strcmp(*argv, "-output") == 0)
 			strcpy(args->output, *++argv);
+		if (strcmp(*argv, "-metrics-file") == 0)
+			strcpy(args->metrics_file, *++argv);
+		if (strcmp(*argv, "-init-vectors") == 0)
+			strcpy(args->init_vectors, *++argv);
+		if (strcmp(*argv, "-init-context") == 0)
+			strcpy(args->init_context, *++argv);
 
 		/* integer arguments */
 		if (strcmp(*argv, "-size") == 0)
@@ -1012,6 +1985,10 @@ void parse_args(int argc, char **argv, struct parameters *args,
 			args->epoch = atoi(*++argv);
 		if (strcmp(*argv, "-save-each-epoch") == 0)
 			args->save_each_epoch = atoi(*++argv);
+		if (strcmp(*argv, "-minibatch") == 0)
+			args->minibatch = atoi(*++argv);
+		if (strcmp(*argv, "-binary") == 0)
+			args->binary = atoi(*++argv);
 
 		/* float arguments */
 		if (strcmp(*argv, "-alpha") == 0)
@@ -1022,61 +1999,74 @@ void parse_args(int argc, char **argv, struct parameters *args,
 			args->beta_strong = atof(*++argv);
 		if (strcmp(*argv, "-beta-weak") == 0)
 			args->beta_weak = atof(*++argv);
+		if (strcmp(*argv, "-metrics-interval") == 0)
+			args->metrics_interval = atof(*++argv);
 	}
 }
 
-int main(int argc, char **argv)
+/* train: open the metrics file (if any), build the vocabulary from args.input
+ * and the strong/weak pairs files, then train WI and WO for args.epoch epochs.
+ * If save_each_epoch is set, vectors are saved at the end of each epoch. The
+ * vocab, the network and the negative table are not freed. Return 0, or the
+ * first error (training stops at the end of the epoch where it happened).
+ */
+int train(char *spairs_file, char *wpairs_file)
 {
-	char spairs_file[MAXLEN], wpairs_file[MAXLEN];
-	int i;
-	pthread_t *threads;
-
-	/* no arguments given. Print help and exit */
-	if (argc == 1)
-	{
-		print_help();
-		return 0;
-	}
+	int i, err;
+	double phase_start;
+	pthread_t *threads = NULL, metrics;
 
-	parse_args(argc, argv, &args, spairs_file, wpairs_file);
-
-	if (strlen(args.input) == 0)
-	{
-		printf("Cannot train the model without: -input <file>\n");
-		exit(1);
-	}
+	if (strlen(args.metrics_file) > 0 &&
+	    (metrics_fo = fopen(args.metrics_file, "w")) == NULL)
+		return error(ERR_FILE, "Cannot open %s: permission denied",
+		             args.metrics_file);
 
 	/* initialise vocabulary table */
 	vocab = (struct entry *)calloc(vocab_max_size, sizeof(struct entry));
-	vocab_hash = (int *)calloc(HASHSIZE, sizeof(int));
-
+	vocab_hash = NULL; /* created and resized by read_vocab() */
 
-
-	/*********** train ***/
-	/* variable for future use */
-
-	if ((threads = calloc(args.num_threads, sizeof *threads)) == NULL)
+	if (vocab == NULL ||
+	    (threads = calloc(args.num_threads, sizeof *threads)) == NULL ||
+	    (stats = calloc(args.num_threads, sizeof *stats)) == NULL)
 	{
-		printf("Cannot allocate memory for threads\n");
-		exit(1);
+		free(threads);
+		return error(ERR_MEMORY, "Cannot allocate memory for threads");
 	}
 
 	/* get words from input file */
 	printf("Starting training using file %s\n", args.input);
-	read_vocab(args.input, spairs_file, wpairs_file);
+	err = read_vocab(args.input, spairs_file, wpairs_file);
+
+	/* the minibatch mode searches the pairs instead of reading them all */
+	if (err == 0 && args.minibatch)
+		err = sort_pairs();
 
 	/* instantiate the network */
-	init_network();
+	if (err == 0)
+		err = init_network();
 
 	/* instantiate negative table (for negative sampling) */
-	if (args.negative > 0)
-		init_negative_table();
+	phase_start = wall_time();
+	if (err == 0 && args.negative > 0)
+		err = init_negative_table();
+
+	if (err < 0)
+	{
+		free(threads);
+		return err;
+	}
+	log_phase("negative_table", 0, wall_time() - phase_start);
 
 	/* train the model for multiple epoch */
-	start = clock();
-	for (current_epoch = 0; current_epoch < args.epoch; current_epoch++)
+	start = wall_time();
+	if (metrics_fo != NULL)
+		pthread_create(&metrics, NULL, metrics_thread, NULL);
+
+	for (current_epoch = 0; current_epoch < args.epoch && err == 0;
+	     current_epoch++)
 	{
 		printf("\n-- Epoch %d/%d\n", current_epoch+1, args.epoch);
+		phase_start = wall_time();
 
 		/* create threads */
 		for (i = 0; i < args.num_threads; i++)
@@ -1087,31 +2077,196 @@ int main(int argc, char **argv)
 		 */
 		for (i = 0; i < args.num_threads; i++)
 			pthread_join(threads[i], NULL);
+		log_phase("epoch", current_epoch+1, wall_time() - phase_start);
 
-		if (args.save_each_epoch)
+		if ((err = thread_error) == 0 && args.save_each_epoch)
 		{
 			printf("\nSaving vectors for epoch %d.", current_epoch+1);
-			save_vectors(args.output, current_epoch+1);
+			phase_start = wall_time();
+			err = save_vectors(args.output, current_epoch+1);
+			log_phase("save", current_epoch+1,
+			          wall_time() - phase_start);
 		}
 
 	}
 
+	/* training is done, tell the metrics thread to stop */
+	if (metrics_fo != NULL)
+	{
+		pthread_mutex_lock(&metrics_lock);
+		metrics_stop = 1;
+		pthread_cond_signal(&metrics_cond);
+		pthread_mutex_unlock(&metrics_lock);
+		pthread_join(metrics, NULL);
+	}
+
+	free(threads);
+	return err;
+}
+
+/* dict2vec_train: entry point of the shared library (libdict2vec.so). Train
+ * the model with the parameters in params (same fields as the command line
+ * options) and give to the caller the ownership of the learned matrices and of
+ * the vocabulary instead of saving them in a file:
+ *   - *wi points to the vocab_size x dim matrix WI
+ *   - *wo points to the vocab_size x dim matrix WO (freed if wo is NULL)
+ *   - *words points to the vocab_size words, in the same order as the rows
+ *     (freed if words is NULL)
+ * Everything must be released with dict2vec_free() and dict2vec_free_words().
+ * Return the number of words in the vocabulary, or on error ERR_INVALID,
+ * ERR_FILE or ERR_MEMORY. Nothing is returned to the caller in this case
+ * (everything is freed) and dict2vec_error() gives the error message.
+ */
+long dict2vec_train(struct parameters *params, char *spairs_file,
+                    char *wpairs_file, float **wi, float **wo, char ***words)
+{
+	long i, n_words;
+	int err;
+
+	if (strlen(params->input) == 0 || params->metrics_interval <= 0 ||
+	    params->num_threads < 1 || params->dim < 1 || params->window < 0 ||
+	    params->negative < 0 || params->strong_draws < 0 ||
+	    params->weak_draws < 0)
+		return error(ERR_INVALID, "Invalid training parameters");
+
+	/* reset the state left by a previous call */
+	args = *params;
+	args.alpha = args.starting_alpha;
+	vocab_max_size = 10000;
+	vocab_size = train_words = file_size = word_count_actual = 0;
+	current_epoch = neg_pos = 0;
+	table_size = 1e7;
+	table = NULL;
+	vocab = NULL;
+	vocab_hash = NULL;
+	stats = NULL;
+	metrics_fo = NULL;
+	metrics_stop = 0;
+	thread_error = 0;
+	last_error[0] = '\0';
+	srand(1); /* same random values as ./dict2vec for the same parameters */
+
+	err = train(spairs_file, wpairs_file);
+	printf("\n");
+
+	if (metrics_fo != NULL)
+		fclose(metrics_fo);
+
+	/* give the words to the caller, so they are not freed with vocab */
+	if (err == 0 && words != NULL)
+	{
+		if ((*words = malloc(vocab_size * sizeof **words)) == NULL)
+			err = error(ERR_MEMORY, "Cannot allocate memory for "
+			            "the words");
+
+		for (i = 0; err == 0 && i < vocab_size; ++i)
+		{
+			(*words)[i] = vocab[i].word;
+			vocab[i].word = NULL;
+		}
+	}
+
+	if (err == 0)
+	{
+		*wi = WI;
+		if (wo != NULL)
+			*wo = WO;
+		else
+			free(WO);
+		WI = WO = NULL;
+	}
+
+	n_words = vocab_size;
+	free(table);
+	free(stats);
+	destroy_network();
+	destroy_vocab();
+	free(vocab_hash);
+
+	return err < 0 ? err : n_words;
+}
+
+/* dict2vec_error: return the message of the last error of dict2vec_train() */
+const char *dict2vec_error()
+{
+	return last_error;
+}
+
+/* dict2vec_free: free a matrix returned by dict2vec_train() */
+void dict2vec_free(float *matrix)
+{
+	free(matrix);
+}
+
+/* dict2vec_free_words: free the words returned by dict2vec_train() */
+void dict2vec_free_words(char **words, long n_words)
+{
+	long i;
+
+	for (i = 0; i < n_words; ++i)
+		free(words[i]);
+	free(words);
+}
+
+/* the shared library is compiled with -DDICT2VEC_LIBRARY and has no main() */
+#ifndef DICT2VEC_LIBRARY
+int main(int argc, char **argv)
+{
+	char spairs_file[MAXLEN] = "", wpairs_file[MAXLEN] = "";
+	double phase_start;
+
+	/* no arguments given. Print help and exit */
+	if (argc == 1)
+	{
+		print_help();
+		return 0;
+	}
+
+	parse_args(argc, argv, &args, spairs_file, wpairs_file);
+
+	if (strlen(args.input) == 0)
+	{
+		printf("Cannot train the model without: -input <file>\n");
+		exit(1);
+	}
+
+	if (args.metrics_interval <= 0)
+	{
+		printf("-metrics-interval must be positive\n");
+		exit(1);
+	}
+
+	if (args.window < 0 || args.negative < 0 || args.strong_draws < 0 ||
+	    args.weak_draws < 0)
+	{
+		printf("-window, -negative, -strong-draws and -weak-draws can "
+		       "not be negative\n");
+		exit(1);
+	}
+
+	if (train(spairs_file, wpairs_file) < 0)
+		exit(1);
+
 	/* save the file only if we didn't save it earlier with the
 	 * save-each-epoch option */
 	if (!args.save_each_epoch)
 	{
 		printf("\n-- Saving word embeddings\n");
-		save_vectors(args.output, -1);
+		phase_start = wall_time();
+		if (save_vectors(args.output, -1) < 0)
+			exit(1);
+		log_phase("save", args.epoch, wall_time() - phase_start);
 	}
 
+	if (metrics_fo != NULL)
+		fclose(metrics_fo);
+
 	free(table);
-	free(threads);
+	free(stats);
 	destroy_vocab();
-
-	/******** end train ****/
-
 	destroy_network();
 	free(vocab_hash);
 
 	return 0;
 }
+#endif
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Train Dict2vec embeddings from Python without writing a .vec file.
+
+The C trainer is loaded as a shared library (build it with `make lib`) and the
+learned matrices are returned as NumPy arrays sharing the memory allocated by
+the C code (no copy). ctypes releases the GIL while the C code is training, so
+other Python threads keep running. The C code keeps its state in global
+variables, so only one training runs at a time: concurrent calls to train()
+wait for the previous one to finish.
+
+    import dict2vec
+    words, WI = dict2vec.train("data/enwiki-50M", size=100, threads=8)
+"""
+
+import os
+import ctypes
+import threading
+import weakref
+import numpy as np
+
+MAXLEN = 100
+LIB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                        "libdict2vec.so")
+
+# errors returned by dict2vec_train() (ERR_* in dict2vec.c)
+ERRORS = {-1: ValueError, -2: OSError, -3: MemoryError}
+
+
+class Parameters(ctypes.Structure):
+    """Mirror of `struct parameters` in dict2vec.c (same fields, same order)"""
+    _fields_ = [
+        ("input", ctypes.c_char * MAXLEN),
+        ("output", ctypes.c_char * MAXLEN),
+        ("metrics_file", ctypes.c_char * MAXLEN),
+        ("init_vectors", ctypes.c_char * MAXLEN),
+        ("init_context", ctypes.c_char * MAXLEN),
+        ("dim", ctypes.c_int),
+        ("window", ctypes.c_int),
+        ("min_count", ctypes.c_int),
+        ("negative", ctypes.c_int),
+        ("strong_draws", ctypes.c_int),
+        ("weak_draws", ctypes.c_int),
+        ("num_threads", ctypes.c_int),
+        ("epoch", ctypes.c_int),
+        ("save_each_epoch", ctypes.c_int),
+        ("minibatch", ctypes.c_int),
+        ("binary", ctypes.c_int),
+        ("alpha", ctypes.c_float),
+        ("starting_alpha", ctypes.c_float),
+        ("sample", ctypes.c_float),
+        ("beta_strong", ctypes.c_float),
+        ("beta_weak", ctypes.c_float),
+        ("metrics_interval", ctypes.c_float),
+    ]
+
+
+_lib = None
+_lock = threading.Lock()
+
+def load_library(path=LIB_PATH):
+    """Load the shared library (only once) and declare the function types"""
+    global _lib
+    if _lib is not None:
+        return _lib
+
+    if not os.path.isfile(path):
+        raise OSError("{} not found, run `make lib` first".format(path))
+
+    lib = ctypes.CDLL(path)
+    c_float_p = ctypes.POINTER(ctypes.c_float)
+    lib.dict2vec_train.restype = ctypes.c_long
+    lib.dict2vec_train.argtypes = [
+        ctypes.POINTER(Parameters), ctypes.c_char_p, ctypes.c_char_p,
+        ctypes.POINTER(c_float_p), ctypes.POINTER(c_float_p),
+        ctypes.POINTER(ctypes.POINTER(ctypes.c_char_p)),
+    ]
+    lib.dict2vec_error.restype = ctypes.c_char_p
+    lib.dict2vec_error.argtypes = []
+    lib.dict2vec_free.restype = None
+    lib.dict2vec_free.argtypes = [ctypes.c_void_p]
+    lib.dict2vec_free_words.restype = None
+    lib.dict2vec_free_words.argtypes = [ctypes.POINTER(ctypes.c_char_p),
+                                        ctypes.c_long]
+    _lib = lib
+    return lib
+
+
+def _as_array(lib, ptr, n_words, dim):
+    """Wrap the matrix allocated by the C code into a (n_words, dim) array
+    without copy. The memory is freed when the array is garbage collected."""
+    address = ctypes.cast(ptr, ctypes.c_void_p).value
+    buf = (ctypes.c_float * (n_words * dim)).from_address(address)
+    weakref.finalize(buf, lib.dict2vec_free, address)
+    return np.frombuffer(buf, dtype=np.float32).reshape(n_words, dim)
+
+
+def _encode(path, name):
+    """Convert a filename to bytes, checking it fits in the C buffer"""
+    path = os.fsencode(path)
+    if len(path) >= MAXLEN:
+        raise ValueError("{} filename must be shorter than {} bytes".format(
+                         name, MAXLEN))
+    return path
+
+
+def _check_vectors(path, size, name):
+    """Check the header of a .vec/.bin file (number of vectors and dimension),
+    so a wrong file is reported before training starts"""
+    with open(path, "rb") as f:
+        header = f.readline().split()
+    try:
+        n_vectors, dim = (int(x) for x in header)
+    except ValueError:
+        raise ValueError("{} file {} has no `n dim` header".format(name, path))
+    if n_vectors < 0 or dim != size:
+        raise ValueError("{} file {} contains vectors of size {}, not {}"
+                         .format(name, path, dim, size))
+
+
+def train(input, strong_file="", weak_file="", size=100, window=5,
+          min_count=5, negative=5, strong_draws=0, weak_draws=0,
+          beta_strong=1.0, beta_weak=0.25, alpha=0.025, sample=1e-4,
+          threads=1, epoch=1, minibatch=False, metrics_file="",
+          metrics_interval=1.0, output="", save_each_epoch=False,
+          binary=False, init_vectors="", init_context="",
+          return_context=False):
+    """
+    Train Dict2vec on the text file <input>. Parameters have the same meaning
+    and default values as the command line options of ./dict2vec. If
+    save_each_epoch is True, vectors are also saved in <output> after each
+    epoch (also in binary if binary is True). init_vectors and init_context
+    are .vec or .bin files of a previous model used to initialize the vectors
+    of the words they contain.
+
+    Return (words, WI) where words is the list of words of the vocabulary and
+    WI a float32 array of shape (len(words), size) whose i-th row is the
+    vector of words[i]. If return_context is True, return (words, WI, WO).
+    Errors of the C code are raised as ValueError (invalid parameters or
+    vectors file), OSError (a file cannot be opened) or MemoryError.
+    """
+    if not os.path.isfile(input):
+        raise FileNotFoundError(input)
+    if save_each_epoch and not output:
+        raise ValueError("save_each_epoch requires an output filename")
+    for path, name in ((init_vectors, "init vectors"),
+                       (init_context, "init context")):
+        if path and not os.path.isfile(path):
+            raise FileNotFoundError(path)
+        if path:
+            _check_vectors(path, size, name)
+
+    lib = load_library()
+
+    params = Parameters(
+        _encode(input, "input"), _encode(output, "output"),
+        _encode(metrics_file, "metrics"),
+        _encode(init_vectors, "init vectors"),
+        _encode(init_context, "init context"),
+        size, window, min_count, negative, strong_draws, weak_draws, threads,
+        epoch, int(save_each_epoch), int(minibatch), int(binary),
+        alpha, alpha, sample, beta_strong, beta_weak, metrics_interval)
+
+    wi = ctypes.POINTER(ctypes.c_float)()
+    wo = ctypes.POINTER(ctypes.c_float)()
+    words = ctypes.POINTER(ctypes.c_char_p)()
+
+    with _lock:
+        n_words = lib.dict2vec_train(
+            ctypes.byref(params), _encode(strong_file, "strong pairs"),
+            _encode(weak_file, "weak pairs"), ctypes.byref(wi),
+            ctypes.byref(wo) if return_context else None, ctypes.byref(words))
+        if n_words < 0:
+            raise ERRORS.get(n_words, RuntimeError)(
+                lib.dict2vec_error().decode("utf-8", "replace"))
+
+        vocab = [words[i].decode("utf-8", "replace") for i in range(n_words)]
+        lib.dict2vec_free_words(words, n_words)
+
+    WI = _as_array(lib, wi, n_words, size)
+    if return_context:
+        return vocab, WI, _as_array(lib, wo, n_words, size)
+    return vocab, WI
@@ -24,12 +24,13 @@ import sys
 import math
 import argparse
 import numpy as np
-import scipy.stats as st
 
 FILE_DIR = "data/eval/"
 results      = dict()
 missed_pairs = dict()
 missed_words = dict()
+memory_used  = dict()
+samples      = dict() # similarities of each file, kept for bootstrap()
 
 
 def tanimotoSim(v1, v2):
@@ -44,6 +45,55 @@ def cosineSim(v1, v2):
     return dotProd / (np.linalg.norm(v1) * np.linalg.norm(v2))
 
 
+def rankdata(a):
+    """Return the ranks (starting at 1) of the values of a along its last
+    axis. Tied values get the average of their ranks."""
+    a = np.asarray(a, dtype=float)
+    n = a.shape[-1]
+    order = np.argsort(a, axis=-1, kind="stable")
+    sorted_a = np.take_along_axis(a, order, axis=-1)
+
+    # first and last position of the group of ties of each sorted value
+    positions = np.arange(n)
+    first = np.ones(a.shape, dtype=bool)
+    first[..., 1:] = sorted_a[..., 1:] != sorted_a[..., :-1]
+    last = np.ones(a.shape, dtype=bool)
+    last[..., :-1] = first[..., 1:]
+    start = np.maximum.accumulate(np.where(first, positions, 0), axis=-1)
+    end = np.minimum.accumulate(np.where(last, positions, n - 1)[..., ::-1],
+                                axis=-1)[..., ::-1]
+
+    ranks = np.empty(a.shape)
+    np.put_along_axis(ranks, order, (start + end) / 2.0 + 1, axis=-1)
+    return ranks
+
+
+def spearman(x, y):
+    """Return the Spearman's rank correlation coefficient between x and y,
+    computed along their last axis (so rows of 2D arrays are evaluated at
+    once). NaN if x or y is constant or contains NaN, like
+    scipy.stats.spearmanr()."""
+    x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+    rx, ry = rankdata(x), rankdata(y)
+    rx -= rx.mean(axis=-1, keepdims=True)
+    ry -= ry.mean(axis=-1, keepdims=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rho = (rx * ry).sum(axis=-1) / np.sqrt((rx * rx).sum(axis=-1) *
+                                               (ry * ry).sum(axis=-1))
+    nan = np.isnan(x).any(axis=-1) | np.isnan(y).any(axis=-1)
+    return np.where(nan, np.nan, rho)[()]
+
+
+def scipy_spearman(x, y):
+    """Same as spearman(), computed by SciPy (only imported when used)"""
+    import scipy.stats as st
+    return st.spearmanr(x, y)[0]
+
+# function computing the score of an evaluation file (-scipy to check
+# spearman() against SciPy)
+correlation = spearman
+
+
 def init_results():
     """Read the filename for each file in the evaluation directory"""
     for filename in os.listdir(FILE_DIR):
@@ -51,10 +101,11 @@ def init_results():
             results[filename] = []
 
 
-def evaluate(filename):
-    """Compute Spearman rank coefficient for each evaluation file"""
+def load_embedding(filename):
+    """Read the embedding file and return the matrix of vectors and a dict
+    mapping each word to its row in the matrix"""
 
-    # step 0 : read the first line to get the number of words and the dimension
+    # read the first line to get the number of words and the dimension
     nb_line = 0
     nb_dims = 0
     with open(filename) as f:
@@ -78,7 +129,48 @@ def evaluate(filename):
             wordToNum[word] = count
             count += 1
 
-    # step 1 : iterate over each evaluation data file and compute spearman
+    return mat, wordToNum
+
+
+def evaluate(filename, baseline=None):
+    """Compute Spearman rank coefficient for each evaluation file. Files with
+    the .npz extension are quantized embeddings (see quantize.py), evaluated
+    directly on their codes. If baseline is the (mat, wordToNum) of the float
+    embedding they come from, product quantized files are evaluated with
+    asymmetric distance tables: the first word of each pair is the float
+    query, the second one is only known by its codes."""
+    if filename.endswith(".npz"):
+        from quantize import load_quantized, ProductQuantized
+        model = load_quantized(filename)
+        memory_used[filename] = model.nbytes
+        similarity = model.similarity
+        if baseline is not None and isinstance(model, ProductQuantized):
+            mat, wordToNum = baseline
+            queries = mat[[wordToNum[w] for w in model.words]]
+            similarity = model.asymmetric_similarity(queries)
+        return evaluate_similarity(similarity, model.wordToNum)
+
+    mat, wordToNum = load_embedding(filename)
+    memory_used[filename] = len(wordToNum) * mat.shape[1] * 4
+    return evaluate_embedding(mat, wordToNum)
+
+
+def evaluate_embedding(mat, wordToNum, record=True):
+    """Compute Spearman rank coefficient for each evaluation file with the
+    vectors of mat (wordToNum maps each word to its row in mat)"""
+    # use tanimotoSim instead to evaluate with the Tanimoto similarity
+    return evaluate_similarity(lambda i, j: cosineSim(mat[i], mat[j]),
+                               wordToNum, record)
+
+
+def evaluate_similarity(similarity, wordToNum, record=True):
+    """Compute Spearman rank coefficient for each evaluation file, where
+    similarity(i, j) is the similarity between the words of index i and j.
+    Return the coefficient of each file. If record is True, also add them to
+    the results used by stats()."""
+    scores = dict()
+
+    # iterate over each evaluation data file and compute spearman
     for filename in results:
         pairs_not_found, total_pairs = 0, 0
         words_not_found, total_words = 0, 0
@@ -98,19 +190,20 @@ def evaluate(filename):
                 if not w1 in wordToNum or not w2 in wordToNum:
                     pairs_not_found += 1
                 else:
-                    v1, v2 = mat[wordToNum[w1]], mat[wordToNum[w2]]
-                    cosine = cosineSim(v1, v2)
+                    sim = similarity(wordToNum[w1], wordToNum[w2])
                     file_similarity.append(val)
-                    embedding_similarity.append(cosine)
+                    embedding_similarity.append(sim)
 
-                    #tanimoto = tanimotoSim(v1, v2)
-                    #file_similarity.append(val)
-                    #embedding_similarity.append(tanimoto)
+            rho = correlation(file_similarity, embedding_similarity)
+            scores[filename] = rho
+            if record:
+                results[filename].append(rho)
+                samples.setdefault(filename, []).append(
+                    (np.array(file_similarity), np.array(embedding_similarity)))
+                missed_pairs[filename] = (pairs_not_found, total_pairs)
+                missed_words[filename] = (words_not_found, total_words)
 
-            rho, p_val = st.spearmanr(file_similarity, embedding_similarity)
-            results[filename].append(rho)
-            missed_pairs[filename] = (pairs_not_found, total_pairs)
-            missed_words[filename] = (words_not_found, total_words)
+    return scores
 
 
 def stats():
@@ -155,6 +248,114 @@ def stats():
                                 weighted_avg / total_found))
 
 
+def bootstrap(nb_resamples=1000, confidence=0.95, seed=0, batch_size=100):
+    """Estimate a confidence interval of the score of each evaluated embedding
+    on each evaluation file (and of the weighted average) by resampling the
+    pairs of the files with replacement. The resamples of all the files are
+    drawn at once as a matrix of indexes, <batch_size> resamples at a time,
+    and evaluated together. The random draws are the same for all the
+    embeddings, so those which found the same pairs are evaluated on the same
+    resamples. Return {filename: [(low, high) of each embedding]}."""
+    filenames = sorted(samples.keys())
+    nb_models = len(samples[filenames[0]])
+    rng = np.random.default_rng(seed)
+
+    # rho[filename][model] is the score of each resample
+    rho = {f: [np.empty(nb_resamples) for m in range(nb_models)]
+           for f in filenames}
+    sizes = np.array([missed_pairs[f][1] for f in filenames])
+    for b in range(0, nb_resamples, batch_size):
+        n = min(batch_size, nb_resamples - b)
+        # one column per pair of each file, with a value in [0, 1) scaled to
+        # the number of pairs found by each embedding
+        draws = np.split(rng.random((n, sizes.sum())), np.cumsum(sizes)[:-1],
+                         axis=1)
+        for f, u in zip(filenames, draws):
+            for m, (x, y) in enumerate(samples[f]):
+                # a resample has as many pairs as the embedding has found
+                idx = (u[:, :len(x)] * len(x)).astype(int)
+                rho[f][m][b:b+n] = spearman(x[idx], y[idx])
+
+    alpha = (1 - confidence) / 2
+    intervals = {f: [tuple(np.nanquantile(r, [alpha, 1 - alpha]))
+                     for r in rho[f]] for f in filenames}
+
+    # weighted average of each resample, with the same weights as stats()
+    w_avg = [weighted_average({f: rho[f][m] for f in filenames}, m)
+             for m in range(nb_models)]
+    intervals["W.Average"] = [tuple(np.nanquantile(r, [alpha, 1 - alpha]))
+                              for r in w_avg]
+    return intervals
+
+
+def weighted_average(scores, model):
+    """Average of the scores of each file of the embedding number <model>,
+    weighted by the number of pairs it found in each file (as in stats())"""
+    found = {f: len(samples[f][model][0]) for f in scores}
+    return sum(found[f] * scores[f] for f in scores) / sum(found.values())
+
+
+def print_intervals(intervals, names, nb_resamples, confidence):
+    """Print the confidence intervals returned by bootstrap() with the score
+    of each embedding"""
+    names = [os.path.basename(f)[-22:].ljust(22) for f in names]
+    title = "{}| {}".format("Filename".ljust(16), "| ".join(names))
+    print("\nBootstrap {:.0f}% confidence intervals ({} resamples)".format(
+          confidence * 100, nb_resamples))
+    print(title)
+    print("="*len(title))
+
+    for filename in sorted(intervals.keys()):
+        if filename == "W.Average":
+            continue
+        cells = ["{:.3f} [{:.3f},{:.3f}]".format(rho, low, high).ljust(22)
+                 for rho, (low, high) in zip(results[filename],
+                                             intervals[filename])]
+        print("{}| {}".format(filename.ljust(16), "| ".join(cells)))
+
+    print("-"*len(title))
+    cells = []
+    for m, (low, high) in enumerate(intervals["W.Average"]):
+        avg = weighted_average({f: results[f][m] for f in results}, m)
+        cells.append("{:.3f} [{:.3f},{:.3f}]".format(avg, low, high).ljust(22))
+    print("{}| {}".format("W.Average".ljust(16), "| ".join(cells)))
+
+
+def compare(baseline, scores):
+    """Compare the scores of quantized embeddings with the scores of the
+    float embedding they come from: for each evaluation file, print the score
+    of each quantized embedding and its loss, next to the memory they use.
+    baseline is the (mat, wordToNum) of the float embedding."""
+    mat, wordToNum = baseline
+    base_scores = evaluate_embedding(mat, wordToNum, record=False)
+    base_memory = len(wordToNum) * mat.shape[1] * 4
+    quantized = [f for f in scores if f.endswith(".npz")]
+
+    # scores are printed with a sign column so negative ones stay aligned
+    names = [os.path.basename(f)[-18:].ljust(18) for f in quantized]
+    base = "{:.1f}MB".format(base_memory / 1e6)
+    width = max(len(base), 6)
+    title = "{}| {}| {}".format("Filename".ljust(16), "FLOAT".ljust(width),
+                                "| ".join(names))
+    print()
+    print(title)
+    print("="*len(title))
+
+    memory = ["{:.1f}MB ({:.1f}x)".format(memory_used[f] / 1e6,
+              base_memory / memory_used[f]).ljust(18) for f in quantized]
+    print("{}| {}| {}".format("Memory".ljust(16), base.ljust(width),
+                              "| ".join(memory)))
+    print("-"*len(title))
+
+    for filename in sorted(base_scores.keys()):
+        cells = ["{:6.3f} ({:+.3f})".format(scores[f][filename],
+                 scores[f][filename] - base_scores[filename]).ljust(18)
+                 for f in quantized]
+        print("{}| {}| {}".format(filename.ljust(16),
+              "{:6.3f}".format(base_scores[filename]).ljust(width),
+              "| ".join(cells)))
+
+
 if __name__ == '__main__':
 
     parser = argparse.ArgumentParser(
@@ -163,10 +364,38 @@ if __name__ == '__main__':
 
     parser.add_argument('filenames', metavar='FILE', nargs='+',
                         help='Filename of word embedding to evaluate.')
+    parser.add_argument('-b', '--baseline', metavar='FILE',
+                        help="""Float embedding the quantized (.npz) files
+                        come from. Print the memory reduction and the score
+                        loss of each quantized file compared to it. Product
+                        quantized files are then scored with asymmetric
+                        distance tables (float query, quantized word).""")
+    parser.add_argument('-n', '--bootstrap', metavar='N', type=int, default=0,
+                        help="""Also print a confidence interval of each
+                        score, computed from N resamples of the pairs of the
+                        evaluation files (e.g. 1000).""")
+    parser.add_argument('-c', '--confidence', type=float, default=0.95,
+                        help="""Confidence level of the intervals of
+                        --bootstrap (default: 0.95).""")
+    parser.add_argument('--scipy', action='store_true', help="""Compute the
+                        Spearman's correlation with SciPy instead of NumPy
+                        (slower to start, the scores are the same).""")
 
     args = parser.parse_args()
+    if args.scipy:
+        correlation = scipy_spearman
 
     init_results()
+    baseline = load_embedding(args.baseline) if args.baseline else None
+    scores = dict()
     for f in args.filenames:
-        evaluate(f)
+        scores[f] = evaluate(f, baseline)
     stats()
+
+    if args.bootstrap > 0:
+        intervals = bootstrap(args.bootstrap, args.confidence)
+        print_intervals(intervals, args.filenames, args.bootstrap,
+                        args.confidence)
+
+    if baseline is not None:
+        compare(baseline, scores)
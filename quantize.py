@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import argparse
+import numpy as np
+from functools import lru_cache
+from evaluate import load_embedding
+
+
+def scalar_quantize(mat):
+    """Quantize each vector of mat into int8 codes. Each vector has its own
+    scale (max absolute value / 127) so the cosine similarity can be computed
+    directly with the integer codes (the scale cancels out)."""
+    scales = np.abs(mat).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.rint(mat / scales[:, np.newaxis]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def kmeans(data, k, iterations=20, seed=0):
+    """Return k centroids of data found with the Lloyd algorithm"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)]
+    for _ in range(iterations):
+        assign = nearest_centroid(data, centroids)
+        for c in range(k):
+            members = data[assign == c]
+            # empty cluster: restart it from a random vector
+            if len(members) == 0:
+                centroids[c] = data[rng.integers(len(data))]
+            else:
+                centroids[c] = members.mean(axis=0)
+    return centroids
+
+
+def nearest_centroid(data, centroids, chunk=65536):
+    """Return the index of the closest centroid of each row of data. Work by
+    chunks so the distance matrix always fits in memory."""
+    c_norms = (centroids ** 2).sum(axis=1)
+    assign = np.empty(len(data), dtype=np.int64)
+    for start in range(0, len(data), chunk):
+        block = data[start:start+chunk]
+        # ||x - c||^2 = ||x||^2 - 2 x.c + ||c||^2 and ||x||^2 does not change
+        # the argmin
+        dist = c_norms - 2 * block.dot(centroids.T)
+        assign[start:start+chunk] = dist.argmin(axis=1)
+    return assign
+
+
+def product_quantize(mat, m, k=256, sample=65536, iterations=20):
+    """Split the vectors of mat into m sub-vectors and quantize each sub-vector
+    with its own codebook of k centroids (learned on at most <sample> vectors).
+    Return the codes (one byte per sub-vector) and the codebooks with shape
+    (m, k, dim / m)."""
+    n, dim = mat.shape
+    if dim % m != 0:
+        raise ValueError("dimension {} is not a multiple of m={}".format(dim, m))
+    if k > 256:
+        raise ValueError("k must be at most 256 to store codes on one byte")
+
+    sub = dim // m
+    rng = np.random.default_rng(0)
+    train = mat[rng.choice(n, size=min(n, sample), replace=False)]
+
+    codebooks = np.empty((m, k, sub), dtype=np.float32)
+    codes = np.empty((n, m), dtype=np.uint8)
+    for i in range(m):
+        codebooks[i] = kmeans(train[:, i*sub:(i+1)*sub], k, iterations)
+        codes[:, i] = nearest_centroid(mat[:, i*sub:(i+1)*sub], codebooks[i])
+    return codes, codebooks
+
+
+class ScalarQuantized:
+    """Embedding stored as int8 codes (one scale per vector)"""
+    def __init__(self, words, codes, scales):
+        self.words = list(words)
+        self.wordToNum = {w: i for i, w in enumerate(self.words)}
+        self.codes = codes
+        self.scales = scales
+        self.norms = np.sqrt((codes.astype(np.int32) ** 2).sum(axis=1),
+                             dtype=np.float32)
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.scales.nbytes + self.norms.nbytes
+
+    def similarity(self, i, j):
+        """Cosine similarity computed on the integer codes"""
+        dot = np.dot(self.codes[i].astype(np.int32), self.codes[j])
+        return dot / (self.norms[i] * self.norms[j])
+
+    def decode(self):
+        return self.codes * self.scales[:, np.newaxis]
+
+
+class ProductQuantized:
+    """Embedding stored as product quantization codes"""
+    def __init__(self, words, codes, codebooks):
+        self.words = list(words)
+        self.wordToNum = {w: i for i, w in enumerate(self.words)}
+        self.codes = codes
+        self.codebooks = codebooks
+        self.sub = codebooks.shape[2]
+        # norm of each reconstructed vector = sqrt(sum of the squared norms
+        # of its centroids), precomputed per codebook
+        sq = (codebooks ** 2).sum(axis=2)
+        self.norms = np.sqrt(sq[np.arange(codes.shape[1]), codes].sum(axis=1))
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + self.codebooks.nbytes + self.norms.nbytes
+
+    def distance_table(self, query):
+        """Asymmetric distance table of a float query vector: inner product
+        between each sub-vector of query and each centroid of the
+        corresponding codebook, shape (m, k). The inner product between query
+        and word j is table[np.arange(m), codes[j]].sum()."""
+        query = query.reshape(len(self.codebooks), 1, self.sub)
+        return (self.codebooks * query).sum(axis=2)
+
+    def similarity(self, i, j):
+        """Cosine similarity between the reconstructed vectors of words i and
+        j (symmetric distance: both words are only known by their codes)"""
+        dot = np.dot(self.decode_row(i), self.decode_row(j))
+        return dot / (self.norms[i] * self.norms[j])
+
+    def asymmetric_similarity(self, queries, cache_size=256):
+        """Return a function similarity(i, j) giving the cosine similarity
+        between the float vector queries[i] and the codes of word j, scored
+        with the distance table of queries[i] (one lookup per sub-vector).
+        The tables of the <cache_size> last queries are kept, because words
+        appear in many pairs."""
+        subspaces = np.arange(len(self.codebooks))
+        q_norms = np.linalg.norm(queries, axis=1)
+
+        @lru_cache(maxsize=cache_size)
+        def table(i):
+            return self.distance_table(queries[i])
+
+        def similarity(i, j):
+            dot = table(i)[subspaces, self.codes[j]].sum()
+            return dot / (q_norms[i] * self.norms[j])
+        return similarity
+
+    def decode_row(self, i):
+        return self.codebooks[np.arange(len(self.codebooks)),
+                              self.codes[i]].reshape(-1)
+
+    def decode(self):
+        return self.codebooks[np.arange(len(self.codebooks)),
+                              self.codes].reshape(len(self.codes), -1)
+
+
+def save_quantized(filename, kind, words, codes, extra):
+    """Save a quantized embedding (extra is the scales or the codebooks)"""
+    with open(filename, "wb") as f:
+        np.savez(f, kind=kind, words=np.array(words), codes=codes, extra=extra)
+
+
+def load_quantized(filename):
+    """Load a file written by save_quantized()"""
+    data = np.load(filename)
+    kind = str(data["kind"])
+    if kind == "sq8":
+        return ScalarQuantized(data["words"], data["codes"], data["extra"])
+    if kind == "pq":
+        return ProductQuantized(data["words"], data["codes"], data["extra"])
+    raise ValueError("unknown quantization type: {}".format(kind))
+
+
+def float_nbytes(mat):
+    """Memory used by the float32 matrix of vectors"""
+    return mat.shape[0] * mat.shape[1] * 4
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+             description="Quantize word embeddings into int8 or product "
+                         "quantization codes.",
+             )
+    parser.add_argument('filename', metavar='FILE',
+                        help='Word embedding file (.vec) to quantize.')
+    parser.add_argument('-t', '--type', choices=["sq8", "pq"], default="sq8",
+                        help="""sq8: int8 scalar quantization (about 4x
+                        smaller), pq: product quantization (default: sq8).""")
+    parser.add_argument('-m', type=int, default=0, help="""Number of
+                        sub-vectors for product quantization. Each vector is
+                        stored on m bytes (default: dimension / 4).""")
+    parser.add_argument('-k', type=int, default=256, help="""Number of
+                        centroids of each codebook, at most 256 (default:
+                        256).""")
+    parser.add_argument('-o', '--output', help="""Output filename (default:
+                        FILE with the .sq8.npz or .pq.npz extension).""")
+    args = parser.parse_args()
+
+    output = args.output or "{}.{}.npz".format(
+             os.path.splitext(args.filename)[0], args.type)
+
+    print("Loading {} ... ".format(args.filename), end="", flush=True)
+    mat, wordToNum = load_embedding(args.filename)
+    mat = mat[:len(wordToNum)].astype(np.float32)
+    words = sorted(wordToNum, key=wordToNum.get)
+    print("Done.")
+
+    print("Quantizing {} vectors of dimension {} ({}) ... ".format(
+          mat.shape[0], mat.shape[1], args.type), end="", flush=True)
+    if args.type == "sq8":
+        codes, extra = scalar_quantize(mat)
+    else:
+        m = args.m or max(1, mat.shape[1] // 4)
+        codes, extra = product_quantize(mat, m, args.k)
+    save_quantized(output, args.type, words, codes, extra)
+    print("Done.")
+
+    if args.type == "sq8":
+        quantized = ScalarQuantized(words, codes, extra).nbytes
+    else:
+        quantized = ProductQuantized(words, codes, extra).nbytes
+    print("Memory: {:.1f} MB -> {:.1f} MB ({:.1f}x smaller)".format(
+          float_nbytes(mat) / 1e6, quantized / 1e6,
+          float_nbytes(mat) / quantized))
+    print("-> Results written in", output)
@@ -0,0 +1,404 @@
+#!/usr/bin/env python3
+#
+# Copyright (c) 2017-present, All rights reserved.
+# Written by Julien Tissier <30314448+tca19@users.noreply.github.com>
+#
+# This file is part of Dict2vec.
+#
+# Dict2vec is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# Dict2vec is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License at the root of this repository for
+# more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Dict2vec.  If not, see <http://www.gnu.org/licenses/>.
+
+
+"""Local server answering similarity queries on trained word vectors, so the
+model is loaded once and shared by all its users.
+
+The vectors are read from a .vec file or from a .bin file written with
+-binary 1, normalized once and kept as float32 rows, so the queries are
+answered with matrix products. The nearest neighbours of the
+most queried words are kept in an LRU cache. Start the server with:
+
+    ./serve.py data/vectors.bin --port 8000
+
+and query it from Python with the Client class:
+
+    from serve import Client
+    client = Client("http://127.0.0.1:8000")
+    client.similarity([("car", "automobile")])
+    client.most_similar(["car", "king"], k=10)
+    client.analogy([("man", "king", "woman")])  # man is to king as woman...
+    client.metrics()                            # latency of the requests
+"""
+
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from collections import OrderedDict, deque
+from threading import Lock
+from urllib.parse import urlsplit
+from evaluate import load_embedding
+import http.client
+import argparse
+import json
+import mmap
+import time
+import numpy as np
+
+
+def load_binary(filename):
+    """Read a file written by dict2vec with -binary 1 (word2vec binary
+    format). The file is memory-mapped to find the words without reading it
+    line by line, and each vector is copied from it into the returned matrix
+    (the Model normalizes the vectors into its own matrix anyway). Return the
+    list of words and the matrix of vectors (float32)."""
+    with open(filename, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        pos = mm.find(b"\n")
+        nb_words, dim = map(int, mm[:pos].split())
+        mat = np.empty((nb_words, dim), dtype=np.float32)
+        words = []
+        pos += 1
+        for i in range(nb_words):
+            # each line is: word, a space, <dim> float32 and a newline
+            end = mm.find(b" ", pos)
+            words.append(mm[pos:end].decode("utf-8", "surrogateescape"))
+            mat[i] = np.frombuffer(mm, np.float32, dim, end + 1)
+            pos = end + 1 + 4 * dim + 1
+    finally:
+        mm.close()
+    return words, mat
+
+
+def load_vectors(filename):
+    """Return the list of words and the matrix of vectors of a .bin file or
+    of a text file (see evaluate.load_embedding())"""
+    if filename.endswith(".bin"):
+        return load_binary(filename)
+    mat, wordToNum = load_embedding(filename)
+    words = sorted(wordToNum, key=wordToNum.get)
+    return words, mat[:len(words)].astype(np.float32)
+
+
+class LRUCache:
+    """Dictionary keeping at most <size> items: the least recently used one
+    is removed first. Thread-safe."""
+    def __init__(self, size=10000):
+        self.size   = size
+        self.items  = OrderedDict()
+        self.hits   = 0
+        self.misses = 0
+        self.lock   = Lock()
+
+    def get(self, key):
+        with self.lock:
+            value = self.items.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.items.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        if self.size <= 0:
+            return
+        with self.lock:
+            self.items[key] = value
+            self.items.move_to_end(key)
+            if len(self.items) > self.size:
+                self.items.popitem(last=False)
+
+
+class Model:
+    """Normalized word vectors answering similarity queries. All the queries
+    take a list, and the ones of a list are computed together."""
+    def __init__(self, words, mat, cache_size=10000, chunk=1 << 25):
+        self.words = list(words)
+        self.wordToNum = {w: i for i, w in enumerate(self.words)}
+        norms = np.linalg.norm(mat, axis=1)
+        norms[norms == 0] = 1.0
+        self.vectors = np.ascontiguousarray(mat / norms[:, np.newaxis],
+                                            dtype=np.float32)
+        self.cache = LRUCache(cache_size)
+        # the scores of at most <chunk> (query, word) are computed at once
+        self.chunk = chunk
+
+    def similarity(self, pairs):
+        """Cosine similarity of each pair of words (None if a word has no
+        vector)"""
+        known = [i for i, (w1, w2) in enumerate(pairs)
+                 if w1 in self.wordToNum and w2 in self.wordToNum]
+        rows1 = [self.wordToNum[pairs[i][0]] for i in known]
+        rows2 = [self.wordToNum[pairs[i][1]] for i in known]
+        sims = np.einsum("ij,ij->i", self.vectors[rows1], self.vectors[rows2])
+
+        res = [None] * len(pairs)
+        for i, sim in zip(known, sims):
+            res[i] = float(sim)
+        return res
+
+    def most_similar(self, words, k=10):
+        """The k closest words of each word, with their similarity (None if
+        a word has no vector)"""
+        return self.cached([("most_similar", w, k) for w in words],
+                           [(w,) for w in words], k)
+
+    def analogy(self, queries, k=1):
+        """For each (a, b, c), the k words d such as a is to b as c is to d:
+        the closest words of b - a + c (3CosAdd). None if a word has no
+        vector."""
+        return self.cached([("analogy",) + tuple(q) + (k,) for q in queries],
+                           [tuple(q) for q in queries], k)
+
+    def cached(self, keys, queries, k):
+        """Answer the queries (tuples of words: (w,) for most_similar, (a, b,
+        c) for analogy) which are not in the cache with one search"""
+        res = [None] * len(queries)
+        todo = []
+        for i, (key, query) in enumerate(zip(keys, queries)):
+            if all(w in self.wordToNum for w in query):
+                res[i] = self.cache.get(key)
+                if res[i] is None:
+                    todo.append(i)
+        if not todo:
+            return res
+
+        rows = [[self.wordToNum[w] for w in queries[i]] for i in todo]
+        if len(rows[0]) == 1:
+            targets = self.vectors[[r[0] for r in rows]]
+        else:
+            a, b, c = (self.vectors[list(r)] for r in zip(*rows))
+            targets = b - a + c
+            targets /= np.maximum(np.linalg.norm(targets, axis=1), 1e-12)[:,
+                                                                   np.newaxis]
+
+        for i, neighbours in zip(todo, self.nearest(targets, k, rows)):
+            self.cache.put(keys[i], neighbours)
+            res[i] = neighbours
+        return res
+
+    def nearest(self, targets, k, exclude):
+        """Return the k words closest to each row of targets (normalized),
+        without the words of exclude[row] (indexes)"""
+        k = max(0, min(k, len(self.words) - max(map(len, exclude))))
+        res = []
+        step = max(1, self.chunk // len(self.words))
+        for start in range(0, len(targets), step):
+            scores = targets[start:start+step].dot(self.vectors.T)
+            for j, rows in enumerate(exclude[start:start+step]):
+                scores[j, rows] = -np.inf
+
+            # the k best scores of each row, then sorted
+            best = np.argpartition(scores, -k, axis=1)[:, -k:] if k > 0 else \
+                   np.empty((len(scores), 0), dtype=int)
+            best_scores = np.take_along_axis(scores, best, axis=1)
+            order = np.argsort(-best_scores, axis=1, kind="stable")
+            best = np.take_along_axis(best, order, axis=1)
+            best_scores = np.take_along_axis(best_scores, order, axis=1)
+            for idx, sc in zip(best, best_scores):
+                res.append([(self.words[i], float(s)) for i, s in
+                            zip(idx, sc)])
+        return res
+
+
+class Metrics:
+    """Number of requests and latency percentiles of each endpoint, over the
+    last <window> requests. Thread-safe."""
+    def __init__(self, window=10000):
+        self.window    = window
+        self.latencies = {}
+        self.counts    = {}
+        self.lock      = Lock()
+
+    def add(self, endpoint, latency):
+        with self.lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = deque(maxlen=self.window)
+                self.counts[endpoint] = 0
+            self.latencies[endpoint].append(latency)
+            self.counts[endpoint] += 1
+
+    def report(self):
+        with self.lock:
+            latencies = {e: np.array(l) * 1000 for e, l in
+                         self.latencies.items()}
+            counts = dict(self.counts)
+        return {e: {"requests": counts[e],
+                    "mean_ms": float(l.mean()),
+                    "p50_ms": float(np.percentile(l, 50)),
+                    "p90_ms": float(np.percentile(l, 90)),
+                    "p99_ms": float(np.percentile(l, 99)),
+                    "max_ms": float(l.max())}
+                for e, l in latencies.items()}
+
+
+class QueryServer(ThreadingHTTPServer):
+    """HTTP server answering the queries of Client with a Model. Only
+    listens on localhost by default."""
+    daemon_threads = True
+
+    def __init__(self, model, address=("127.0.0.1", 8000)):
+        ThreadingHTTPServer.__init__(self, address, Handler)
+        self.model   = model
+        self.metrics = Metrics()
+
+    @property
+    def url(self):
+        return "http://{}:{}".format(*self.server_address)
+
+    def answer(self, endpoint, query):
+        """Result of a request (query is the decoded JSON body)"""
+        model = self.model
+        if endpoint == "/similarity":
+            return model.similarity(query["pairs"])
+        if endpoint == "/most_similar":
+            return model.most_similar(query["words"], query.get("k", 10))
+        if endpoint == "/analogy":
+            return model.analogy(query["queries"], query.get("k", 1))
+        raise KeyError(endpoint)
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # keep-alive connections
+    # the headers and the body are sent by 2 writes, do not wait for the
+    # ACK of the first one
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_json(404, {"error": "unknown endpoint"})
+            return
+        cache = self.server.model.cache
+        self.send_json(200, {"requests": self.server.metrics.report(),
+                             "cache": {"size": len(cache.items),
+                                       "hits": cache.hits,
+                                       "misses": cache.misses}})
+
+    def do_POST(self):
+        start = time.perf_counter()
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            result = self.server.answer(self.path, json.loads(body))
+        except KeyError:
+            self.send_json(404, {"error": "unknown endpoint or missing "
+                                          "field"})
+            return
+        except (ValueError, TypeError) as e:
+            self.send_json(400, {"error": str(e)})
+            return
+
+        latency = time.perf_counter() - start
+        self.server.metrics.add(self.path, latency)
+        self.send_json(200, {"result": result, "latency_ms": latency * 1000})
+
+    def send_json(self, code, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Client:
+    """Client of a QueryServer, over a keep-alive connection (use one client
+    per thread). The last server latency (in ms) is in last_latency."""
+    def __init__(self, url="http://127.0.0.1:8000", timeout=60):
+        parts = urlsplit(url if "//" in url else "http://" + url)
+        self.conn = http.client.HTTPConnection(parts.hostname,
+                                               parts.port or 80,
+                                               timeout=timeout)
+        self.last_latency = None
+
+    def request(self, method, path, query=None):
+        body = json.dumps(query).encode("utf-8") if query is not None else None
+        headers = {"Content-Type": "application/json"} if body else {}
+        try:
+            self.conn.request(method, path, body, headers)
+            res = self.conn.getresponse()
+        except (http.client.HTTPException, ConnectionError):
+            # the server closed the keep-alive connection, retry once
+            self.conn.close()
+            self.conn.request(method, path, body, headers)
+            res = self.conn.getresponse()
+
+        answer = json.loads(res.read())
+        if res.status != 200:
+            raise RuntimeError("{} {}: {}".format(res.status, path,
+                                                  answer.get("error")))
+        return answer
+
+    def query(self, endpoint, query):
+        answer = self.request("POST", endpoint, query)
+        self.last_latency = answer["latency_ms"]
+        return answer["result"]
+
+    def similarity(self, pairs):
+        """Cosine similarity of each (w1, w2), None if a word is unknown"""
+        return self.query("/similarity", {"pairs": [list(p) for p in pairs]})
+
+    def most_similar(self, words, k=10):
+        """List of the k (word, similarity) closest to each word"""
+        return [None if r is None else [tuple(x) for x in r] for r in
+                self.query("/most_similar", {"words": list(words), "k": k})]
+
+    def analogy(self, queries, k=1):
+        """List of the k (word, similarity) answering each (a, b, c): a is
+        to b as c is to ?"""
+        return [None if r is None else [tuple(x) for x in r] for r in
+                self.query("/analogy", {"queries": [list(q) for q in queries],
+                                        "k": k})]
+
+    def metrics(self):
+        """Latency percentiles of each endpoint and statistics of the
+        cache"""
+        return self.request("GET", "/metrics")
+
+    def close(self):
+        self.conn.close()
+
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser(
+             description="Serve similarity queries on word vectors.",
+             )
+
+    parser.add_argument('filename', metavar='FILE',
+                        help="""Word vectors (.vec text file, or .bin file
+                        written with -binary 1).""")
+    parser.add_argument('-p', '--port', type=int, default=8000,
+                        help="Port to listen on (default: 8000).")
+    parser.add_argument('--host', default="127.0.0.1",
+                        help="""Address to listen on (default: 127.0.0.1,
+                        only reachable from this machine).""")
+    parser.add_argument('-c', '--cache-size', type=int, default=10000,
+                        help="""Number of query results kept in the LRU cache
+                        (default: 10000, 0 to disable).""")
+
+    args = parser.parse_args()
+
+    start = time.time()
+    words, mat = load_vectors(args.filename)
+    model = Model(words, mat, args.cache_size)
+    print("Loaded {} vectors of dimension {} in {:.2f}s".format(
+          len(words), mat.shape[1], time.time() - start))
+
+    server = QueryServer(model, (args.host, args.port))
+    print("Serving on", server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass